@@ -13,6 +13,16 @@ If you require this option, you have to disable all calls to `self.Ioff`, except
 
 Non-blocking axis movement is provided by a specialized class derived from threading.Thread.
 
+By default (`"mode": "timed"`), each move is precomputed as a sequence of coil patterns with linear acceleration and deceleration ramps
+and clocked out by the DAQ board in a single buffered, hardware-timed task. The sample clock runs at `oversample / delay`, where `delay`
+is the step period at full speed; the ramp starts at a step period of `startDelay` and accelerates with `accel` (steps / s^2).
+The position is tracked from the number of samples generated by the task, so a move can be stopped at any time.
+Trajectories loaded with trigger mode 'timer' (see `Axis.load_trajectory`) are clocked out in a single task as well, with all coils switched off
+while dwelling at each point. While dwelling, `is_moving` returns False, so scans can wait for each point as usual.
+The sample clock source is set by `clock`; an empty string uses the onboard clock, which is not available for digital lines on all boards
+(e.g. M-series boards require another clock such as '/Dev2/ao/SampleClock'). If the task cannot be configured, the motor falls back
+to `"mode": "software"`, where each step is written individually and timed by `time.sleep`.
+
 It supports the following general stepping sequences:
 
 normal:
@@ -137,6 +147,58 @@ class StepSeq():
     def getCurrentStep(self):
         return self.cstep
 
+    def setCurrentStep(self, step):
+        self.cstep = step
+
+    # return the step patterns for the next N steps in the given direction as Nx4 array without changing the position
+    # by default, the sequence starts at the current position; use fr to start at another step
+    def getSequence(self, N, dir=1, fr=None):
+        steps = (self.cstep if fr is None else fr) + (1 if dir > 0 else -1) * np.arange(1, N + 1)
+        return np.array(self.steppattern, dtype=int).reshape(-1, 4)[steps % self.Nsteps]
+
+
+# step durations (s) for a move of N steps with a linear ramp from 1 / startDelay to 1 / delay steps / s and back
+def getStepTimes(N, delay, startDelay, accel):
+    v0 = 1.0 / max(startDelay, delay)
+    vmax = 1.0 / delay
+    # velocity after each step when accelerating from both ends; the slower of both gives the trapezoidal / triangular profile
+    s = np.arange(N, dtype=float)
+    v = np.minimum(np.sqrt(v0**2 + 2.0 * accel * np.minimum(s, N - 1 - s)), vmax)
+    return 1.0 / v
+
+
+# convert a sequence of coil patterns into the samples of a hardware-timed digital output task
+# each step is held for a whole number of sample clock periods; the last sample switches off all coils
+def getStepSamples(patterns, times, rate, offset):
+    weights = 1 << (offset + 3 - np.arange(4))
+    values = np.dot(patterns, weights).astype(np.uint8)
+    counts = np.maximum(1, np.round(np.array(times) * rate)).astype(int)
+    return np.append(np.repeat(values, counts), np.uint8(0)), np.cumsum(counts) - counts
+
+
+# samples of a hardware-timed task visiting all targets (in steps) in turn and holding each for dwell s with all coils switched off
+# returns the samples, the first sample and the position after each step, and the last sample at (or moving to) each target
+def getTrajectorySamples(stepper, start, targets, dwell, motor, rate):
+    chunks, starts, positions, leaves = [], [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)], []
+    n = 0
+    pos = start
+    hold = int(round(dwell * rate))
+    for t in targets:
+        N = abs(t - pos)
+        if N > 0:
+            dir = 1 if t > pos else -1
+            samples, s = getStepSamples(stepper.getSequence(N, dir, pos), getStepTimes(N, motor["delay"], motor["startDelay"], motor["accel"]), rate, motor["offset"])
+            chunks.append(samples[:-1])
+            starts.append(s + n)
+            positions.append(pos + dir * np.arange(1, N + 1))
+            n += len(samples) - 1
+            pos = t
+        chunks.append(np.zeros(hold, dtype=np.uint8))
+        n += hold
+        leaves.append(n)
+    chunks.append(np.zeros(1, dtype=np.uint8))
+    return np.concatenate(chunks), np.concatenate(starts), np.concatenate(positions), np.array(leaves)
+
 
 # main motor driver class
 class NIStepper(module.Axis):
@@ -152,6 +214,11 @@ class NIStepper(module.Axis):
                         "moving": False,
                         "address": "Dev2/port0/line0:3",
                         "delay": 0.002,
+                        "startDelay": 0.01,
+                        "accel": 2e4,
+                        "mode": "timed",
+                        "clock": "",
+                        "oversample": 10,
                         "target": 0,
                         "thrd": None,
                         "offset": 0,
@@ -161,6 +228,11 @@ class NIStepper(module.Axis):
                         "moving": False,
                         "address": "Dev2/port0/line4:7",
                         "delay": 0.002,
+                        "startDelay": 0.01,
+                        "accel": 2e4,
+                        "mode": "timed",
+                        "clock": "",
+                        "oversample": 10,
                         "target": 0,
                         "thrd": None,
                         "offset": 4,
@@ -170,6 +242,11 @@ class NIStepper(module.Axis):
                         "moving": False,
                         "address": "Dev2/port1/line0:3",
                         "delay": 0.002,
+                        "startDelay": 0.01,
+                        "accel": 2e4,
+                        "mode": "timed",
+                        "clock": "",
+                        "oversample": 10,
                         "target": 0,
                         "thrd": None,
                         "offset": 0,
@@ -181,10 +258,13 @@ class NIStepper(module.Axis):
         prop.append({'label': 'Current Pos', 'type': 'label', 'value': '0'})
         prop.append({'label': 'Target Pos', 'type': 'input', 'value': '0', 'info': 'int', 'event': None})
         prop.append({'label': 'Movement', 'type': 'button', 'value': 'Start', 'event': 'onStartStop'})
+        prop.append({'label': 't0 Offset', 'type': 'label', 'value': '0'})
+        prop.append({'label': 'Time Zero', 'type': 'button', 'value': 'Set t0', 'event': 'onSetOffset'})
 
         # convert dictionary to properties object
         self.parsePropertiesDict(prop)
         self.ready = False
+        self.trajectoryTriggers = ["software", "timer"]
 
     def initialize(self, others=[]):
         for i, _ in enumerate(self.motors):
@@ -194,6 +274,7 @@ class NIStepper(module.Axis):
             self.motors[i]["daq"].CreateDOChan(self.motors[i]["address"], "", daq.DAQmx_Val_ChanForAllLines)
             # set all to False
             self.Ioff(self.motors[i])
+        self.ready = True
 
     # this function is called when the application is shut down; do all the clean up here (close drivers, etc)
     def shutdown(self):
@@ -210,13 +291,19 @@ class NIStepper(module.Axis):
 
     def onChangeAxis(self, event):
         mtr = self.getCurrentMotor()
-        self.getPropertyByLabel("current pos").setValue(str(mtr["stepper"].getCurrentStep() / self.units2steps))
-        self.getPropertyByLabel("target pos").setValue(str(mtr["target"] / self.units2steps))
+        self.getPropertyByLabel("current pos").setValue(str(mtr["stepper"].getCurrentStep() / self.units2steps - self.getOffset()))
+        self.getPropertyByLabel("target pos").setValue(str(mtr["target"] / self.units2steps - self.getOffset()))
+        self.updateOffset()
         if mtr["moving"]:
             self.getPropertyByLabel("movement").setValue("Stop")
         else:
             self.getPropertyByLabel("movement").setValue("Start")
 
+    # the current position becomes the zero position
+    def onSetOffset(self, event):
+        module.Axis.onSetOffset(self, event)
+        self.updatePosition()
+
     def onStartStop(self, event):
         if self.getPropertyByLabel("movement").getValue() == "Start" or not self.getCurrentMotor()["moving"]:
             pos = float(self.getPropertyByLabel("target").getValue())
@@ -224,21 +311,25 @@ class NIStepper(module.Axis):
         else:
             self.stop()
 
-    # pos is in units
+    # pos is the absolute position in units
     def updatePosition(self, event=None, pos=None):
         if pos is not None:
-            self.getPropertyByLabel("current pos").setValue("%.f" % pos)
+            self.getPropertyByLabel("current pos").setValue("%.f" % (pos - self.getOffset()))
         else:
             self.getPropertyByLabel("current pos").setValue("%.f" % self.pos())
 
     # return current position in units
-    def pos(self):
+    def devicePos(self):
         return self.getCurrentMotor()["stepper"].getCurrentStep() / self.units2steps
 
     # goto new position - pos is in units
-    def goto(self, pos):
+    def deviceGoto(self, pos):
         mtr = self.getCurrentMotor()
         mtr["target"] = pos * self.units2steps
+        self.startMotor(mtr)
+
+    def startMotor(self, mtr):
+        mtr["moving"] = True    # set here already, the thread may take a moment to start
 
         thrd = NIstepperThread(self, mtr)
         mtr["thrd"] = thrd
@@ -246,6 +337,29 @@ class NIStepper(module.Axis):
 
         self.getPropertyByLabel("movement").setValue("Stop")
 
+    # with trigger mode 'timer', the first call starts the whole trajectory
+    def next_point(self):
+        if self.trajectoryTrigger != "timer":
+            return module.Axis.next_point(self)
+        if self.trajectory is None or len(self.trajectory) == 0 or self.trajectoryIndex >= 0:
+            return self.trajectory_index()
+
+        mtr = self.getCurrentMotor()
+        mtr["trajectory"] = [int(round((p + self.getOffset()) * self.units2steps)) for p in self.trajectory]
+        mtr["dwell"] = self.trajectoryDwell
+        mtr["trajectoryIndex"] = 0
+        mtr["target"] = mtr["trajectory"][-1]
+        self.trajectoryIndex = 0
+
+        self.recordPosition(self.trajectory[-1] + self.getOffset(), False)
+        self.startMotor(mtr)
+        return 0
+
+    def trajectory_index(self):
+        if self.trajectoryTrigger == "timer" and self.trajectoryIndex >= 0:
+            return self.getCurrentMotor().get("trajectoryIndex", self.trajectoryIndex)
+        return self.trajectoryIndex
+
     def stop(self):
         mtr = self.getCurrentMotor()
         if mtr["thrd"].is_alive():
@@ -260,9 +374,25 @@ class NIStepper(module.Axis):
             self.updatePosition()
         self.Ioff(mtr)
 
-    # should return True if stage is still moving
-    def is_moving(self):
-        return self.getCurrentMotor()["moving"]
+    # should return True if stage is still moving; the motor counts as stopped while dwelling at a point of a 'timer' trajectory
+    def deviceIsMoving(self):
+        mtr = self.getCurrentMotor()
+        return mtr["moving"] and not mtr.get("dwelling", False)
+
+    # each motor has its own entry in the position journal
+    def getJournalKey(self):
+        return "%s: %s" % (self.name, self.getCurrentMotor()["name"])
+
+    def getJournalKeys(self):
+        return ["%s: %s" % (self.name, m["name"]) for m in self.motors]
+
+    # the step counters start at zero, so set them to the last known positions
+    def restorePosition(self, pos, key):
+        for m in self.motors:
+            if key == "%s: %s" % (self.name, m["name"]):
+                m["stepper"].setCurrentStep(int(round(pos * self.units2steps)))
+                m["target"] = m["stepper"].getCurrentStep()
+        self.updatePosition()
 
 
 # ######################################
@@ -286,7 +416,110 @@ class NIstepperThread(threading.Thread):
     def run(self):
         # send started-Event
         self.motor["moving"] = True
+        self.motor["dwelling"] = False
         self.motor["target"] = int(self.motor["target"])
+
+        # a single move or a trajectory with trigger mode 'timer'
+        targets = self.motor.get("trajectory") or [self.motor["target"]]
+        dwell = self.motor.get("dwell", 0.0) if self.motor.get("trajectory") else 0.0
+        self.motor["trajectory"] = None
+
+        if self.motor.get("mode", "software") == "timed":
+            try:
+                self.runTimed(targets, dwell)
+            except daq.DAQError as e:
+                print "WARNING: hardware-timed stepping failed for %s, using software timing:" % self.motor["name"], e
+                self.motor["mode"] = "software"
+        if self.motor.get("mode", "software") != "timed":
+            for i, t in enumerate(targets):
+                if self.canQuit.isSet() != 0:
+                    break
+                self.setDwelling(False, t)
+                self.motor["target"] = t
+                self.motor["trajectoryIndex"] = i
+                self.runSoftware()
+                if dwell > 0:
+                    self.setDwelling(True, t)
+                    self.canQuit.wait(dwell)
+
+        # switch off holding current
+        sampsPerChanWritten = daq.int32()
+        self.motor["daq"].WriteDigitalU8(1, True, 0, daq.DAQmx_Val_GroupByChannel, np.array(0, dtype=daq.uInt8), ctypes.byref(sampsPerChanWritten), None)
+
+        # send terminated-Event
+        self.motor["moving"] = False
+        self.motor["dwelling"] = False
+
+        wx.CallAfter(self.parent.onMotorStopped, self.motor)
+
+    # clock out all moves in a single buffered task; the position follows from the number of generated samples
+    def runTimed(self, targets, dwell=0.0):
+        stepper = self.motor["stepper"]
+        start = stepper.getCurrentStep()
+        if all(t == start for t in targets) and dwell == 0:
+            return
+
+        rate = self.motor["oversample"] / float(self.motor["delay"])
+        samples, starts, positions, leaves = getTrajectorySamples(stepper, start, targets, dwell, self.motor, rate)
+        hold = int(round(dwell * rate))
+
+        # release the lines from the on-demand task
+        self.motor["daq"].TaskControl(daq.DAQmx_Val_Task_Unreserve)
+
+        task = daq.Task()
+        started = False
+        generated = daq.uInt64()
+        try:
+            task.CreateDOChan(self.motor["address"], "", daq.DAQmx_Val_ChanForAllLines)
+            task.CfgSampClkTiming(self.motor["clock"], rate, daq.DAQmx_Val_Rising, daq.DAQmx_Val_FiniteSamps, len(samples))
+            sampsPerChanWritten = daq.int32()
+            task.WriteDigitalU8(len(samples), False, 10.0, daq.DAQmx_Val_GroupByChannel, samples, ctypes.byref(sampsPerChanWritten), None)
+            task.StartTask()
+            started = True
+
+            done = daq.bool32()
+            nexc = time.clock()
+            while self.canQuit.isSet() == 0:
+                task.IsTaskDone(ctypes.byref(done))
+                if done.value:
+                    break
+
+                # track the position, so that is_moving notices when the motor reaches a point
+                task.GetWriteTotalSampPerChanGenerated(ctypes.byref(generated))
+                self.setProgress(generated.value, start, starts, positions, leaves, hold)
+
+                # send position to main GUI
+                if nexc < time.clock():
+                    wx.CallAfter(self.parent.updatePosition, stepper.getCurrentStep() / self.parent.units2steps)
+                    nexc = time.clock() + self.updDelay
+
+                self.canQuit.wait(0.01)
+        finally:
+            if started:
+                task.GetWriteTotalSampPerChanGenerated(ctypes.byref(generated))
+                self.setProgress(generated.value, start, starts, positions, leaves, hold)
+                task.StopTask()
+            task.ClearTask()
+
+    # update position, trajectory index and dwelling state from the number of generated samples; hold is the number of samples per dwell
+    def setProgress(self, generated, start, starts, positions, leaves, hold=0):
+        k = int(np.searchsorted(starts, generated))
+        self.motor["stepper"].setCurrentStep(int(positions[k - 1]) if k > 0 else start)
+        i = min(int(np.searchsorted(leaves, generated)), len(leaves) - 1)
+        self.motor["trajectoryIndex"] = i
+
+        # the point moving to is the position after the last step before leaving it
+        k = int(np.searchsorted(starts, leaves[i]))
+        self.setDwelling(hold > 0 and generated >= leaves[i] - hold, int(positions[k - 1]) if k > 0 else start)
+
+    # when the motor leaves a point of the trajectory, its position is no longer confirmed; target is the next point in steps
+    def setDwelling(self, dwelling, target):
+        if self.motor.get("dwelling", False) and not dwelling:
+            self.parent.recordPosition(target / self.parent.units2steps, False, "%s: %s" % (self.parent.name, self.motor["name"]))
+        self.motor["dwelling"] = dwelling
+
+    # step by step, timed by the OS
+    def runSoftware(self):
         sampsPerChanWritten = daq.int32()
 
         cpos = self.motor["stepper"].getCurrentStep()
@@ -311,11 +544,3 @@ class NIstepperThread(threading.Thread):
 
             # give motor a break
             time.sleep(self.motor["delay"])
-
-        # switch off holding current
-        self.motor["daq"].WriteDigitalU8(1, True, 0, daq.DAQmx_Val_GroupByChannel, np.array(0, dtype=daq.uInt8), ctypes.byref(sampsPerChanWritten), None)
-
-        # send terminated-Event
-        self.motor["moving"] = False
-
-        wx.CallAfter(self.parent.onMotorStopped, self.motor)
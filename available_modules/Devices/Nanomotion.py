@@ -57,7 +57,7 @@ def locateNanomotion(skp=0):
 
 # Notes on Operation:
 # when device is connected, all motors are initialized and unparked
-# the current position is set to self.home (default: -3000.0 fs)
+# the current position is set to the last known position from the position journal or to self.home (default: -3000.0 fs)
 # the axis then moves to 0.0
 # when decive is disconnected, all motors go to self.home and park
 #
@@ -70,15 +70,18 @@ class Nanomotion(module.Axis):
         self.fs2mm = 2.9979e8 * 1e3 * 1e-15 / 2   #: mm stage travel / fs delay
         self.home = -3000.0                       #: homing position = most negative position allowed
         self.motors = []
+        self.restored = {}                        #: last known positions from the position journal by motor
 
         # build properties dictionary
         prop = []
         prop.append({'label': 'Address', 'type': 'label', 'value': '', 'event': None})
-        prop.append({'label': 'Axis', 'type': 'choice', 'choices': self.motors, 'value': 0, 'event': None})
+        prop.append({'label': 'Axis', 'type': 'choice', 'choices': self.motors, 'value': 0, 'event': 'updateOffset'})
         prop.append({'label': 'Home (fs)', 'type': 'label', 'value': str(self.home), 'event': None})
         prop.append({'label': 'Current Position (fs)', 'type': 'label', 'value': '0.0'})
         prop.append({'label': 'Target (fs)', 'type': 'input', 'value': '0', 'info': 'int', 'event': None})
         prop.append({'label': 'Movement', 'type': 'button', 'value': 'Start', 'event': 'onStartStop'})
+        prop.append({'label': 't0 Offset (fs)', 'type': 'label', 'value': '0'})
+        prop.append({'label': 'Time Zero', 'type': 'button', 'value': 'Set t0', 'event': 'onSetOffset'})
 
         # convert dictionary to properties object
         self.parsePropertiesDict(prop)
@@ -133,22 +136,24 @@ class Nanomotion(module.Axis):
                 self.motors.append(str(i))
 
         self.getPropertyByLabel("axis").setChoices(self.motors)
+        self.restoreFromJournal()
 
         # unpark all motors
         self.instr.write("UA")
 
         # set units to MM
-        # set current position to self.home and move to 0
+        # set current position to the last known position or self.home and move to 0
+        # the travel limits are relative to self.home, where the stage was parked
+        self.ready = True
         for m in self.motors:
             self.instr.write("WU,%s,MM" % m)
-            self.instr.write("WP,%s,%f" % (m, self.home * self.fs2mm))
+            self.instr.write("WP,%s,%f" % (m, self.restored.get(m, self.home) * self.fs2mm))
             self.instr.write("WAL,%s,%f" % (m, self.home * self.fs2mm))
             WAR = float(self.instr.query("RAR,%s" % m).split(",")[1])
             self.instr.write("WAR,%s,%f" % (m, WAR + self.home * self.fs2mm))
+            self.recordPosition(0.0, False, self.getJournalKey(m))
             self.instr.write("MA,%s,0.0" % m)
 
-        self.ready = True
-
         # read position and set value
         self.updatePosition()
 
@@ -156,6 +161,7 @@ class Nanomotion(module.Axis):
         if self.ready:
             # move to home position
             for m in self.motors:
+                self.recordPosition(self.home, False, self.getJournalKey(m))
                 self.instr.write("MA,%s,%f" % (m, self.home * self.fs2mm))
 
             # wait for all motors to stop
@@ -170,6 +176,8 @@ class Nanomotion(module.Axis):
                     break
 
             # park all motors
+            for m in self.motors:
+                self.recordPosition(self.home, True, self.getJournalKey(m))
             self.instr.write("PA")
         self.ready = False
 
@@ -177,6 +185,26 @@ class Nanomotion(module.Axis):
         id = self.getPropertyByLabel("axis").getValue()
         return int(self.motors[id])
 
+    # each motor has its own entry in the position journal
+    def getJournalKey(self, motor=None):
+        return "%s: %s" % (self.name, motor if motor is not None else self.getCurrentMotor())
+
+    def getJournalKeys(self):
+        return [self.getJournalKey(m) for m in self.motors]
+
+    # positions are written to the controller when connecting
+    def restorePosition(self, pos, key):
+        for m in self.motors:
+            if key == self.getJournalKey(m):
+                self.restored[m] = pos
+
+    # the current position becomes time zero
+    def onSetOffset(self, event):
+        if not self.ready:
+            return
+        module.Axis.onSetOffset(self, event)
+        self.updatePosition()
+
     def onStartStop(self, event):
         if self.getPropertyByLabel("movement").getValue() == "Start":
             pos = float(self.getPropertyByLabel("target").getValue())
@@ -194,14 +222,14 @@ class Nanomotion(module.Axis):
             self.updTimer.start()
 
     # return current position
-    def pos(self):
+    def devicePos(self):
         try:
             return float(self.instr.query("RP,%d" % self.getCurrentMotor()).split(",")[1]) / self.fs2mm
         except:
             return 0.0
 
     # goto new position
-    def goto(self, pos):
+    def deviceGoto(self, pos):
         if not self.ready:
             return
         print "goto", pos
@@ -212,7 +240,7 @@ class Nanomotion(module.Axis):
         self.updTimer.start()
 
     # should return True if stage is still moving
-    def is_moving(self):
+    def deviceIsMoving(self):
         if not self.ready:
             return False
         return (self.instr.query("RS,%d" % self.getCurrentMotor()).split(",")[1] == "MV")
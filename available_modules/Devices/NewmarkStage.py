@@ -5,6 +5,9 @@
 
 NewmarkStage.py is a module for controlling a 3 axis motion controller.
 
+The controller is reset when connecting. Its position counters are then set to the last known positions from the position journal
+(see `core.FSRSJournal`), so that t0 is kept when pyFSRS is restarted, even after a crash.
+
 ..
    This file is part of the pyFSRS app.
 
@@ -29,6 +32,7 @@ import wx
 import time
 from time import gmtime, strftime
 import threading
+import Queue
 import serial
 import unicodedata
 import os
@@ -76,8 +80,143 @@ def plugAndPlayComPorts(writeString,readString,skp=0,timeoutx=0.1,baudratex=9600
       print "The port you were looking for was not found. You could consider changing the number of bites read, the default baud rate or the serial time out."
   return ""
 
+
+
+# serial I/O worker
+class NewmarkIOThread(threading.Thread):
+    """Background thread that owns the serial port of the Newmark controller.
+
+    Commands are queued and written in batches. Position and velocity of the selected motor are read with a single pipelined query
+    and kept in a cache, so that `pos` and `is_moving` of the stage return without waiting for the serial port.
+
+    :param NewmarkStage stage: Parent stage; used to get the selected motor and to update the position label.
+    :param serial.Serial ser: Open serial port.
+    """
+    def __init__(self, stage, ser):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.stage = stage
+        self.ser = ser
+        self.queue = Queue.Queue()
+        self.canQuit = threading.Event()
+        self.polled = threading.Condition()
+
+        self.fastPoll = 0.05    #: polling interval while moving (s)
+        self.slowPoll = 0.5     #: polling interval while idle (s)
+        self.timeout = 0.5      #: max time to wait for a response (s)
+        self.settle = 0.2       #: min time after a move command before the stage can be considered stopped (s)
+        self.tolerance = 1.0    #: the stage is considered at its target within this distance (fs)
+
+        # cached state of the selected motor
+        self.motor = None
+        self.position = 0.0
+        self.velocity = 0.0
+        self.moving = False
+        self.stamp = 0.0        # time at which the last successful poll was sent
+        self.target = None
+        self.commanded = 0.0    # time of the last move command
+        self.pollRequested = False
+
+    def send(self, cmd, target=None):
+        """Queue a command string. If `target` is given, the command moves the selected motor to this position (fs) and the stage
+        is reported as moving until it has arrived.
+        """
+        if target is not None:
+            with self.polled:
+                self.target = target
+                self.commanded = time.time()
+                self.moving = True
+        self.queue.put(cmd)
+
+    def getState(self, maxAge=0.1):
+        """Returns the cached state (position, velocity, moving) of the selected motor. If the cache is older than `maxAge` seconds
+        or belongs to another motor, the controller is polled first.
+        """
+        with self.polled:
+            if time.time() - self.stamp > maxAge or self.motor != self.stage.getCurrentMotor():
+                requested = time.time()
+                deadline = requested + 2 * self.timeout
+                self.pollRequested = True
+                self.queue.put("")      # wake up the worker
+                while self.stamp < requested and time.time() < deadline and self.isAlive():
+                    self.polled.wait(deadline - time.time())
+            return self.position, self.velocity, self.moving
+
+    def stop(self):
+        """Stop the worker after all queued commands have been written.
+        """
+        self.canQuit.set()
+        self.queue.put("")
+        self.join()
+
+    def query(self, cmd, N):
+        """Write a query and return the first N numbers of the response or None if there was no complete response in time.
+        """
+        self.ser.write(cmd)
+        values = []
+        deadline = time.time() + self.timeout
+        while len(values) < N and time.time() < deadline:
+            for t in self.ser.read(self.stage.readbytes).lower().split():
+                try:
+                    values.append(float(t))
+                except ValueError:
+                    pass
+        return values[:N] if len(values) >= N else None
+
+    def poll(self):
+        """Read position and velocity of the selected motor and update the cache.
+        """
+        motor = self.stage.getCurrentMotor()
+        started = time.time()
+        values = self.query("%s;RU;RV;" % motor, 2)
+        if values is None:
+            return False
+        pos, vel = values[0] / self.stage.fs2mm, values[1] / self.stage.fs2mm
+
+        with self.polled:
+            changed = (motor != self.motor or pos != self.position)
+            self.motor = motor
+            self.position = pos
+            self.velocity = vel
+            # right after a move command the controller may still report zero velocity
+            self.moving = (vel != 0.0) or (self.target is not None and started < self.commanded + self.settle and abs(pos - self.target) > self.tolerance)
+            self.stamp = started
+            self.pollRequested = False
+            self.polled.notifyAll()
+
+        if changed:
+            wx.CallAfter(self.stage.getPropertyByLabel("position").setValue, "%.f" % (pos - self.stage.getOffset(self.stage.getJournalKey(motor))))
+        return True
+
+    def run(self):
+        nextPoll = 0.0
+        while True:
+            # write all queued commands at once
+            cmds = []
+            try:
+                cmds.append(self.queue.get(timeout=max(0.0, nextPoll - time.time())))
+                while True:
+                    cmds.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+            if "".join(cmds) != "":
+                self.ser.write("".join(cmds))
+
+            if self.canQuit.isSet():
+                break
+
+            if self.pollRequested or time.time() >= nextPoll:
+                if self.poll():
+                    nextPoll = time.time() + (self.fastPoll if self.moving else self.slowPoll)
+                else:
+                    nextPoll = time.time() + self.fastPoll
+
+
 class NewmarkStage(module.Axis):
     """A prototype for an axis module for pyFSRS.
+
+    All communication with the controller after the initial handshake runs through a `NewmarkIOThread`, so that `pos` and `is_moving`
+    return cached values that are at most `maxAge` seconds old.
     """
     def __init__(self):
         module.Axis.__init__(self)
@@ -92,10 +231,13 @@ class NewmarkStage(module.Axis):
         self.motors = ["AY","AZ"]            #: note AZ is 
         #self.motors = ["AX"]
         self.speeds=["10","5","2","1","2000","5000","10000","20000","50000","100000"]
+        self.maxAge = 0.1                      #: max age of cached position / velocity in s
+        self.io = None
+        self.restored = {}                     #: last known positions from the position journal by motor
         # build properties dictionary
         prop = []
         
-        prop.append({'label': 'Axis', 'type': 'choice', 'choices': self.motors, 'value': 0, 'event': None})
+        prop.append({'label': 'Axis', 'type': 'choice', 'choices': self.motors, 'value': 0, 'event': 'updateOffset'})
         prop.append({"label": 'Speed (mm/s and mm/s^2)', 'type': 'choice', 'value': 0, 'choices': self.speeds, "event": None})
         prop.append({'label': 'Target (fs)', 'type': 'input', 'value': '0', 'info': 'int', 'event': None})
         prop.append({'label': 'Movement', 'type': 'button', 'value': 'Start', 'event': 'onStartStop'})
@@ -103,9 +245,8 @@ class NewmarkStage(module.Axis):
         prop.append({'label': 'Current Position (fs)', 'type': 'label', 'value': '0.0'})
         prop.append({'label': 'Address:', 'type': 'label', 'value': '', 'event': None})
         prop.append({'label': 'Range (fs)', 'type': 'label', 'value': '1670000'})
-        prop.append({"label": "Keep Log", "type": "checkbox", "value": 0, "info": "generate positionLog.txt"})
-        prop.append({"label": "Log Path", "type": "file", "value": os.getcwd(), "info": "path"})
-        prop.append({'label': 'Warning:', 'type': 'label', 'value': 'When pyFSRS freezes the t0 position will be lost. It is recommended that you generate a position log so that t0 may be recovered.'})
+        prop.append({'label': 't0 Offset (fs)', 'type': 'label', 'value': '0'})
+        prop.append({'label': 'Time Zero', 'type': 'button', 'value': 'Set t0', 'event': 'onSetOffset'})
         # convert dictionary to properties object
         self.parsePropertiesDict(prop)
 
@@ -118,12 +259,21 @@ class NewmarkStage(module.Axis):
         #self.getPropertyByLabel("axis").setValue("#" + str(count + 1))
 
     def shutdown(self):
-        try:
-            self.updTimer.cancel()
-        except:
-            pass
         self.disconnect()
 
+    # each motor has its own entry in the position journal
+    def getJournalKey(self, motor=None):
+        return "%s: %s" % (self.name, motor if motor is not None else self.getCurrentMotor())
+
+    def getJournalKeys(self):
+        return [self.getJournalKey(m) for m in self.motors]
+
+    # positions are loaded into the controller when connecting
+    def restorePosition(self, pos, key):
+        for m in self.motors:
+            if key == self.getJournalKey(m):
+                self.restored[m] = pos
+
     # establish / end a pyVISA connection
     def connect(self, event=None):
         adr = self.getPropertyByLabel("address").getValue()
@@ -155,30 +305,25 @@ class NewmarkStage(module.Axis):
         tempstatus=self.ser.read(self.readbytes).lower()
         while not tempstatus=="":
             tempstatus=self.ser.read(self.readbytes).lower()
-        if self.getPropertyByLabel("Keep Log").getValue():
-            log = open("positionLog.txt","a")
-            log.write(strftime("%Y-%m-%d %H:%M:%S", gmtime())+" - log in\n")
-            log.close()
-        # set units to MM
+
+        # the reset sets all position counters to zero, so load the last known positions
+        self.restoreFromJournal()
+
+        # from now on, the I/O thread owns the serial port
+        self.io = NewmarkIOThread(self, self.ser)
+        self.io.start()
+
+        # set units to MM and load the last known position
         # set the acceleration and velocity in mm/s and mm/s^2 and move to 0 fs
+        self.ready = True
         for m in self.motors:
-            if m=="AX" or m=="AY":
-                self.ser.write("%s;UU%f;VL%s;AC%s;MA%f;GO;" % (m, self.steps2mm,self.getCurrentSpeed(),self.getCurrentSpeed(),self.home * self.fs2mm))
-                if self.getPropertyByLabel("Keep Log").getValue():
-                    logname = os.path.join(self.getPropertyByLabel("path").getValue(),"positionLog.txt")
-                    log = open(logname,"a")
-                    log.write(strftime("%Y-%m-%d %H:%M:%S", gmtime())+" - %s: %f \n" % (m,self.home))
-                    log.close()
-
-            elif m=="AZ":
-                self.ser.write("%s;UU%f;VL%s;AC%s;MA%f;GO;" % (m, self.steps2degrees,self.getCurrentSpeed(),self.getCurrentSpeed(),self.home * self.fs2mm))
-                if self.getPropertyByLabel("Keep Log").getValue():
-                    logname = os.path.join(self.getPropertyByLabel("path").getValue(),"positionLog.txt")
-                    log = open(logname,"a")
-                    log.write(strftime("%Y-%m-%d %H:%M:%S", gmtime())+" - %s: %f \n" % (m,self.home))
-                    log.close()
+            units = self.steps2mm if m in ("AX", "AY") else self.steps2degrees
+            self.io.send("%s;UU%f;" % (m, units))
+            if m in self.restored:
+                self.io.send("%s;LP%f;" % (m, self.restored[m] * self.fs2mm))
+            self.recordPosition(self.home, False, self.getJournalKey(m))
+            self.io.send("%s;VL%s;AC%s;MA%f;GO;" % (m, self.getCurrentSpeed(),self.getCurrentSpeed(),self.home * self.fs2mm), self.home if m == self.getCurrentMotor() else None)
 
-        self.ready = True
         # read position and set value
         self.updatePosition()
 
@@ -187,32 +332,17 @@ class NewmarkStage(module.Axis):
         if self.ready:
             # move to home position
             for m in self.motors:
-                if m=="AX" or m=="AY":
-                    self.ser.write("%s;VL%s;AC%s;MA%f;GO;" % (m,self.getCurrentSpeed(),self.getCurrentSpeed(), self.home * self.fs2mm))
-                    if self.getPropertyByLabel("Keep Log").getValue():
-                        logname = os.path.join(self.getPropertyByLabel("path").getValue(),"positionLog.txt")
-                        log = open(logname,"a")
-                        log.write(strftime("%Y-%m-%d %H:%M:%S", gmtime())+" - %s: %f \n" % (m,self.home))
-                        log.close()
-
-                elif m=="AZ":
-                    self.ser.write("%s;VL%s;AC%s;MA%f;GO;" % (m,self.getCurrentSpeed(),self.getCurrentSpeed(), self.home * self.fs2mm))
-                    if self.getPropertyByLabel("Keep Log").getValue():
-                        logname = os.path.join(self.getPropertyByLabel("path").getValue(),"positionLog.txt")
-                        log = open(logname,"a")
-                        log.write(strftime("%Y-%m-%d %H:%M:%S", gmtime())+" - %s: %f \n" % (m,self.home))
-                        log.close()
-
-            # wait for all motors to stop
-            while(1):
+                self.recordPosition(self.home, False, self.getJournalKey(m))
+                self.io.send("%s;VL%s;AC%s;MA%f;GO;" % (m,self.getCurrentSpeed(),self.getCurrentSpeed(), self.home * self.fs2mm), self.home if m == self.getCurrentMotor() else None)
+
+            # wait for the stage to stop
+            while self.is_moving():
                 time.sleep(0.1)
-                moving = False
-                for m in self.motors:
-                    if is_moving():
-                        moving = True
-                        break
-                if not moving:
-                    break
+
+        if self.io is not None:
+            self.io.stop()
+            self.io = None
+            self.ser.close()
         self.ready = False
 
     def getCurrentMotor(self):
@@ -223,97 +353,54 @@ class NewmarkStage(module.Axis):
         id = self.getPropertyByLabel("speed").getValue()
         return self.speeds[id]
 
+    # velocity and acceleration are both set to the selected speed value, see goto
+    def travelTime(self, fr, to):
+        self.velocity = float(self.getCurrentSpeed()) / self.fs2mm
+        self.acceleration = self.velocity
+        return module.Axis.travelTime(self, fr, to)
+
+
+    # the current position becomes time zero
+    def onSetOffset(self, event):
+        if not self.ready:
+            return
+        module.Axis.onSetOffset(self, event)
+        self.updatePosition()
 
     def onStartStop(self, event):
         if self.getPropertyByLabel("movement").getValue() == "Start":
             pos = float(self.getPropertyByLabel("target").getValue())
             self.goto(pos)
         else:
-            self.ser.write("%s;MA0;GO;" % (self.getCurrentMotor(), pos * self.fs2mm))   # stop all motors
+            self.io.send("%s;ST;" % self.getCurrentMotor())   # stop motor
 
     def updatePosition(self, event=None):
-        # read position and set value
-        self.getPropertyByLabel("position").setValue("%.f" % self.pos())
-
-        # restart timer
-        if self.is_moving():
-            #update the postion one more time even if it's not moving
-            self.getPropertyByLabel("position").setValue("%.f" % self.pos())
-            self.updTimer = threading.Timer(0.3, self.updatePosition)
-            self.updTimer.start()
+        # read position and set value; while moving, the I/O thread keeps the label up to date
         self.getPropertyByLabel("position").setValue("%.f" % self.pos())
 
     # return current position as a float
-    def pos(self):
-        pos0 = []
-        self.ser.write("%s;RU;" % (self.getCurrentMotor()))
-        posName= self.ser.read(self.readbytes).lower()
-        for t in posName.split():
-            try:
-                pos0.append(float(t))
-            except ValueError:
-                pass
-        #keep querying until it returns a number.
-        while pos0==[]:
-            self.ser.write("%s;RU;" % (self.getCurrentMotor()))
-            posName= self.ser.read(self.readbytes).lower()
-            for t in posName.split():
-                try:
-                    pos0.append(float(t))
-                except ValueError:
-                    pass
-        return pos0[0]/ self.fs2mm
+    def devicePos(self):
+        return self.io.getState(self.maxAge)[0]
 
     # return current velocity as a float
     def vel(self):
-        vel0 = []
-        self.ser.write("%s;RV;" % (self.getCurrentMotor()))
-        velName= self.ser.read(self.readbytes).lower()
-        for t in velName.split():
-            try:
-                vel0.append(float(t))
-            except ValueError:
-                pass
-        #keep querying until it returns a number.
-        while vel0==[]:
-            self.ser.write("%s;RV;" % (self.getCurrentMotor()))
-            velName= self.ser.read(self.readbytes).lower()
-            for t in velName.split():
-                try:
-                    vel0.append(float(t))
-                except ValueError:
-                    pass
-        return vel0[0]/ self.fs2mm
+        return self.io.getState(self.maxAge)[1]
 
-    def goto(self, pos):
+    def deviceGoto(self, pos):
         print "axis %s moved from %s fs to %.0f fs at speed ~%s mm/s"%(self.getCurrentMotor(),self.getPropertyByLabel("position").getValue(),pos, self.getCurrentSpeed())
         if not self.ready:
             print "not ready"
             return
         # move to new position
-        if self.getCurrentMotor() in ("AX" , "AY"):
-            self.ser.write("%s;VL%s;AC%s;MA%f;GO;" % (self.getCurrentMotor(),self.getCurrentSpeed(),self.getCurrentSpeed(), pos * self.fs2mm))
-        elif self.getCurrentMotor() =="AZ":
-            self.ser.write("%s;VL%s;AC%s;MA%f;GO;" % (self.getCurrentMotor(),self.getCurrentSpeed(),self.getCurrentSpeed(), pos * self.fs2mm))
-        if self.getPropertyByLabel("Keep Log").getValue():
-            logname = os.path.join(self.getPropertyByLabel("path").getValue(),"positionLog.txt")
-            log = open(logname,"a")
-            log.write(strftime("%Y-%m-%d %H:%M:%S", gmtime())+" - %s: %f fs \n" % (self.getCurrentMotor(),pos))
-            log.close()  
-        time.sleep(0.2)
-        # start update timer
-        self.updTimer = threading.Timer(0.3, self.updatePosition)
-        self.updTimer.start()
+        self.io.send("%s;VL%s;AC%s;MA%f;GO;" % (self.getCurrentMotor(),self.getCurrentSpeed(),self.getCurrentSpeed(), pos * self.fs2mm), pos)
 
 
     # should return True if stage is still moving
-    def is_moving(self):
+    def deviceIsMoving(self):
         if not self.ready:
             return False
-        vel0=self.vel()
-        time.sleep(0.2)
-        return (vel0!=0.0)
+        return self.io.getState(self.maxAge)[2]
 
     def onMove(self, event):
         pos = float(self.getPropertyByLabel("position").getValue())
-        self.goto(pos)
\ No newline at end of file
+        self.goto(pos)
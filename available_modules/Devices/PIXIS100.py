@@ -39,6 +39,7 @@ class PIXIS100(module.Input):
         self.name = "PIXIS100"
         self._sWidth = 1340
         self._sHeight = 100
+        self.triggerPeriod = 1e-3     # period of the external trigger (laser) in s
 
         prop = []
         prop.append({"label": "Camera", "type": "label", "value": ""})
@@ -190,3 +191,8 @@ class PIXIS100(module.Input):
         C = np.nan_to_num(A / B)
 
         return np.array([C, A, B])
+
+    # time needed by readNframes including the 20 discarded frames; the frame rate is limited either by the trigger or by the readout time
+    def acquisitionTime(self, N):
+        readout = self.cam.getParameter("ReadoutTimeCalculation") * 1e-3
+        return (N + 20) * max(readout, self.triggerPeriod)
@@ -70,3 +70,7 @@ class dummyCamera(module.Input):
         C = np.nan_to_num(A / B)
 
         return np.array([C, A, B])
+
+    # time needed by readNframes
+    def acquisitionTime(self, N):
+        return float(N) / 1000
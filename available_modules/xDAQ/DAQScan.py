@@ -4,7 +4,10 @@
 .. moduleauthor:: Daniel R. Dietze <daniel.dietze@berkeley.edu>
 
 DAQScan provides a module for reading a single value, e.g., from a lock-in, as function of optical delay time (=stage position).
-Data may be saved as a TAB-delimited two-column ASCII file (time, value).
+Data may be saved as a TAB-delimited three-column ASCII file (time, value, acquisition index), sorted by time.
+
+With `Refine Points` > 0, the scan is adaptive: after the initial delays have been measured, new delays are inserted where the signal
+changes fastest relative to the noise level estimated from the data, until the number of refine points or the refine time is used up.
 
 ..
    This file is part of the pyFSRS app.
@@ -34,6 +37,7 @@ import os
 import core.FSRSModule as module
 import core.FSRSPlot as FSRSplot
 import core.FSRSutils as cutils
+import core.FSRSCatalog as catalog
 
 
 # ##########################################################################################################################
@@ -51,12 +55,18 @@ class DAQScan(module.Experiment):
 
         self.data = []
         self.points = []
+        self.resort = False
+
+        # id of the catalog entry of the last scan
+        self.catalogID = None
 
         # when creating the properties, you should create a start/stop button with the label "Start"
         prop = []
         prop.append({"label": "DAQ", "type": "choice", "choices": [], "value": 0})
         prop.append({"label": "Axis", "type": "choice", "choices": [], "value": 0})
         prop = cutils.appendStageParameters(prop)
+        prop.append({"label": "Refine Points", "type": "spin", "value": 0, "info": (0, 1000)})
+        prop.append({"label": "Refine Time (min)", "type": "spin", "value": 0, "info": (0, 10000)})
         prop.append({"label": "Save Scan", "type": "button", "value": "Save", "event": "onSave"})
         prop.append({"label": "Progress", "type": "progress", "value": 0})
         prop.append({"label": "Start", "type": "button", "value": "Scan", "event": "onStart"})
@@ -83,6 +93,9 @@ class DAQScan(module.Experiment):
     def onAxisRangeChange(self, event):
         cutils.onAxisRangeChange(self, event)
 
+    def onPreviewScanPoints(self, event):
+        cutils.onPreviewScanPoints(self, event)
+
     def onSave(self, event):
         if len(self.data) == 0:
             wx.MessageBox("Nothing to save yet!", "Save Last Scan", style=wx.OK)
@@ -98,8 +111,10 @@ class DAQScan(module.Experiment):
             if not os.path.isdir(filename):
                 os.chdir(directory[0])
 
-            ind = np.argsort(self.points)
-            cutils.saveFSRS(filename, [self.points[ind], self.data[ind]])
+            points = self.points[:len(self.data)]
+            ind = np.argsort(points)
+            cutils.saveFSRS(filename, [points[ind], np.array(self.data)[ind], ind])
+            catalog.catalogScanSaved(self.catalogID, filename)
 
         dlg.Destroy()
 
@@ -119,39 +134,62 @@ class DAQScan(module.Experiment):
 
             s_axis = self.axes[self.getPropertyByLabel("axis").getValue()]
             s_daq = self.daqs[self.getPropertyByLabel("daq").getValue()]
-            self.points = cutils.prepareScanPoints(self)
+            self.points = cutils.prepareScanPoints(self, s_axis)
+            s_refine = int(self.getPropertyByLabel("refine points").getValue())
+            s_refineTime = 60.0 * float(self.getPropertyByLabel("refine time").getValue())
 
-            self.progress_iterator = itertools.cycle(np.arange(len(self.points) + 1) * 100 / (len(self.points)))
+            self.progress_iterator = itertools.cycle(np.arange(len(self.points) + s_refine + 1) * 100 / (len(self.points) + s_refine))
+
+            # in random and interleaved order or for refined delays, the line has to be re-sorted for plotting
+            self.resort = cutils.scanOrders[self.getPropertyByLabel('order').getValue()] not in ["sequential", "serpentine"] or s_refine > 0
             self.getPropertyByLabel("progress").setValue(next(self.progress_iterator))
 
-            module.Experiment.start(self, DAQScanThread, daq=s_daq, axis=s_axis, points=self.points)
+            # register scan in data catalog; the filename is added when the data are saved
+            self.catalogID = catalog.catalogScanStart(self, "", [s_daq, s_axis], sets=1, points=len(self.points))
+
+            module.Experiment.start(self, DAQScanThread, daq=s_daq, axis=s_axis, points=self.points, refine=s_refine, refineTime=s_refineTime)
 
     def onFinished(self):
+        # complete catalog entry
+        status = "stopped" if self.scanThread is not None and self.scanThread.canQuit.isSet() else "finished"
+
+        # refinement may add fewer points than requested, so the progress iterator may not have reached the end
+        if status == "finished":
+            self.getPropertyByLabel("progress").setValue(100)
+        summary = {"delays": len(self.data)}
+        if len(self.data) > 0:
+            summary.update({"mean": float(np.mean(self.data)), "std": float(np.std(self.data))})
+        catalog.catalogScanFinished(self.catalogID, status, summary)
+
         # wait for thread to exit cleanly
         module.Experiment.onFinished(self)
 
         # detach the plot window
         self.plotWnd = None
 
-    def onUpdate(self, val):
-        self.data = np.append(self.data, val)
+    def onUpdate(self, val, pos):
+        self.data.append(val)
+        if len(self.data) > len(self.points):    # refined delay
+            self.points = np.append(self.points, pos)
 
         # update progress bar
         self.getPropertyByLabel("progress").setValue(next(self.progress_iterator))
 
         # update plot
+        # re-sort the line if necessary, otherwise only the new point is passed to the plot
         if isinstance(self.plotWnd, wx.Frame):
-            if self.getPropertyByLabel('random'):
+            if self.resort:
                 ind = np.argsort(self.points[:len(self.data)])
                 x = self.points[:len(self.data)][ind]
-                y = self.data[ind]
-            else:
-                x = self.points[:len(self.data)]
-                y = self.data
-            if self.plotID == -1:
-                self.plotID = self.plotWnd.plotCanvas.addLine(x, y)
+                y = np.array(self.data)[ind]
+                if self.plotID == -1:
+                    self.plotID = self.plotWnd.plotCanvas.addLine(x, y)
+                else:
+                    self.plotWnd.plotCanvas.setLine(self.plotID, x, y)
             else:
-                self.plotWnd.plotCanvas.setLine(self.plotID, x, y)
+                if self.plotID == -1:
+                    self.plotID = self.plotWnd.plotCanvas.addSeries()
+                self.plotWnd.plotCanvas.appendPoints(self.plotID, self.points[len(self.data) - 1], val)
         else:
             # user closed the plotWindow -> stop thread
             self.onStart()
@@ -165,6 +203,8 @@ class DAQScanThread(module.ExperimentThread):
         self.daq = argv['daq']
         self.axis = argv['axis']
         self.points = argv['points']
+        self.refine = argv.get('refine', 0)
+        self.refineTime = argv.get('refineTime', 0)
 
     # this is the actual scan routine
     def run(self):
@@ -175,24 +215,45 @@ class DAQScanThread(module.ExperimentThread):
         time.sleep(0.1)
 
         cpoint = 0
+        values = []
+
+        # refinement state
+        added = 0
+        started = None
+        minstep = np.amin(np.diff(np.unique(self.points))) / 4.0 if len(self.points) > 1 else 0
+
+        # upload all points at once
+        self.axis.load_trajectory(self.points)
 
         # enter main loop
         while(self.canQuit.isSet() == 0 and cpoint < len(self.points)):
 
-            # move to first point
-            self.axis.goto(self.points[cpoint])
+            # move to next point
+            self.axis.next_point()
 
             # wait for axis to finish moving
             while self.axis.is_moving() and self.canQuit.isSet() == 0:
                 time.sleep(0.01)
 
             val = self.daq.read()
+            values.append(val)
 
             # send data to main GUI
-            wx.CallAfter(self.parent.onUpdate, val)
+            wx.CallAfter(self.parent.onUpdate, val, self.points[cpoint])
 
             cpoint += 1
 
+            # adaptive refinement: once all delays have been measured, insert new ones where the signal changes fastest relative to the noise
+            if cpoint == len(self.points) and added < self.refine:
+                if started is None:
+                    started = time.time()
+                if self.refineTime <= 0 or time.time() - started < self.refineTime:
+                    new = cutils.refineScanPoints(self.points, values, None, min(self.refine - added, max(1, len(values) // 4)), minstep)
+                    self.points = np.append(self.points, new)
+                    added += len(new)
+                    if len(new) > 0:
+                        self.axis.load_trajectory(new)
+
         self.axis.goto(self.points[0])
 
         # send terminated-Event
@@ -122,17 +122,16 @@ class DAQStats(module.Experiment):
         wx.MessageBox(txt, "DAQ Stats", style=wx.OK)
 
     def onUpdate(self, val):
-        self.data = np.append(self.data, val)
+        self.data.append(val)
 
         # update progress bar
         self.getPropertyByLabel("progress").setValue(next(self.progress_iterator))
 
-        # update plot
+        # update plot; only the new point is passed to the plot
         if isinstance(self.plotWnd, wx.Frame):
             if self.plotID == -1:
-                self.plotID = self.plotWnd.plotCanvas.addLine(np.arange(len(self.data)), self.data)
-            else:
-                self.plotWnd.plotCanvas.setLine(self.plotID, np.arange(len(self.data)), self.data)
+                self.plotID = self.plotWnd.plotCanvas.addSeries()
+            self.plotWnd.plotCanvas.appendPoints(self.plotID, len(self.data) - 1, val)
         else:
             # user closed the plotWindow -> stop thread
             self.onStart()
@@ -9,6 +9,10 @@ Each set is in addition saved as an individual file.
 Data are saved as TAB-delimited three-column ASCII files (A, B, C), where column B is pump-off, C pump-on (or vice versa) and column
 A is either B/C, -log10(B/C) or -log(B/C) depending on measurement mode.
 
+With `Target Noise` > 0, the acquisition stops early once the noise level of the averaged spectrum, i.e., the RMS of the per-pixel
+standard error of column A within `Noise Windows (px)` (e.g. '100:300, 500:700', empty = all pixels), is below the target.
+At least three sets are recorded; `# of Sets` is the upper limit.
+
 ..
    This file is part of the pyFSRS app.
 
@@ -58,6 +62,9 @@ class FSRSAcquire(module.Experiment):
         prop.append({"label": "Mode", "type": "choice", "choices": ["FSRS", "TA", "T/T0"], "value": 0})
         prop.append({"label": "# of Frames", "type": "spin", "value": 8000, "info": (2, 20000)})
         prop.append({"label": "# of Sets", "type": "spin", "value": 1, "info": (1, 20000)})
+        prop.append({"label": "Target Noise", "type": "input", "value": "0", "info": "float"})
+        prop.append({"label": "Noise Windows (px)", "type": "input", "value": ""})
+        prop.append({"label": "Noise Level", "type": "label", "value": "-"})
         prop.append({"label": "Progress", "type": "progress", "value": 0})
         prop.append({"label": "Save Last", "type": "button", "value": "Save", "event": "onSave"})
         prop.append({"label": "Start", "type": "button", "value": "Acquire", "event": "onStart"})
@@ -119,8 +126,15 @@ class FSRSAcquire(module.Experiment):
             self.data = np.array([])
             self.intdata = []
 
+            try:
+                windows = cutils.parsePixelWindows(self.getPropertyByLabel("noise windows").getValue())
+            except ValueError:
+                windows = None
+
             self.getPropertyByLabel("progress").setValue(0)
-            module.Experiment.start(self, AcquireThread, ccd=self.cameras[self.getPropertyByLabel("camera").getValue()], frames=self.getPropertyByLabel("frames").getValue(), sets=self.getPropertyByLabel("sets").getValue())
+            self.getPropertyByLabel("noise level").setValue("-")
+            module.Experiment.start(self, AcquireThread, ccd=self.cameras[self.getPropertyByLabel("camera").getValue()], frames=self.getPropertyByLabel("frames").getValue(), sets=self.getPropertyByLabel("sets").getValue(),
+                                    mode=self.getPropertyByLabel("mode").getValue(), target=abs(float(self.getPropertyByLabel("target noise").getValue())), windows=windows)
 
     def onFinished(self):
         # wait for thread to exit cleanly
@@ -140,13 +154,8 @@ class FSRSAcquire(module.Experiment):
         plotWnd.lowerPlotCanvas.addLine(np.arange(len(A)), C)
         plotWnd.Show()
 
-    def onUpdate(self, val):
-        A, B, C = val
-        mode = self.getPropertyByLabel("mode").getValue()
-        if mode == 0:
-            A = -np.log(A)
-        elif mode == 1:
-            A = -np.log10(A)
+    def onUpdate(self, val, noise=None):
+        A, B, C = cutils.convertSpectrum(val, self.getPropertyByLabel("mode").getValue())
 
         self.intdata.append([A, B, C])
 
@@ -157,6 +166,8 @@ class FSRSAcquire(module.Experiment):
             self.data = self.data + (np.array([A, B, C]) - self.data) / float(self.N)
 
         self.getPropertyByLabel("progress").setValue((self.N * 100) / self.getPropertyByLabel("sets").getValue())
+        if noise is not None and np.isfinite(noise):
+            self.getPropertyByLabel("noise level").setValue("%.3g" % noise)
 
 
 # ################################################################################
@@ -168,6 +179,13 @@ class AcquireThread(module.ExperimentThread):
         self.frames = argv['frames']
         self.sets = argv['sets']
 
+        # stop early once the noise level of the averaged spectrum reaches the target, but record at least minSets sets
+        self.mode = argv.get('mode', 0)
+        self.target = argv.get('target', 0)
+        self.windows = argv.get('windows', None)
+        self.minSets = 3
+        self.stats = cutils.RunningStats()
+
     # this is the actual scan routine
     def run(self):
         # send started-Event
@@ -179,9 +197,16 @@ class AcquireThread(module.ExperimentThread):
 
         while(self.canQuit.isSet() == 0 and cset < self.sets):
             val = self.ccd.readNframes(self.frames, self.canQuit)
+            self.stats.add(cutils.convertSpectrum(val, self.mode))
+            noise = cutils.getNoiseLevel(self.stats, self.windows)
+
             # send data to main GUI
-            wx.CallAfter(self.parent.onUpdate, val)
+            wx.CallAfter(self.parent.onUpdate, val, noise)
             cset += 1
 
+            if self.target > 0 and cset >= self.minSets and noise <= self.target:
+                print "noise target reached after", cset, "sets"
+                break
+
         # send terminated-Event
         wx.CallAfter(self.parent.onFinished)
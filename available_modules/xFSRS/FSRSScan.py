@@ -8,6 +8,33 @@ Allows to acquire M sets of data. The final result will be the average over the
 Each set and timestep is saved as an individual file. Data are saved as TAB-delimited three-column ASCII files (A, B, C), where column B is pump-off, C pump-on (or vice versa) and column
 A is either B/C, -log10(B/C) or -log(B/C) depending on measurement mode. File names follow the historical Mathies lab convention.
 
+During the scan, a running average over all sets is kept for each delay and shutter state. It is periodically saved as (delay x pixel) maps
+`basename_avg_exc.txt` / `basename_avg_gr.txt` together with the variances `basename_var_exc.txt` / `basename_var_gr.txt` (column A only, same format as XCScan).
+Files are replaced atomically, so an up-to-date averaged data set is available at any point of the scan.
+
+The running average of the excited state (column A) is shown as live delay x pixel map in a separate window, which is updated
+one delay at a time. Optionally, the averaged ground state spectrum is subtracted (`Live Map`) and the color range is fixed (`Lock Map Range`).
+The map window stays open after the scan has finished.
+
+If `Save Previews` is checked, a PNG thumbnail of the excited state map (column A, delay index vs. pixel) is written for each completed set
+(`basename_set<N>.png`) and a summary map of the average over all sets (`basename_avg.png`) when the scan has finished.
+The images are rendered offscreen, so they are also produced for unattended runs.
+
+`Estimate` shows the predicted duration of a scan with the current settings (see `core.FSRSTiming`). During the scan, the remaining
+time and the expected time of completion are shown and refined with the measured time per step. With `Dry Run` checked, the scan is
+performed with simulated devices that take as long as the real ones; data are written to a temporary folder, which is removed afterwards.
+
+With `Refine Points` > 0, the scan is adaptive: after all sets have been recorded at the initial delays (coarse pass), new delays are inserted
+where the averaged excited state signal (column A) changes fastest relative to its standard error, until the number of refine points or the
+refine time is used up. The signal is either the band integral or the amplitude of the first SVD component over the pixels given by `Band (px)`
+(e.g. '200:400', empty = all pixels). Refined delays are recorded in all sets like the initial ones and added to `basename_timepoints.txt`.
+The order in which all spectra were acquired is written to `basename_acquisition.txt` (index, delay, set, shutter state).
+
+With `Target Noise` > 0, a delay is skipped in the remaining sets as soon as the noise level of its averaged excited state spectrum, i.e., the RMS
+of the per-pixel standard error of column A within `Noise Windows (px)` (e.g. '100:300, 500:700', empty = all pixels), is below the target.
+Each delay is recorded at least three times. After the last set, the acquisitions saved this way are spent on the noisiest delays until
+all of them reach the target or the budget is used up. These additional spectra are numbered as further sets of the respective delay.
+
 Allows also to simultaneously measure a reference signal, e.g., the actinic pump power from a photodiode using some specified input device.
 This reference will be saved individually as a TAB-delimited two-column ASCII file (time, value).
 
@@ -34,12 +61,16 @@ import wx
 import numpy as np
 import time
 import os
+import shutil
+import tempfile
 
 import itertools
 
 import core.FSRSModule as module
 import core.FSRSPlot as FSRSplot
 import core.FSRSutils as cutils
+import core.FSRSCatalog as catalog
+import core.FSRSTiming as timing
 
 
 # ##########################################################################################################################
@@ -60,6 +91,15 @@ class FSRSScan(module.Experiment):
         self.plotWnd = None
         self.plotInit = False
 
+        # live map of the running average
+        self.mapWnd = None
+        self.mapID = -1
+        self.mapDelays = np.array([])
+
+        # hidden plot window for rendering preview images
+        self.previewWnd = None
+        self.previewID = -1
+
         # when creating the properties, you should create a start/stop button with the label "Start"
         prop = []
         prop.append({"label": "Camera", "type": "choice", "choices": [], "value": 0})
@@ -75,8 +115,21 @@ class FSRSScan(module.Experiment):
         prop.append({"label": "# of Sets", "type": "spin", "value": 1, "info": (1, 1000)})
         prop.append({"label": "Basename", "type": "input", "value": ""})
         prop.append({"label": "Output Path", "type": "file", "value": os.getcwd(), "info": "path"})
+        prop.append({"label": "Avg. Save Interval", "type": "spin", "value": 10, "info": (0, 10000)})
+        prop.append({"label": "Refine Points", "type": "spin", "value": 0, "info": (0, 1000)})
+        prop.append({"label": "Refine Time (min)", "type": "spin", "value": 0, "info": (0, 10000)})
+        prop.append({"label": "Refine Signal", "type": "choice", "choices": ["Band Integral", "SVD Component"], "value": 0})
+        prop.append({"label": "Band (px)", "type": "input", "value": ""})
+        prop.append({"label": "Target Noise", "type": "input", "value": "0", "info": "float"})
+        prop.append({"label": "Noise Windows (px)", "type": "input", "value": ""})
+        prop.append({"label": "Save Previews", "type": "checkbox", "value": 1, "info": "PNG per set"})
+        prop.append({"label": "Live Map", "type": "choice", "choices": ["Off", "Excited State", "Exc. - Ground State"], "value": 1, "event": "onMapOptions"})
+        prop.append({"label": "Lock Map Range", "type": "checkbox", "value": 0, "info": "keep colors", "event": "onMapOptions"})
+        prop.append({"label": "Dry Run", "type": "checkbox", "value": 0, "info": "simulate devices"})
         prop.append({"label": "Progress", "type": "progress", "value": 0})
         prop.append({"label": "Status", "type": "label", "value": ""})
+        prop.append({"label": "Duration", "type": "label", "value": ""})
+        prop.append({"label": "Estimate", "type": "button", "value": "Estimate", "event": "onEstimate"})
         prop.append({"label": "Start", "type": "button", "value": "Scan", "event": "onStart"})
 
         # convert dictionary to properties object
@@ -85,6 +138,24 @@ class FSRSScan(module.Experiment):
         self.data = np.array([])
         self.Nsteps = 0
         self.Nsets = 0
+        self.Ntype = 0      # measurement type of the running scan, used by the GUI and the scan thread alike
+
+        # running average over all sets and over the current set only
+        self.avgMap = None
+        self.avgCount = 0
+        self.setMap = None
+        self.lastSet = 0
+
+        # id of the catalog entry of the current scan
+        self.catalogID = None
+
+        # progress tracking and dry run state
+        self.clock = None
+        self.dryRun = False
+
+        # delays recorded so far and number of acquired spectra
+        self.scanDelays = set()
+        self.acqCount = 0
 
     def initialize(self, others=[]):
         module.Experiment.initialize(self, others)
@@ -121,6 +192,43 @@ class FSRSScan(module.Experiment):
     def onAxisRangeChange(self, event):
         cutils.onAxisRangeChange(self, event)
 
+    def onPreviewScanPoints(self, event):
+        cutils.onPreviewScanPoints(self, event)
+
+    def estimateDuration(self, ccd, axis, shutter, points, frames, sets, order, type, refine=0):
+        """Estimate the duration of a scan, print the details and show the result in the panel.
+
+        Refined delays are assumed to take as long as the initial ones on average.
+
+        :returns: Estimate as returned by `FSRSTiming.estimateScanDuration`.
+        """
+        est = timing.estimateScanDuration(ccd, axis, shutter, points, frames, sets, order, ground=(type == 0), overhead=timing.getOverhead(self.name))
+        if refine > 0 and len(points) > 0:
+            scale = float(len(points) + refine) / len(points)
+            for key in ["acquisition", "motion", "overhead"]:
+                est[key] *= scale
+            est["steps"] += refine * sets
+            est["total"] = est["acquisition"] + est["motion"] + est["shutter"] + est["overhead"]
+        print "estimated scan duration:", timing.formatDuration(est["total"])
+        for key in ["acquisition", "motion", "shutter", "overhead"]:
+            print "  %-12s %8.1f s" % (key, est[key])
+        self.getPropertyByLabel("duration").setValue("~%s (%d steps)" % (timing.formatDuration(est["total"]), est["steps"]))
+        return est
+
+    def onEstimate(self, event=None):
+        if self.running:
+            return
+        s_ccd = self.cameras[self.getPropertyByLabel("camera").getValue()]
+        s_axis = self.axes[self.getPropertyByLabel("axis").getValue()]
+        s_shutter = self.shutters[self.getPropertyByLabel("shutter").getValue()]
+        s_frames = int(self.getPropertyByLabel("frames").getValue())
+        s_sets = int(self.getPropertyByLabel("sets").getValue())
+        s_order = self.getPropertyByLabel("order").getValue()
+        s_type = self.getPropertyByLabel("type").getValue()
+        s_refine = int(self.getPropertyByLabel("refine points").getValue())
+        s_points = cutils.prepareScanPoints(self, s_axis, s_sets)
+        self.estimateDuration(s_ccd, s_axis, s_shutter, s_points, s_frames, s_sets, s_order, s_type, s_refine)
+
     def onStart(self, event=None):
         if self.running:
             module.Experiment.stop(self)
@@ -151,68 +259,279 @@ class FSRSScan(module.Experiment):
             s_frames = int(self.getPropertyByLabel("frames").getValue())
             s_ref = self.inputs[self.getPropertyByLabel("take ref.").getValue() - 1] if self.getPropertyByLabel("take ref.").getValue() >= 1 else None
 
-            s_points = cutils.prepareScanPoints(self)
-            self.Nsteps = len(s_points) + 1
             s_sets = int(self.getPropertyByLabel("sets").getValue())
+            s_order = self.getPropertyByLabel("order").getValue()
+            s_points = cutils.prepareScanPoints(self, s_axis, s_sets)
+            self.Nsteps = len(s_points) + 1
             self.Nsets = s_sets
+            self.Ntype = s_type
+
+            # adaptive refinement
+            s_refine = int(self.getPropertyByLabel("refine points").getValue())
+            s_refineTime = 60.0 * float(self.getPropertyByLabel("refine time").getValue())
+            s_svd = self.getPropertyByLabel("refine signal").getValue() == 1
+            try:
+                band = [int(b) for b in self.getPropertyByLabel("band").getValue().split(":")]
+                s_band = slice(band[0], band[1])
+            except (ValueError, IndexError):    # empty or invalid -> all pixels
+                s_band = None
+
+            # noise target per delay
+            s_target = abs(float(self.getPropertyByLabel("target noise").getValue()))
+            try:
+                s_windows = cutils.parsePixelWindows(self.getPropertyByLabel("noise windows").getValue())
+            except ValueError:
+                s_windows = None
 
             self.s_points_iterator = itertools.cycle(s_points)
-            self.progress_iterator = itertools.cycle(np.linspace(0, 100, len(s_points) * s_sets).astype(int))
+            self.progress_iterator = itertools.cycle(np.linspace(0, 100, (len(s_points) + s_refine) * s_sets).astype(int))
             self.getPropertyByLabel("progress").setValue(0)
 
-            self.basename = os.path.join(self.getPropertyByLabel("path").getValue(), self.getPropertyByLabel("basename").getValue())
+            self.clock = timing.ScanClock(self.estimateDuration(s_ccd, s_axis, s_shutter, s_points, s_frames, s_sets, s_order, s_type, s_refine))
 
-            # save a timepoints file
-            np.savetxt(self.basename + "_timepoints.txt", np.sort(s_points))
+            # for a dry run, replace all devices by simulated ones and write the data to a temporary folder
+            self.dryRun = bool(self.getPropertyByLabel("dry run").getValue())
+            if self.dryRun:
+                s_ccd = timing.SimCamera(s_ccd)
+                s_axis = timing.SimAxis(s_axis)
+                s_shutter = timing.SimOutput(s_shutter)
+                s_ref = timing.SimInput(s_ref) if s_ref is not None else None
+                self.basename = os.path.join(tempfile.mkdtemp(prefix="pyFSRS_dryrun"), "dryrun")
+            else:
+                self.basename = os.path.join(self.getPropertyByLabel("path").getValue(), self.getPropertyByLabel("basename").getValue())
 
-            module.Experiment.start(self, ScanThread, type=s_type, ccd=s_ccd, axis=s_axis, shutter=s_shutter, frames=s_frames, points=s_points, sets=s_sets, reference=s_ref)
+            # save a timepoints file and start the acquisition log
+            self.scanDelays = set(s_points)
+            np.savetxt(self.basename + "_timepoints.txt", np.sort(s_points))
+            self.acqCount = 0
+            with open(self.basename + "_acquisition.txt", "w") as f:
+                f.write("# index\tdelay\tset\tshutter\n")
+
+            # reset running average
+            self.avgMap = cutils.RunningDelayMap()
+            self.avgCount = 0
+            self.setMap = cutils.RunningDelayMap()
+            self.lastSet = 0
+
+            # live map; one row per delay, sorted ascending
+            self.mapWnd = None
+            self.mapID = -1
+            self.mapDelays = np.unique(s_points)
+            if self.getPropertyByLabel("live map").getValue() > 0:
+                self.mapWnd = FSRSplot.PlotFrame(None, title=time.strftime("FSRS Scan Map"), size=(640, 480))
+                self.mapWnd.plotCanvas.tightx = True
+                self.mapWnd.plotCanvas.tighty = True
+                self.mapWnd.plotCanvas.setXLabel("Wavenumber (px)")
+                self.mapWnd.plotCanvas.setYLabel("Delay Index")
+                self.mapWnd.Show()
+
+            # the preview window is never shown, images are rendered offscreen
+            if self.previewWnd is not None:
+                self.previewWnd.Destroy()
+            self.previewWnd = None
+            self.previewID = -1
+            if self.getPropertyByLabel("previews").getValue() and not self.dryRun:
+                self.previewWnd = FSRSplot.PlotFrame(None, title="FSRS Scan Preview", size=(320, 240))
+                self.previewWnd.plotCanvas.tightx = True
+                self.previewWnd.plotCanvas.tighty = True
+                self.previewWnd.plotCanvas.setXLabel("Pixel")
+                self.previewWnd.plotCanvas.setYLabel("Delay Index")
+
+            # register scan in data catalog; dry runs are not registered
+            self.catalogID = None
+            if not self.dryRun:
+                self.catalogID = catalog.catalogScanStart(self, self.basename, [s_ccd, s_axis, s_shutter, s_ref], frames=s_frames, sets=s_sets, points=len(s_points))
+
+            module.Experiment.start(self, ScanThread, type=self.Ntype, ccd=s_ccd, axis=s_axis, shutter=s_shutter, frames=s_frames, points=s_points, sets=s_sets, order=s_order, reference=s_ref,
+                                    refine=s_refine, refineTime=s_refineTime, band=s_band, svd=s_svd, target=s_target, windows=s_windows)
 
     def onFinished(self, t=None, r=None):
 
         # save reference data when required
         if t is not None and r is not None:
-            filename = os.path.join(self.getPropertyByLabel("path").getValue(), self.getPropertyByLabel("basename").getValue()) + "_reference.dat"
+            filename = self.basename + "_reference.dat"
             data = np.array([t[np.argsort(t)], r[np.argsort(t)]]).T
             np.savetxt(filename, data)
 
+        # save final running average
+        if self.avgMap is not None and self.avgCount > 0:
+            self.avgMap.save(self.basename)
+
+        # save previews of the last set and of the average
+        if self.setMap is not None:
+            self.savePreview(self.basename + "_set%d.png" % self.lastSet, self.setMap)
+        if self.avgMap is not None:
+            self.savePreview(self.basename + "_avg.png", self.avgMap)
+        if self.previewWnd is not None:
+            self.previewWnd.Destroy()
+        self.previewWnd = None
+
+        # complete catalog entry
+        status = "stopped" if self.scanThread is not None and self.scanThread.canQuit.isSet() else "finished"
+
+        # refinement and converged points may need fewer spectra than estimated, so the progress iterator may not have reached the end
+        if status == "finished":
+            self.getPropertyByLabel("progress").setValue(100)
+        summary = {"spectra": self.avgCount, "delays": len(self.avgMap.getMap(1)[0]) if self.avgMap is not None else 0, "reference": r is not None}
+        catalog.catalogScanFinished(self.catalogID, status, summary)
+        self.catalogID = None
+
+        # report actual duration and remember the measured overhead for the next estimate
+        if self.clock is not None and self.clock.done > 0:
+            timing.recordOverhead(self.name, self.clock.getOverhead())
+            self.getPropertyByLabel("duration").setValue("took %s (predicted %s)" % (timing.formatDuration(self.clock.getElapsed()), timing.formatDuration(self.clock.duration)))
+        self.clock = None
+
+        if self.dryRun:
+            shutil.rmtree(os.path.dirname(self.basename), ignore_errors=True)
+
         # wait for thread to exit cleanly
         module.Experiment.onFinished(self)
 
-        # now destroy the plot window
+        # now destroy the plot window and detach the map
         if isinstance(self.plotWnd, wx.Frame):
             self.plotWnd.Destroy()
         self.plotWnd = None
         self.plotInit = False
+        self.mapWnd = None
+
+    def onMapOptions(self, event=None):
+        """Apply changes of the live map options to a running scan.
+        """
+        if not isinstance(self.mapWnd, wx.Frame) or self.mapID == -1:
+            return
+        canvas = self.mapWnd.plotCanvas
+        with canvas.batchUpdate():
+            self.updateMap()
+            if self.getPropertyByLabel("lock map").getValue():
+                zmin, zmax, locked = canvas.getImageRange(self.mapID)
+                if not locked and zmin < zmax:
+                    canvas.setImageRange(self.mapID, zmin, zmax)
+            else:
+                canvas.setImageRange(self.mapID)
+
+    def getMapRow(self, delay, ground=None):
+        """Returns the row of the live map for the given delay, i.e., the averaged excited state spectrum (column A), optionally minus
+        the averaged ground state spectrum `ground`. None if there are no data for this delay yet.
+        """
+        stats = self.avgMap.getStats(delay, 1)
+        if stats is None:
+            return None
+        if ground is None:
+            return stats.mean[0]
+        return stats.mean[0] - ground
+
+    def updateMap(self, delay=None):
+        """Update the live map. If `delay` is given, only the row of this delay is updated, otherwise the whole map.
+        """
+        if not isinstance(self.mapWnd, wx.Frame) or self.getPropertyByLabel("live map").getValue() == 0:
+            return
+
+        # ground state spectra are recorded at delay 0
+        ground = None
+        if self.getPropertyByLabel("live map").getValue() == 2 and self.avgMap.getStats(0, 0) is not None:
+            ground = self.avgMap.getStats(0, 0).mean[0]
+
+        # a refined delay adds a new row, so the whole map has to be rebuilt
+        rebuild = False
+        if delay is not None and not np.any(self.mapDelays == delay):
+            self.mapDelays = np.unique(np.append(self.mapDelays, delay))
+            delay = None
+            rebuild = True
+
+        if delay is None:
+            rows = [self.getMapRow(t, ground) for t in self.mapDelays]
+            start = 0
+        else:
+            start = int(np.searchsorted(self.mapDelays, delay))
+            rows = [self.getMapRow(delay, ground)]
+        if all(r is None for r in rows):
+            return
+        Npx = len([r for r in rows if r is not None][0])
+        rows = np.array([r if r is not None else np.ones(Npx) * np.nan for r in rows])
+
+        canvas = self.mapWnd.plotCanvas
+        if self.mapID == -1:
+            self.mapID = canvas.addImage(np.arange(Npx), np.arange(len(self.mapDelays)), np.ones((len(self.mapDelays), Npx)) * np.nan)
+        if rebuild:
+            canvas.setImage(self.mapID, np.arange(Npx), np.arange(len(self.mapDelays)), rows)
+        else:
+            canvas.updateImageRows(self.mapID, rows, start, np.arange(start, start + len(rows)))
+
+    def savePreview(self, filename, delayMap, size=(320, 240)):
+        """Save the excited state map (column A) of a RunningDelayMap as PNG file using the hidden preview window.
+        """
+        if self.previewWnd is None:
+            return
+        delays, mean, _, _ = delayMap.getMap(1)
+        if len(delays) < 2:
+            return
+
+        canvas = self.previewWnd.plotCanvas
+        if self.previewID == -1:
+            self.previewID = canvas.addImage(np.arange(mean.shape[1]), np.arange(len(delays)), mean)
+        else:
+            canvas.setImage(self.previewID, np.arange(mean.shape[1]), np.arange(len(delays)), mean)
+        canvas.saveImage(filename, size)
 
-    def onUpdate(self, val, grexc, step, set):
+    # extra = True for spectra recorded outside of the regular sets, i.e., at refined delays or to reach the noise target
+    def onUpdate(self, val, grexc, step, set, extra=False):
 
-        # prepare data
-        A, B, C = val
-        mode = self.getPropertyByLabel("mode").getValue()
-        if mode == 0:
-            A = -np.log(A)
-        elif mode == 1:
-            A = -np.log10(A)
+        # prepare data; same conversion as in the scan thread
+        A, B, C = cutils.convertSpectrum(val, self.Ntype)
 
         # save data
-        filename = cutils.formatFSRSFilename(mode, self.basename, step, set, grexc)
+        filename = cutils.formatFSRSFilename(self.Ntype, self.basename, step, set, grexc)
         cutils.saveFSRS(filename, [A, B, C])
 
-        # update progress bar
+        # log acquisition order; refined delays are added to the timepoints file
+        with open(self.basename + "_acquisition.txt", "a") as f:
+            f.write("%d\t%g\t%d\t%d\n" % (self.acqCount, step, set, grexc))
+        self.acqCount += 1
+        if grexc == 1 and step not in self.scanDelays:
+            self.scanDelays.add(step)
+            np.savetxt(self.basename + "_timepoints.txt", np.sort(list(self.scanDelays)))
+
+        # a new set has started, save preview of the completed one; extra spectra are not part of the per-set previews
+        if not extra:
+            if set != self.lastSet:
+                self.savePreview(self.basename + "_set%d.png" % self.lastSet, self.setMap)
+                self.setMap = cutils.RunningDelayMap()
+                self.lastSet = set
+            self.setMap.add(step, grexc, [A, B, C])
+
+        # update running average and save it every now and then
+        self.avgMap.add(step, grexc, [A, B, C])
+        self.avgCount += 1
+        interval = int(self.getPropertyByLabel("avg. save").getValue())
+        if interval > 0 and self.avgCount % interval == 0:
+            self.avgMap.save(self.basename)
+
+        # update live map; a new ground state spectrum changes all rows of a difference map
+        if grexc == 1:
+            self.updateMap(step)
+        elif self.getPropertyByLabel("live map").getValue() == 2:
+            self.updateMap()
+
+        # update progress bar, remaining time and ETA
+        self.clock.step()
         self.getPropertyByLabel("progress").setValue(next(self.progress_iterator))
-        self.getPropertyByLabel("status").setValue("position %.0ffs, set %d/%d" % (step, set, self.Nsets))
+        self.getPropertyByLabel("status").setValue("position %.0ffs, set %d/%d, %s left" % (step, set, self.Nsets, timing.formatDuration(self.clock.getRemaining())))
+        self.getPropertyByLabel("duration").setValue("~%s, ETA %s" % (timing.formatDuration(self.clock.duration), time.strftime("%H:%M", time.localtime(self.clock.getETA()))))
 
         # plot in window
         if isinstance(self.plotWnd, wx.Frame):
-            if self.plotInit:
-                self.plotWnd.upperPlotCanvas.setLine(0, np.arange(len(A)), A)
-                self.plotWnd.lowerPlotCanvas.setLine(0, np.arange(len(A)), B)
-                self.plotWnd.lowerPlotCanvas.setLine(1, np.arange(len(A)), C)
-            else:
-                self.plotInit = True
-                self.plotWnd.upperPlotCanvas.addLine(np.arange(len(A)), A)
-                self.plotWnd.lowerPlotCanvas.addLine(np.arange(len(A)), B)
-                self.plotWnd.lowerPlotCanvas.addLine(np.arange(len(A)), C)
+            # update all traces with a single repaint per canvas
+            with self.plotWnd.batchUpdate():
+                if self.plotInit:
+                    self.plotWnd.upperPlotCanvas.setLine(0, np.arange(len(A)), A)
+                    self.plotWnd.lowerPlotCanvas.setLine(0, np.arange(len(A)), B)
+                    self.plotWnd.lowerPlotCanvas.setLine(1, np.arange(len(A)), C)
+                else:
+                    self.plotInit = True
+                    self.plotWnd.upperPlotCanvas.addLine(np.arange(len(A)), A)
+                    self.plotWnd.lowerPlotCanvas.addLine(np.arange(len(A)), B)
+                    self.plotWnd.lowerPlotCanvas.addLine(np.arange(len(A)), C)
         else:
             # user closed the plotWindow -> stop thread
             self.onStart()
@@ -229,16 +548,68 @@ class ScanThread(module.ExperimentThread):
         self.axis = argv['axis']
         self.points = argv['points']
         self.sets = argv['sets']
+        self.order = argv.get('order', 0)
         self.type = argv['type']
         self.reference = argv.get('reference', None)
 
+        # adaptive refinement after the coarse pass
+        self.refine = argv.get('refine', 0)
+        self.refineTime = argv.get('refineTime', 0)
+        self.band = argv.get('band', None)
+        self.svd = argv.get('svd', False)
+
+        # noise target per delay; a delay is recorded at least minSets times
+        self.target = argv.get('target', 0)
+        self.windows = argv.get('windows', None)
+        self.minSets = 3
+
+        # running average of the excited state spectra per delay and number of spectra per point
+        self.delayMap = cutils.RunningDelayMap()
+        self.counts = np.zeros(len(self.points), dtype=int)
+
+    def isConverged(self, i):
+        """Returns True if the noise level at point i has reached the target.
+        """
+        if self.target <= 0 or self.counts[i] < self.minSets:
+            return False
+        return cutils.getNoiseLevel(self.delayMap.getStats(self.points[i], 1), self.windows) <= self.target
+
+    def getSetIndices(self, set):
+        """Returns the indices of the points recorded in the given set, skipping converged points.
+        """
+        return np.array([i for i in cutils.getSetOrder(len(self.points), set, self.order) if not self.isConverged(i)], dtype=int)
+
+    def record(self, i, set, extra=False):
+        """Read a spectrum at point i, which the axis has already reached, and send it to the GUI.
+        """
+        val = self.ccd.readNframes(self.frames, self.canQuit)
+
+        # if user wants some reference signal
+        if self.reference is not None:
+            self.reference_data[i] = self.reference_data[i] + self.reference.read()
+
+        if self.refine > 0 or self.target > 0:
+            self.delayMap.add(self.points[i], 1, cutils.convertSpectrum(val, self.type))
+        self.counts[i] += 1
+
+        # send data to main GUI
+        wx.CallAfter(self.parent.onUpdate, val, 1, self.points[i], set, extra)
+
+    def moveTo(self, pos):
+        """Move the axis and wait until it has arrived.
+        """
+        self.axis.goto(pos)
+        while self.axis.is_moving() and self.canQuit.isSet() == 0:
+            time.sleep(0.1)
+
     # this is the actual scan routine
     def run(self):
         # send started-Event
         wx.CallAfter(self.parent.onStarted)
 
         cset = 0
-        reference_data = np.zeros(len(self.points))
+        self.reference_data = np.zeros(len(self.points))
+        spare = 0
 
         if self.reference is not None and self.reference.hasProperty("wait"):
             old_wait_time = self.reference.getPropertyByLabel("wait").getValue()
@@ -254,9 +625,18 @@ class ScanThread(module.ExperimentThread):
         while(self.canQuit.isSet() == 0 and cset < self.sets):
 
             cpoint = 0
+            indices = self.getSetIndices(cset)
+
+            # acquisitions saved at converged points are reassigned after the last set
+            spare += len(self.points) - len(indices)
+            if len(indices) == 0:
+                spare += len(self.points) * (self.sets - cset - 1)
+                cset = self.sets
+                break
 
-            # move to first point
-            self.axis.goto(self.points[cpoint])
+            # upload the points of this set and move to the first one
+            self.axis.load_trajectory(self.points[indices])
+            self.axis.next_point()
 
             # use this time to record a ground state spectrum
             # -----------------------------------------------
@@ -277,7 +657,7 @@ class ScanThread(module.ExperimentThread):
 
             # record excited state spectra
             # ----------------------------
-            while(cpoint < len(self.points) and self.canQuit.isSet() == 0):
+            while(cpoint < len(indices) and self.canQuit.isSet() == 0):
 
                 # wait for axis to finish moving
                 while self.axis.is_moving() and self.canQuit.isSet() == 0:
@@ -285,21 +665,62 @@ class ScanThread(module.ExperimentThread):
 
                 # read
                 if self.canQuit.isSet() == 0:
-                    val = self.ccd.readNframes(self.frames, self.canQuit)
-
-                    # if user wants some reference signal
-                    if self.reference is not None:
-                        reference_data[cpoint] = reference_data[cpoint] + self.reference.read()
-
-                    # send data to main GUI
-                    wx.CallAfter(self.parent.onUpdate, val, 1, self.points[cpoint], cset)
+                    self.record(indices[cpoint], cset)
                     cpoint += 1
 
-                # move to next point
-                self.axis.goto(self.points[cpoint % len(self.points)])
+                # move to next point; after the last point of a set, go to the first point of the next set
+                if cpoint < len(indices):
+                    self.axis.next_point()
+                else:
+                    nextIndices = self.getSetIndices(cset + 1)
+                    if len(nextIndices) > 0:
+                        self.axis.goto(self.points[nextIndices[0]])
 
             cset += 1
 
+        # reassign the acquisitions saved at converged points to the noisiest points
+        # these are numbered as further sets of the respective point
+        while spare > 0 and cset == self.sets and self.canQuit.isSet() == 0:
+            noise = np.array([cutils.getNoiseLevel(self.delayMap.getStats(t, 1), self.windows) for t in self.points])
+            i = int(np.argmax(noise))
+            if noise[i] <= self.target:
+                break
+            self.moveTo(self.points[i])
+            if self.canQuit.isSet() == 0:
+                self.record(i, self.counts[i], True)
+                spare -= 1
+
+        # adaptive refinement: insert new delays where the averaged signal changes fastest relative to its noise
+        # new delays are rounded to full fs and must not collide with the filenames of existing ones
+        added = 0
+        started = time.time()
+        minstep = max(1.0, np.amin(np.diff(np.unique(self.points))) / 4.0) if len(self.points) > 1 else 1.0
+        while added < self.refine and cset == self.sets and self.canQuit.isSet() == 0:
+            if self.refineTime > 0 and time.time() - started > self.refineTime:
+                break
+
+            delays, mean, var, N = self.delayMap.getMap(1, 0)
+            signal, noise = cutils.getDelaySignal(mean, np.sqrt(var / N[:, np.newaxis]), self.band, self.svd)
+            new = np.round(cutils.refineScanPoints(delays, signal, noise, min(self.refine - added, max(1, len(delays) // 4)), minstep))
+            new = np.unique(new[np.in1d(new.astype(int), self.points.astype(int), invert=True)])
+            if len(new) == 0:
+                break
+
+            first = len(self.points)
+            self.points = np.append(self.points, new)
+            self.reference_data = np.append(self.reference_data, np.zeros(len(new)))
+            self.counts = np.append(self.counts, np.zeros(len(new), dtype=int))
+            added += len(new)
+
+            # record the new delays as often as the initial ones, one pass per set
+            for s in range(self.sets):
+                for i in range(first, len(self.points)):
+                    if self.canQuit.isSet() != 0:
+                        break
+                    self.moveTo(self.points[i])
+                    if self.canQuit.isSet() == 0:
+                        self.record(i, s, True)
+
         # return axis
         self.axis.goto(self.points[0])
 
@@ -310,8 +731,7 @@ class ScanThread(module.ExperimentThread):
         # restore wait time and send data to main thread
         if self.reference is not None:
 
-            if cset > 0:
-                reference_data = reference_data / float(cset)
+            reference_data = self.reference_data / np.maximum(self.counts, 1)
 
             if self.reference.hasProperty("wait"):
                 self.reference.getPropertyByLabel("wait").setValue(old_wait_time)
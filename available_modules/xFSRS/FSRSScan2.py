@@ -121,6 +121,9 @@ class FSRSScan2(module.Experiment):
     def onAxisRangeChange(self, event):
         cutils.onAxisRangeChange(self, event)
 
+    def onPreviewScanPoints(self, event):
+        cutils.onPreviewScanPoints(self, event)
+
     def onStart(self, event=None):
         if self.running:
             module.Experiment.stop(self)
@@ -151,9 +154,10 @@ class FSRSScan2(module.Experiment):
             s_frames = int(self.getPropertyByLabel("frames").getValue())
             s_ref = self.inputs[self.getPropertyByLabel("take ref.").getValue() - 1] if self.getPropertyByLabel("take ref.").getValue() >= 1 else None
 
-            s_points = cutils.prepareScanPoints(self)
-            self.Nsteps = len(s_points) + 1
             s_sets = int(self.getPropertyByLabel("sets").getValue())
+            s_order = self.getPropertyByLabel("order").getValue()
+            s_points = cutils.prepareScanPoints(self, s_axis, s_sets)
+            self.Nsteps = len(s_points) + 1
             self.Nsets = s_sets
 
             self.s_points_iterator = itertools.cycle(s_points)
@@ -165,7 +169,7 @@ class FSRSScan2(module.Experiment):
             # save a timepoints file
             np.savetxt(self.basename + "_timepoints.txt", np.sort(s_points))
 
-            module.Experiment.start(self, ScanThread, type=s_type, ccd=s_ccd, axis=s_axis, shutter=s_shutter, frames=s_frames, points=s_points, sets=s_sets, reference=s_ref)
+            module.Experiment.start(self, ScanThread, type=s_type, ccd=s_ccd, axis=s_axis, shutter=s_shutter, frames=s_frames, points=s_points, sets=s_sets, order=s_order, reference=s_ref)
 
     def onFinished(self, t=None, r=None):
 
@@ -188,14 +192,14 @@ class FSRSScan2(module.Experiment):
 
         # prepare data
         A, B, C = val
-        mode = self.getPropertyByLabel("mode").getValue()
-        if mode == 0:
+        s_type = self.getPropertyByLabel("type").getValue()
+        if s_type == 0:
             A = -np.log(A)
-        elif mode == 1:
+        elif s_type == 1:
             A = -np.log10(A)
 
         # save data
-        filename = cutils.formatFSRSFilename(mode, self.basename, step, set, grexc)
+        filename = cutils.formatFSRSFilename(s_type, self.basename, step, set, grexc)
         cutils.saveFSRS(filename, [A, B, C])
 
         # update progress bar
@@ -229,6 +233,7 @@ class ScanThread(module.ExperimentThread):
         self.axis = argv['axis']
         self.points = argv['points']
         self.sets = argv['sets']
+        self.order = argv.get('order', 0)
         self.type = argv['type']
         self.reference = argv.get('reference', None)
     # this is the actual scan routine
@@ -253,10 +258,11 @@ class ScanThread(module.ExperimentThread):
         # enter main loop
         while(self.canQuit.isSet() == 0 and cset < self.sets):
             cpoint = 0
+            indices = cutils.getSetOrder(len(self.points), cset, self.order)
             # move to first point
             posx=self.axis.pos()
-            currentInterval=abs(self.points[cpoint]-posx)
-            self.axis.goto(self.points[cpoint])
+            currentInterval=abs(self.points[indices[cpoint]]-posx)
+            self.axis.goto(self.points[indices[cpoint]])
             #try to estimate how long translation takes
             time.sleep(0.1+currentInterval/stagerange*maxtranslationTime)
 
@@ -285,17 +291,17 @@ class ScanThread(module.ExperimentThread):
                     val = self.ccd.readNframes(self.frames, self.canQuit)
                     # if user wants some reference signal
                     if self.reference is not None:
-                        reference_data[cpoint] = reference_data[cpoint] + self.reference.read()
+                        reference_data[indices[cpoint]] = reference_data[indices[cpoint]] + self.reference.read()
 
                     # send data to main GUI
-                    wx.CallAfter(self.parent.onUpdate, val, 1, self.points[cpoint], cset)
+                    wx.CallAfter(self.parent.onUpdate, val, 1, self.points[indices[cpoint]], cset)
                     time.sleep(0.2)
 
                     cpoint += 1
 
                 # move to next point
-                currentInterval= abs(self.points[cpoint % len(self.points)]-self.points[cpoint % len(self.points)-1])
-                self.axis.goto(self.points[cpoint % len(self.points)])
+                currentInterval= abs(self.points[indices[cpoint % len(indices)]]-self.points[indices[cpoint - 1]])
+                self.axis.goto(self.points[indices[cpoint % len(indices)]])
                 time.sleep(0.1+currentInterval/stagerange*maxtranslationTime)
             print "Finished set ", cset
             cset += 1
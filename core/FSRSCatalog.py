@@ -0,0 +1,347 @@
+"""
+.. module: FSRSCatalog
+   :platform: Windows
+.. moduleauthor:: Daniel R. Dietze <daniel.dietze@berkeley.edu>
+
+FSRSCatalog keeps a local SQLite index of all acquired data sets, so that measurements can be found without crawling the file system.
+
+Experiment modules register a scan in `onStart` and complete the entry in `onFinished`. Each entry records the basename and output path,
+the module name and all module settings, the list of devices used, start / end time and duration as well as a small data summary.
+Settings, devices and summary are stored as JSON text. Existing data directories can be added with the bulk indexer, which
+recognizes FSRS / TA data sets by their file names.
+
+The catalog can be used from python::
+
+    import core.FSRSCatalog as catalog
+
+    cat = catalog.Catalog()
+    for scan in cat.query(basename="sampleX", module="FSRS Scan", minFrames=5000, since="2016-05-01"):
+        print scan["basename"], scan["started"], scan["settings"]["# of Frames"]
+
+or from the command line::
+
+    python core/FSRSCatalog.py query --basename sampleX --min-frames 5000 --since 2016-05-01
+    python core/FSRSCatalog.py index C:/data
+
+..
+   This file is part of the pyFSRS app.
+
+   This program is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+   Copyright 2014-2016 Daniel Dietze <daniel.dietze@berkeley.edu>.
+"""
+import os
+import sys
+import time
+import json
+import sqlite3
+import argparse
+
+# allow running this file directly from the command line
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import core.FSRSLoader as loader
+else:
+    import FSRSLoader as loader
+
+#: Default location of the catalog database: pyFSRS program folder.
+defaultCatalogPath = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "catalog.sqlite")
+
+# property types that carry settings worth recording
+settingTypes = ["input", "choice", "checkbox", "toggle", "file", "spin"]
+
+schema = """
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    basename TEXT,
+    path TEXT,
+    module TEXT,
+    status TEXT,
+    started REAL,
+    finished REAL,
+    duration REAL,
+    frames INTEGER,
+    sets INTEGER,
+    points INTEGER,
+    settings TEXT,
+    devices TEXT,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS scans_basename ON scans (basename);
+CREATE INDEX IF NOT EXISTS scans_started ON scans (started);
+"""
+
+
+# convert a date string 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM' or a number to seconds since epoch
+def parseTime(t):
+    """Convert a date given as 'YYYY-MM-DD', 'YYYY-MM-DD HH:MM' or seconds since epoch into seconds since epoch.
+    """
+    if t is None or isinstance(t, (int, float)):
+        return t
+    for fmt in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]:
+        try:
+            return time.mktime(time.strptime(t, fmt))
+        except ValueError:
+            pass
+    raise ValueError("Cannot parse date %s. Use YYYY-MM-DD [HH:MM]." % t)
+
+
+def getModuleSettings(mod):
+    """Returns a dictionary {label: value} with all settings of an FSRSModule.
+    Buttons, labels and progress bars are skipped.
+    """
+    settings = {}
+    for p in mod.properties:
+        if p.getType() in settingTypes:
+            value = p.getValue()
+            if p.getType() == "choice" and isinstance(value, int) and 0 <= value < len(p.getChoices()):
+                value = p.getChoices()[value]
+            settings[p.getLabel()] = value
+    return settings
+
+
+# ##########################################################################################################################
+# catalog class
+class Catalog():
+    """Interface to the SQLite catalog database.
+
+    A new connection is opened for every operation, so that the catalog can be used from the GUI as well as from measurement threads.
+
+    :param str filename: Filename of the database (default = `defaultCatalogPath`). The database is created if it does not exist.
+    """
+    def __init__(self, filename=None):
+        self.filename = filename if filename is not None else defaultCatalogPath
+        con = self.connect()
+        con.executescript(schema)
+        con.commit()
+        con.close()
+
+    def connect(self):
+        """Returns a new sqlite3 connection to the database.
+        """
+        con = sqlite3.connect(self.filename, timeout=10)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def addScan(self, basename="", path="", module="", status="running", started=None, finished=None, frames=None, sets=None, points=None, settings={}, devices=[], summary={}):
+        """Add a new entry to the catalog.
+
+        :returns: Id of the new entry.
+        """
+        if started is None:
+            started = time.time()
+        duration = finished - started if finished is not None else None
+
+        con = self.connect()
+        cur = con.execute("INSERT INTO scans (basename, path, module, status, started, finished, duration, frames, sets, points, settings, devices, summary) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                          (basename, path, module, status, started, finished, duration, frames, sets, points, json.dumps(settings, default=str), json.dumps(devices, default=str), json.dumps(summary, default=str)))
+        id = cur.lastrowid
+        con.commit()
+        con.close()
+        return id
+
+    def updateScan(self, id, **fields):
+        """Update fields of an existing entry. Settings, devices and summary are converted to JSON automatically; values that cannot be
+        converted are stored as strings.
+        """
+        for key in ["settings", "devices", "summary"]:
+            if key in fields:
+                fields[key] = json.dumps(fields[key], default=str)
+        keys = sorted(fields.keys())
+        con = self.connect()
+        con.execute("UPDATE scans SET %s WHERE id = ?" % ", ".join("%s = ?" % k for k in keys), [fields[k] for k in keys] + [id])
+        con.commit()
+        con.close()
+
+    def finishScan(self, id, status="finished", summary={}):
+        """Complete an entry at the end of a scan: sets end time, duration, status and data summary.
+        """
+        con = self.connect()
+        row = con.execute("SELECT started FROM scans WHERE id = ?", (id, )).fetchone()
+        con.close()
+        finished = time.time()
+        started = row["started"] if row is not None else finished
+        self.updateScan(id, status=status, finished=finished, duration=finished - started, summary=summary)
+
+    def hasScan(self, basename):
+        """Returns True if there is an entry with the given basename (including the path).
+        """
+        path, name = os.path.split(basename)
+        con = self.connect()
+        row = con.execute("SELECT id FROM scans WHERE basename = ? AND path = ?", (name, path)).fetchone()
+        con.close()
+        return row is not None
+
+    def query(self, basename=None, module=None, path=None, since=None, until=None, minFrames=None, minSets=None, device=None, setting=None, status=None):
+        """Search the catalog. All given criteria have to be fulfilled.
+
+        :param str basename: Part of the basename (case insensitive).
+        :param str module: Part of the module name.
+        :param str path: Part of the output path.
+        :param mixed since: Earliest start time as 'YYYY-MM-DD [HH:MM]' or seconds since epoch.
+        :param mixed until: Latest start time.
+        :param int minFrames: Minimum number of frames per step.
+        :param int minSets: Minimum number of sets.
+        :param str device: Part of the name of a device that was used.
+        :param str setting: Text that has to appear in the recorded settings.
+        :param str status: Status of the scan ('running', 'finished', 'stopped', 'indexed').
+        :returns: List of dictionaries, one per scan, sorted by start time. Settings, devices and summary are decoded from JSON.
+        """
+        cond = []
+        args = []
+        for field, value in [("basename", basename), ("module", module), ("path", path), ("devices", device), ("settings", setting)]:
+            if value is not None:
+                cond.append("%s LIKE ?" % field)
+                args.append("%" + value + "%")
+        for field, op, value in [("started", ">=", parseTime(since)), ("started", "<=", parseTime(until)), ("frames", ">=", minFrames), ("sets", ">=", minSets), ("status", "=", status)]:
+            if value is not None:
+                cond.append("%s %s ?" % (field, op))
+                args.append(value)
+
+        sql = "SELECT * FROM scans"
+        if cond:
+            sql += " WHERE " + " AND ".join(cond)
+        sql += " ORDER BY started"
+
+        con = self.connect()
+        rows = con.execute(sql, args).fetchall()
+        con.close()
+
+        result = []
+        for r in rows:
+            d = dict((k, r[k]) for k in r.keys())
+            for key in ["settings", "devices", "summary"]:
+                d[key] = json.loads(d[key]) if d[key] else {}
+            result.append(d)
+        return result
+
+    def indexDirectory(self, directory, recursive=True, verbose=False):
+        """Add all FSRS / TA data sets found in `directory` that are not yet in the catalog.
+
+        Only file names and time stamps are read, so this is fast even for large archives.
+        Start and end time are taken from the oldest and newest file of a data set.
+
+        :returns: Number of added data sets.
+        """
+        count = 0
+        for root, dirs, files in os.walk(directory):
+            if not recursive:
+                dirs[:] = []
+            for basename in loader.findFSRSBasenames(root):
+                if self.hasScan(basename):
+                    continue
+                fs = loader.findFSRSFiles(basename)
+                mtimes = [os.path.getmtime(f[0]) for f in fs]
+                summary = {"files": len(fs),
+                           "delays": len(set(f[2] for f in fs)),
+                           "type": ["FSRS", "TA"][fs[0][1]],
+                           "timepoints": os.path.isfile(basename + "_timepoints.txt"),
+                           "reference": os.path.isfile(basename + "_reference.dat")}
+                path, name = os.path.split(basename)
+                self.addScan(name, path, "", "indexed", min(mtimes), max(mtimes), sets=len(set(f[3] for f in fs)), points=summary["delays"], summary=summary)
+                count += 1
+                if verbose:
+                    print "indexed", basename
+        return count
+
+
+# ##########################################################################################################################
+# convenience functions used by the experiment modules
+# errors are reported but never raised, the catalog must not interfere with the measurement
+def catalogScanStart(mod, basename="", devices=[], frames=None, sets=None, points=None, catalog=None):
+    """Register a new scan. Call from `onStart` of an experiment module.
+
+    :param FSRSModule mod: Experiment module; name and settings are recorded.
+    :param str basename: Basename of the data set including the path or empty if data are saved later.
+    :param list devices: List of FSRSModules used for the scan.
+    :param int frames: Number of frames per step.
+    :param int sets: Number of sets.
+    :param int points: Number of stage positions.
+    :param str catalog: Filename of the catalog database (default = `defaultCatalogPath`).
+    :returns: Id of the new entry or None if the catalog could not be written.
+    """
+    try:
+        path, name = os.path.split(basename)
+        return Catalog(catalog).addScan(name, path, mod.name, frames=frames, sets=sets, points=points, settings=getModuleSettings(mod), devices=[str(d.name) for d in devices if d is not None])
+    except (sqlite3.Error, IOError, OSError, TypeError, ValueError) as e:
+        print "WARNING: could not write to catalog:", e
+    return None
+
+
+def catalogScanFinished(id, status="finished", summary={}, catalog=None):
+    """Complete the catalog entry of a scan. Call from `onFinished` of an experiment module.
+
+    :param int id: Id as returned by `catalogScanStart`; nothing is done when None.
+    :param str status: Final status, e.g. 'finished' or 'stopped'.
+    :param dict summary: Data summary; values that are not JSON serializable are stored as strings.
+    """
+    if id is None:
+        return
+    try:
+        Catalog(catalog).finishScan(id, status, summary)
+    except (sqlite3.Error, IOError, OSError, TypeError, ValueError) as e:
+        print "WARNING: could not write to catalog:", e
+
+
+def catalogScanSaved(id, filename, catalog=None):
+    """Update basename and path of a catalog entry after the data have been saved by the user, e.g. via a file dialog.
+    """
+    if id is None:
+        return
+    try:
+        path, name = os.path.split(filename)
+        Catalog(catalog).updateScan(id, basename=name, path=path)
+    except (sqlite3.Error, IOError, OSError, TypeError, ValueError) as e:
+        print "WARNING: could not write to catalog:", e
+
+
+# ----------------------------------------------------------------------------------------------------------------------------
+# command line interface
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query and update the pyFSRS data catalog.")
+    parser.add_argument("--db", default=None, help="catalog database (default: %s)" % defaultCatalogPath)
+    sub = parser.add_subparsers(dest="command")
+
+    q = sub.add_parser("query", help="search the catalog")
+    q.add_argument("--basename", help="part of the basename")
+    q.add_argument("--module", help="part of the module name")
+    q.add_argument("--path", help="part of the output path")
+    q.add_argument("--since", help="earliest start date YYYY-MM-DD [HH:MM]")
+    q.add_argument("--until", help="latest start date YYYY-MM-DD [HH:MM]")
+    q.add_argument("--min-frames", type=int, help="minimum number of frames")
+    q.add_argument("--min-sets", type=int, help="minimum number of sets")
+    q.add_argument("--device", help="part of a device name")
+    q.add_argument("--setting", help="text appearing in the module settings")
+    q.add_argument("--status", help="status of the scan")
+    q.add_argument("--json", action="store_true", help="print full entries as JSON")
+
+    i = sub.add_parser("index", help="add existing data directories to the catalog")
+    i.add_argument("directory", nargs="+")
+    i.add_argument("--flat", action="store_true", help="do not descend into subdirectories")
+
+    args = parser.parse_args()
+    cat = Catalog(args.db)
+
+    if args.command == "query":
+        scans = cat.query(args.basename, args.module, args.path, args.since, args.until, args.min_frames, args.min_sets, args.device, args.setting, args.status)
+        for s in scans:
+            if args.json:
+                print json.dumps(s, sort_keys=True)
+            else:
+                print "%5d  %s  %-12s %-10s %s" % (s["id"], time.strftime("%Y-%m-%d %H:%M", time.localtime(s["started"])), s["module"], s["status"], os.path.join(s["path"], s["basename"]))
+        print "%d scans found." % len(scans)
+
+    elif args.command == "index":
+        for d in args.directory:
+            print "%d data sets added from %s." % (cat.indexDirectory(d, not args.flat, True), d)
@@ -0,0 +1,319 @@
+"""
+.. module: FSRSConvert
+   :platform: Windows
+.. moduleauthor:: Daniel R. Dietze <daniel.dietze@berkeley.edu>
+
+FSRSConvert converts archived ASCII data into the compact binary container format of `FSRSLoader` (`.npy` array plus `.json` header).
+
+The converter walks a directory tree and groups the files into logical scans:
+
+    - All files following the FSRS / TA filename convention (see `FSRSutils.formatFSRSFilename`) that share a basename are combined into a
+      single (set, delay, state, pixel, column) container named like the basename, together with the exact stage positions from `basename_timepoints.txt`.
+      These containers can be opened directly with `FSRSDataset.openDataset(basename)`.
+    - Any other numeric text file, e.g. written by `saveXC` or the save buttons of XCScan / DAQScan, is stored as 2d-array in a container named
+      like the file including its extension.
+
+Every container is verified bit by bit against a fresh parse of the source files before it is marked as verified. Files are converted in parallel
+using a process pool. The conversion is resumable: scans with a verified container whose source signature (file names, sizes and modification
+times) is unchanged are skipped, so an interrupted run can simply be restarted. Progress and throughput are reported on the command line.
+
+Example usage::
+
+    python core/FSRSConvert.py D:/archive --out E:/archive_bin --processes 8
+
+..
+   This file is part of the pyFSRS app.
+
+   This program is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+   Copyright 2014-2016 Daniel Dietze <daniel.dietze@berkeley.edu>.
+"""
+import numpy as np
+import os
+import sys
+import time
+import json
+import argparse
+import multiprocessing
+
+# allow running this file directly from the command line
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import core.FSRSutils as cutils
+    import core.FSRSLoader as loader
+else:
+    import FSRSutils as cutils
+    import FSRSLoader as loader
+
+#: Version of the container layout written by the converter.
+converterVersion = 1
+
+#: Default extensions of text files that are converted in addition to FSRS / TA files.
+defaultExtensions = [".txt", ".dat", ".csv"]
+
+# files that are never converted; containers, caches, code and images
+skipExtensions = [".npy", ".json", ".tmp", ".py", ".pyc", ".sqlite", ".png", ".jpg", ".bmp", ".zip"]
+
+
+# ##########################################################################################################################
+# grouping
+def findScans(directory, out=None, extensions=defaultExtensions, recursive=True):
+    """Walk a directory tree and group the files into logical scans.
+
+    :param str directory: Root directory.
+    :param str out: Root of the output tree or None to place the containers next to the data (default).
+    :param list extensions: Extensions of additional text files to convert; None converts all files that are not skipped.
+    :param bool recursive: If True (default), descend into subdirectories.
+    :returns: List of jobs (kind, container name, list of source files) with kind = 'scan' or 'file'.
+    """
+    jobs = []
+    for root, dirs, files in os.walk(directory):
+        if not recursive:
+            dirs[:] = []
+        dirs.sort()
+
+        dst = root if out is None else os.path.join(out, os.path.relpath(root, directory))
+
+        # FSRS / TA files grouped by basename
+        groups = {}
+        rest = []
+        for f in sorted(files):
+            ext = os.path.splitext(f)[1].lower()
+            if ext in skipExtensions:
+                continue
+            p = cutils.parseFSRSFilename(os.path.join(root, f))
+            if p is not None:
+                groups.setdefault(os.path.split(p[1])[1], []).append(os.path.join(root, f))
+            elif extensions is None or ext in extensions:
+                rest.append(f)
+
+        for name in sorted(groups):
+            sources = groups[name]
+            if name + "_timepoints.txt" in rest:
+                rest.remove(name + "_timepoints.txt")
+                sources.append(os.path.join(root, name + "_timepoints.txt"))
+            jobs.append(("scan", os.path.join(dst, name), sources))
+
+        for f in rest:
+            jobs.append(("file", os.path.join(dst, f), [os.path.join(root, f)]))
+    return jobs
+
+
+def isConverted(container, sources):
+    """Returns True if `container` holds verified data of the unchanged source files.
+    """
+    if not loader.isContainer(container):
+        return False
+    try:
+        with open(container + ".json", "r") as f:
+            header = json.load(f)
+    except (IOError, ValueError):
+        return False
+    return header.get("verified", False) and header.get("signature") == loader.getFileSignature(sources)
+
+
+# ##########################################################################################################################
+# conversion
+def bitsEqual(a, b):
+    """Returns True if both float arrays are identical bit by bit, including NaN payloads and the sign of zero.
+    """
+    a = np.ascontiguousarray(a, dtype=np.float64)
+    b = np.ascontiguousarray(b, dtype=np.float64)
+    return a.shape == b.shape and np.array_equal(a.view(np.uint64), b.view(np.uint64))
+
+
+def convertScan(container, sources):
+    """Convert the files of a FSRS / TA scan into a single container and verify it.
+
+    :param str container: Filename of the container without extension.
+    :param list sources: Data files plus optionally the timepoints file.
+    :returns: Header of the written container.
+    """
+    timepoints = [s for s in sources if s.endswith("_timepoints.txt")]
+    basename = timepoints[0][:-len("_timepoints.txt")] if timepoints else cutils.parseFSRSFilename(sources[0])[1]
+    selected = set(sources)
+    files = [f for f in loader.findFSRSFiles(basename) if f[0] in selected]
+    signature = loader.getFileSignature(sources)
+
+    delays_map = loader.getExactDelays(basename, files)
+    sets = sorted(set(f[3] for f in files))
+    delays = sorted(set(delays_map.values()))
+    states = sorted(set(f[4] for f in files))
+
+    data = None
+    index = []
+    for f in files:
+        d = loader._loadFile(f[0])
+        if data is None:
+            data = np.ones((len(sets), len(delays), len(states)) + d.shape) * np.nan
+        if d.shape != data.shape[3:]:
+            raise ValueError("File %s has shape %s, expected %s." % (f[0], str(d.shape), str(data.shape[3:])))
+        i = (sets.index(f[3]), delays.index(delays_map[f[0]]), states.index(f[4]))
+        data[i] = d
+        index.append(i)
+
+    header = {"kind": "scan", "version": converterVersion, "sets": sets, "delays": delays, "states": states, "type": files[0][1], "signature": signature, "verified": False}
+    if timepoints:    # keep the original stage positions, as the timepoints file may contain positions without data
+        header["timepoints"] = np.loadtxt(timepoints[0], ndmin=2).tolist()
+    loader.saveContainer(container, data, **header)
+
+    # verify the written container against a fresh parse of every source file
+    stored, h = loader.loadContainer(container, mmap=True)
+    for f, i in zip(files, index):
+        if not bitsEqual(stored[i], loader._loadFile(f[0])):
+            raise ValueError("Verification of %s failed for file %s." % (container, f[0]))
+    if not bitsEqual(h["delays"], delays) or (timepoints and not bitsEqual(h["timepoints"], np.loadtxt(timepoints[0], ndmin=2))):
+        raise ValueError("Verification of %s failed for the stage positions." % container)
+    del stored
+
+    header["verified"] = True
+    with open(container + ".json.tmp", "w") as f:
+        json.dump(dict(h, verified=True), f, indent=1)
+    cutils.replaceFile(container + ".json.tmp", container + ".json")
+    return header
+
+
+def convertFile(container, sources):
+    """Convert a single numeric text file into a container and verify it.
+
+    :param str container: Filename of the container without extension.
+    :param list sources: List containing the text file.
+    :returns: Header of the written container.
+    """
+    filename = sources[0]
+    signature = loader.getFileSignature(sources)
+    data = loader._loadFile(filename)
+
+    header = {"kind": "file", "version": converterVersion, "source": os.path.split(filename)[1], "signature": signature, "verified": False}
+    loader.saveContainer(container, data, **header)
+
+    stored, h = loader.loadContainer(container, mmap=True)
+    if not bitsEqual(stored, loader._loadFile(filename)):
+        raise ValueError("Verification of %s failed." % container)
+    del stored
+
+    header["verified"] = True
+    with open(container + ".json.tmp", "w") as f:
+        json.dump(dict(h, verified=True), f, indent=1)
+    cutils.replaceFile(container + ".json.tmp", container + ".json")
+    return header
+
+
+def _convertJob(job):
+    """Worker function for the process pool; has to be on module level to be picklable.
+
+    :returns: Tuple (container, status, input bytes, output bytes, number of files, message) with status 'converted', 'skipped' or 'failed'.
+    """
+    kind, container, sources, force, remove = job
+    insize = 0
+    try:
+        insize = sum(os.path.getsize(s) for s in sources)
+        if not force and isConverted(container, sources):
+            return container, "skipped", insize, 0, len(sources), ""
+
+        if not os.path.isdir(os.path.dirname(container)):
+            try:
+                os.makedirs(os.path.dirname(container))
+            except OSError:
+                pass    # created by another worker in the meantime
+
+        if kind == "scan":
+            convertScan(container, sources)
+        else:
+            convertFile(container, sources)
+        outsize = os.path.getsize(container + ".npy") + os.path.getsize(container + ".json")
+
+        if remove:
+            for s in sources:
+                os.remove(s)
+        return container, "converted", insize, outsize, len(sources), ""
+
+    except Exception as e:    # report and continue with the next scan; e.g. text files that do not contain numbers
+        return container, "failed", insize, 0, len(sources), str(e)
+
+
+def convertTree(directory, out=None, processes=None, extensions=defaultExtensions, recursive=True, force=False, remove=False, verbose=True):
+    """Convert all scans below `directory`.
+
+    .. note:: On Windows, the process pool requires that the calling script protects its entry point with `if __name__ == '__main__'`.
+
+    :param str directory: Root directory.
+    :param str out: Root of the output tree or None to place the containers next to the data (default).
+    :param int processes: Number of worker processes. None uses one process per CPU, 1 converts serially in the calling process.
+    :param list extensions: Extensions of additional text files to convert; None converts all files that are not skipped.
+    :param bool recursive: If True (default), descend into subdirectories.
+    :param bool force: If True, convert again even if a verified container exists.
+    :param bool remove: If True, delete the source files after successful verification.
+    :param bool verbose: If True (default), print progress and throughput.
+    :returns: Dictionary with statistics (scans, files, converted, skipped, failed, bytes in / out, elapsed time).
+    """
+    jobs = [(kind, container, sources, force, remove) for kind, container, sources in findScans(directory, out, extensions, recursive)]
+    stats = {"scans": len(jobs), "files": 0, "converted": 0, "skipped": 0, "failed": 0, "bytesIn": 0, "bytesOut": 0, "errors": []}
+
+    t0 = time.time()
+    if processes == 1:
+        results = (_convertJob(job) for job in jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_convertJob, jobs)
+
+    try:
+        for i, (container, status, insize, outsize, nfiles, msg) in enumerate(results):
+            stats[status] += 1
+            if status == "converted":
+                stats["files"] += nfiles
+                stats["bytesIn"] += insize
+                stats["bytesOut"] += outsize
+            elif status == "failed":
+                stats["errors"].append((container, msg))
+
+            if verbose:
+                elapsed = max(time.time() - t0, 1e-6)
+                print "[%d/%d] %-9s %s (%d files)%s - %.1f MB/s" % (i + 1, len(jobs), status, container, nfiles, ": " + msg if msg else "", stats["bytesIn"] / 1e6 / elapsed)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    stats["elapsed"] = time.time() - t0
+
+    if verbose:
+        print "\n%d scans: %d converted, %d skipped, %d failed" % (stats["scans"], stats["converted"], stats["skipped"], stats["failed"])
+        print "%d files, %.1f MB -> %.1f MB (%.1f%%) in %.1f s" % (stats["files"], stats["bytesIn"] / 1e6, stats["bytesOut"] / 1e6, 100.0 * stats["bytesOut"] / max(stats["bytesIn"], 1), stats["elapsed"])
+        print "throughput: %.1f MB/s, %.1f files/s" % (stats["bytesIn"] / 1e6 / max(stats["elapsed"], 1e-6), stats["files"] / max(stats["elapsed"], 1e-6))
+    return stats
+
+
+# ----------------------------------------------------------------------------------------------------------------------------
+# command line interface
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert archived pyFSRS ASCII data into verified binary containers.")
+    parser.add_argument("directory", nargs="+")
+    parser.add_argument("--out", default=None, help="root of the output tree (default: next to the data); only valid for a single directory")
+    parser.add_argument("--processes", type=int, default=None, help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--ext", default=",".join(defaultExtensions), help="comma separated extensions of other text files to convert or * for all (default: %(default)s)")
+    parser.add_argument("--flat", action="store_true", help="do not descend into subdirectories")
+    parser.add_argument("--force", action="store_true", help="convert again even if a verified container exists")
+    parser.add_argument("--remove", action="store_true", help="delete source files after successful verification")
+    args = parser.parse_args()
+
+    if args.out is not None and len(args.directory) > 1:
+        parser.error("--out can only be used with a single directory")
+    extensions = None if args.ext == "*" else [e.strip().lower() for e in args.ext.split(",") if e.strip() != ""]
+
+    failed = 0
+    for d in args.directory:
+        failed += convertTree(d, args.out, args.processes, extensions, not args.flat, args.force, args.remove)["failed"]
+    sys.exit(1 if failed > 0 else 0)
@@ -0,0 +1,277 @@
+"""
+.. module: FSRSDataset
+   :platform: Windows
+.. moduleauthor:: Daniel R. Dietze <daniel.dietze@berkeley.edu>
+
+FSRSDataset provides lazy access to FSRS / TA scans that are too large to be loaded into memory at once.
+
+A dataset is opened either from a binary container written by `FSRSLoader.saveContainer` (e.g. the `basename_cache` sidecar or the output of the
+archive converter) or directly from the legacy ASCII files of a basename. Containers are memory mapped, legacy files are indexed and only read when
+the corresponding spectra are accessed. In both cases, the dataset behaves like a read-only numpy array with shape (set, delay, state, pixel, column)
+that supports integer, slice, list and boolean indexing along each axis.
+
+Reductions are computed in a streaming fashion, one set at a time, so that at most a single chunk of data is held in memory in addition to the result.
+
+Example usage::
+
+    import core.FSRSDataset as dataset
+
+    d = dataset.openDataset("C:/data/sample1")     # container or legacy files
+    print d.shape, d.delays
+    spec = d[0, 5, 1, :, 0]                   # single spectrum
+    early = d.selectDelays(d.delays < 1000)   # lazy view on a subset of delays
+    avg = early.mean()                        # average over all sets
+
+..
+   This file is part of the pyFSRS app.
+
+   This program is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+   Copyright 2014-2016 Daniel Dietze <daniel.dietze@berkeley.edu>.
+"""
+import numpy as np
+
+import FSRSLoader as loader
+
+
+# ##########################################################################################################################
+# data sources
+# a source gives access to the full (set, delay, state, pixel, column) array of a scan; it has to provide `shape` and
+# `read(sets, delays, states, pixels, columns)`, which returns a (len(sets), len(delays), len(states), ...) array for the given lists of indices,
+# where the trailing axes result from indexing each (pixel, column) spectrum with the numpy key (pixels, columns)
+class ContainerSource():
+    """Memory mapped binary container.
+    """
+    def __init__(self, filename):
+        self.data, header = loader.loadContainer(filename, mmap=True)
+        if self.data.ndim != 5:
+            raise ValueError("Container %s does not hold a (set, delay, state, pixel, column) array." % filename)
+        self.shape = self.data.shape
+        self.sets = header.get("sets", range(self.shape[0]))
+        self.delays = header.get("delays", range(self.shape[1]))
+        self.states = header.get("states", range(self.shape[2]))
+        self.type = header.get("type", 0)
+
+    def read(self, sets, delays, states, pixels=slice(None), columns=slice(None)):
+        # basic indexing of the memmap returns views, so only the selected pixels of the selected spectra are read from disk
+        out = None
+        for i, s in enumerate(sets):
+            for j, d in enumerate(delays):
+                for k, st in enumerate(states):
+                    spec = self.data[s, d, st][pixels, columns]
+                    if out is None:
+                        out = np.zeros((len(sets), len(delays), len(states)) + np.shape(spec))
+                    out[i, j, k] = spec
+        if out is None:
+            out = np.zeros((len(sets), len(delays), len(states)) + np.shape(np.zeros(self.shape[3:])[pixels, columns]))
+        return out
+
+
+class LegacySource():
+    """Indexed legacy ASCII files; each file is read only when it is accessed.
+    """
+    def __init__(self, basename):
+        files = loader.findFSRSFiles(basename)
+        if len(files) == 0:
+            raise ValueError("No data files found for basename %s." % basename)
+
+        delays_map = loader.getExactDelays(basename, files)
+        self.sets = sorted(set(f[3] for f in files))
+        self.delays = sorted(set(delays_map.values()))
+        self.states = sorted(set(f[4] for f in files))
+        self.type = files[0][1]
+
+        self.files = {}
+        for f in files:
+            self.files[(self.sets.index(f[3]), self.delays.index(delays_map[f[0]]), self.states.index(f[4]))] = f[0]
+
+        Npx, Ncol = np.loadtxt(files[0][0], ndmin=2).shape
+        self.shape = (len(self.sets), len(self.delays), len(self.states), Npx, Ncol)
+
+    def read(self, sets, delays, states, pixels=slice(None), columns=slice(None)):
+        # the ASCII files have to be parsed completely, but only the selected pixels are kept
+        out = np.ones((len(sets), len(delays), len(states)) + np.shape(np.zeros(self.shape[3:])[pixels, columns])) * np.nan
+        for i, s in enumerate(sets):
+            for j, d in enumerate(delays):
+                for k, st in enumerate(states):
+                    f = self.files.get((s, d, st))
+                    if f is not None:
+                        out[i, j, k] = np.loadtxt(f, ndmin=2)[pixels, columns]
+        return out
+
+
+# ##########################################################################################################################
+# lazy dataset
+class FSRSDataset():
+    """Lazy, read-only view on a FSRS / TA scan with shape (set, delay, state, pixel, column).
+
+    Use `openDataset` to create a dataset. Selections along the set, delay and state axes return new lazy views without reading any data.
+
+    :param source: ContainerSource or LegacySource instance.
+    :param str basename: Basename of the data set.
+    :param array setIndex: Indices into the source along the set axis (default = all).
+    :param array delayIndex: Indices into the source along the delay axis (default = all).
+    :param array stateIndex: Indices into the source along the state axis (default = all).
+    """
+    def __init__(self, source, basename="", setIndex=None, delayIndex=None, stateIndex=None):
+        self.source = source
+        self.basename = basename
+        self.type = source.type
+        self.setIndex = np.arange(source.shape[0]) if setIndex is None else np.array(setIndex, dtype=int)
+        self.delayIndex = np.arange(source.shape[1]) if delayIndex is None else np.array(delayIndex, dtype=int)
+        self.stateIndex = np.arange(source.shape[2]) if stateIndex is None else np.array(stateIndex, dtype=int)
+
+    @property
+    def sets(self):
+        return np.array(self.source.sets, dtype=int)[self.setIndex]
+
+    @property
+    def delays(self):
+        return np.array(self.source.delays, dtype=float)[self.delayIndex]
+
+    @property
+    def states(self):
+        return np.array(self.source.states, dtype=int)[self.stateIndex]
+
+    @property
+    def shape(self):
+        return (len(self.setIndex), len(self.delayIndex), len(self.stateIndex)) + tuple(self.source.shape[3:])
+
+    def __len__(self):
+        return len(self.setIndex)
+
+    def __getitem__(self, key):
+        """Numpy-like indexing over (set, delay, state, pixel, column). Only the requested spectra are read.
+        """
+        if not isinstance(key, tuple):
+            key = (key, )
+
+        # expand Ellipsis and pad with full slices
+        if any(k is Ellipsis for k in key):
+            i = [k is Ellipsis for k in key].index(True)
+            key = key[:i] + (slice(None), ) * (5 - len(key) + 1) + key[i + 1:]
+        if len(key) > 5:
+            raise IndexError("Too many indices for dataset.")
+        key = key + (slice(None), ) * (5 - len(key))
+
+        # map the first three keys onto source indices; integers drop the axis as for numpy arrays
+        index = []
+        drop = []
+        for i, (k, ind) in enumerate(zip(key[:3], [self.setIndex, self.delayIndex, self.stateIndex])):
+            sel = ind[k]
+            if np.ndim(sel) == 0:
+                drop.append(i)
+            index.append(np.atleast_1d(sel))
+
+        # pixel and column keys are passed on, so that only the requested part of each spectrum is read
+        data = self.source.read(*(index + list(key[3:])))
+        return data[tuple(0 if i in drop else slice(None) for i in range(3))]
+
+    # ----------------------------------------------------------------------------------------------------------------------
+    # lazy selections
+    def selectSets(self, sets):
+        """Returns a lazy view containing only the given sets.
+
+        :param mixed sets: Index, slice, list of indices or boolean mask along the set axis.
+        """
+        return FSRSDataset(self.source, self.basename, np.atleast_1d(self.setIndex[sets]), self.delayIndex, self.stateIndex)
+
+    def selectDelays(self, delays):
+        """Returns a lazy view containing only the given delays.
+
+        :param mixed delays: Index, slice, list of indices or boolean mask along the delay axis.
+        """
+        return FSRSDataset(self.source, self.basename, self.setIndex, np.atleast_1d(self.delayIndex[delays]), self.stateIndex)
+
+    def selectDelayRange(self, fr, to):
+        """Returns a lazy view containing only delays within [fr, to].
+        """
+        return self.selectDelays((self.delays >= fr) & (self.delays <= to))
+
+    def selectStates(self, states):
+        """Returns a lazy view containing only the given shutter states.
+
+        :param list states: Shutter states (0 = ground state, 1 = excited state), not indices.
+        """
+        return FSRSDataset(self.source, self.basename, self.setIndex, self.delayIndex, self.stateIndex[np.in1d(self.states, np.atleast_1d(states))])
+
+    # ----------------------------------------------------------------------------------------------------------------------
+    # streaming access
+    def iterSets(self):
+        """Iterate over the sets; yields (set number, (delay, state, pixel, column) array), reading one set at a time.
+        """
+        for i, s in enumerate(self.sets):
+            yield s, self[i]
+
+    def sum(self):
+        """Returns a tuple (sum, count) over all sets, ignoring missing spectra. Both arrays have shape (delay, state, pixel, column).
+        """
+        total = np.zeros(self.shape[1:])
+        count = np.zeros(self.shape[1:], dtype=int)
+        for s, chunk in self.iterSets():
+            valid = np.isfinite(chunk)
+            total[valid] += chunk[valid]
+            count += valid
+        return total, count
+
+    def mean(self):
+        """Returns the average over all sets as (delay, state, pixel, column) array. Missing spectra are ignored; NaN where no data are available.
+        """
+        total, count = self.sum()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+    def std(self):
+        """Returns the standard deviation over all sets (ddof = 1) as (delay, state, pixel, column) array, computed in a single streaming pass.
+        """
+        N = np.zeros(self.shape[1:], dtype=int)
+        mean = np.zeros(self.shape[1:])
+        M2 = np.zeros(self.shape[1:])
+        for s, chunk in self.iterSets():
+            valid = np.isfinite(chunk)
+            N += valid
+            delta = np.where(valid, chunk, 0) - mean
+            mean += np.where(valid, delta / np.maximum(N, 1), 0)
+            M2 += np.where(valid, delta * (np.where(valid, chunk, 0) - mean), 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(N > 1, np.sqrt(M2 / np.maximum(N - 1, 1)), np.nan)
+
+    def load(self):
+        """Read the whole view into memory and return it as `FSRSLoader.FSRSData` instance.
+        """
+        return loader.FSRSData(self[:], self.sets, self.delays, self.states, self.basename, self.type)
+
+
+# ##########################################################################################################################
+def openDataset(filename):
+    """Open a scan lazily.
+
+    :param str filename: Filename of a binary container (without extension) or basename of legacy ASCII files including the path.
+        If both exist, e.g. the basename together with its `basename_cache` sidecar, the container is only used when it is up to date.
+    :returns: FSRSDataset instance.
+    """
+    if loader.isContainer(filename):
+        return FSRSDataset(ContainerSource(filename), filename)
+
+    # use the up-to-date sidecar cache of a legacy scan if there is one
+    cachename = filename + "_cache"
+    if loader.isContainer(cachename):
+        try:
+            data, header = loader.loadContainer(cachename, mmap=True)
+            if header.get("signature") == loader.getScanSignature(filename, loader.findFSRSFiles(filename)):
+                return FSRSDataset(ContainerSource(cachename), filename)
+        except (IOError, ValueError, KeyError):
+            pass
+
+    return FSRSDataset(LegacySource(filename), filename)
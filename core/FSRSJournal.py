@@ -0,0 +1,224 @@
+"""
+.. module: FSRSJournal
+   :platform: Windows
+.. moduleauthor:: Daniel R. Dietze <daniel.dietze@berkeley.edu>
+
+FSRSJournal keeps a persistent record of the positions of all axis modules, so that the last known position and reference offset
+(e.g. the position of time zero) of each axis can be restored after pyFSRS was closed or has crashed.
+
+The journal is an append-only text file with one TAB-delimited record per line::
+
+    time    axis    kind    value
+
+where kind is `cmd` for a commanded position (`goto`), `pos` for a confirmed position (the axis has stopped) and `offset` for the reference offset.
+Records are buffered and written to disk (flush + fsync) at most every `syncInterval` seconds and always when the journal is closed, so a crash
+loses at most the records of the last interval. Incomplete lines are ignored when reading. When the journal is opened, it is compacted to the
+last state of each axis.
+
+The `Axis` base class records its positions automatically once `Axis.restoreFromJournal` has been called, which the pyFSRS app does for
+all axis modules at startup.
+
+Example usage::
+
+    import core.FSRSJournal as journal
+
+    j = journal.getJournal()
+    j.record("Dummy Axis", "cmd", 1000.0)
+    print j.getLastPosition("Dummy Axis")     # (1000.0, False)
+    journal.closeJournal()
+
+..
+   This file is part of the pyFSRS app.
+
+   This program is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+   Copyright 2014-2016 Daniel Dietze <daniel.dietze@berkeley.edu>.
+"""
+import os
+import time
+import threading
+
+import FSRSutils as cutils
+
+
+journalFile = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "positionJournal.txt")   #: default journal in the pyFSRS directory
+journalKinds = ["cmd", "pos", "offset"]
+
+
+# ##########################################################################################################################
+# reading / writing records
+def formatRecord(t, axis, kind, value):
+    """Returns a single journal line.
+    """
+    return "%.3f\t%s\t%s\t%r\n" % (t, axis.replace("\t", " "), kind, float(value))
+
+
+def readJournal(filename):
+    """Read a journal file and return the last state of each axis.
+
+    :param str filename: Filename of the journal.
+    :returns: Dictionary mapping axis name to a dictionary {kind: (time, value)}. Empty if the file does not exist.
+    """
+    state = {}
+    if not os.path.isfile(filename):
+        return state
+
+    with open(filename, "r") as f:
+        for line in f:
+            # skip incomplete or corrupted records, e.g., the last line after a crash
+            if not line.endswith("\n"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) != 4 or fields[2] not in journalKinds:
+                continue
+            try:
+                t, value = float(fields[0]), float(fields[3])
+            except ValueError:
+                continue
+            state.setdefault(fields[1], {})[fields[2]] = (t, value)
+    return state
+
+
+# ##########################################################################################################################
+class PositionJournal():
+    """Buffered, append-only position journal.
+
+    :param str filename: Filename of the journal (default = `journalFile`).
+    :param float syncInterval: Max. time in s between writing a record and syncing it to disk (default = 1 s).
+    """
+    def __init__(self, filename=journalFile, syncInterval=1.0):
+        self.filename = filename
+        self.syncInterval = syncInterval
+        self.lock = threading.Lock()
+        self.timer = None
+        self.dirty = False
+        self.lastSync = 0.0
+        self.f = None
+
+        self.state = readJournal(filename)
+        try:
+            self.compact()
+            self.f = open(filename, "a")
+        except (IOError, OSError) as e:
+            print "WARNING: cannot write position journal %s:" % filename, e
+
+    def compact(self):
+        """Rewrite the journal file with only the last state of each axis.
+        """
+        with open(self.filename + ".tmp", "w") as f:
+            for axis in sorted(self.state):
+                for kind in journalKinds:
+                    if kind in self.state[axis]:
+                        f.write(formatRecord(self.state[axis][kind][0], axis, kind, self.state[axis][kind][1]))
+            f.flush()
+            os.fsync(f.fileno())
+        cutils.replaceFile(self.filename + ".tmp", self.filename)
+
+    def record(self, axis, kind, value):
+        """Append a record to the journal.
+
+        :param str axis: Name of the axis.
+        :param str kind: 'cmd' for commanded positions, 'pos' for confirmed positions or 'offset' for the reference offset.
+        :param float value: Position or offset in axis units.
+        """
+        if kind not in journalKinds:
+            raise ValueError("Unknown journal record kind: %s." % kind)
+        t = time.time()
+        with self.lock:
+            self.state.setdefault(axis, {})[kind] = (t, float(value))
+            if self.f is None:
+                return
+            self.f.write(formatRecord(t, axis, kind, value))
+            self.dirty = True
+
+            # sync now or schedule a sync at the end of the current interval
+            if t - self.lastSync >= self.syncInterval:
+                self._sync()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.syncInterval - (t - self.lastSync), self.sync)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def sync(self):
+        """Write all buffered records to disk.
+        """
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.f is not None and self.dirty:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.dirty = False
+        self.lastSync = time.time()
+
+    def close(self):
+        """Sync and close the journal. Further records are kept in memory only.
+        """
+        with self.lock:
+            self._sync()
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+
+    def getState(self, axis):
+        """Returns the last state of the given axis as dictionary {kind: (time, value)}.
+        """
+        with self.lock:
+            return dict(self.state.get(axis, {}))
+
+    def getLastPosition(self, axis):
+        """Returns the last known position of the given axis.
+
+        :returns: Tuple (position, confirmed) or None if the axis is not in the journal. `confirmed` is False if the last record is a
+            commanded position that was never confirmed, e.g. because pyFSRS crashed during the move.
+        """
+        state = self.getState(axis)
+        if "cmd" in state and ("pos" not in state or state["cmd"][0] > state["pos"][0]):
+            return state["cmd"][1], False
+        if "pos" in state:
+            return state["pos"][1], True
+        return None
+
+    def getOffset(self, axis):
+        """Returns the last reference offset of the given axis or None.
+        """
+        state = self.getState(axis)
+        return state["offset"][1] if "offset" in state else None
+
+
+# ##########################################################################################################################
+# shared journal used by all axis modules
+journal = None
+
+
+def getJournal():
+    """Returns the shared position journal, which is opened on first use.
+    """
+    global journal
+    if journal is None:
+        journal = PositionJournal()
+    return journal
+
+
+def closeJournal():
+    """Sync and close the shared position journal.
+    """
+    global journal
+    if journal is not None:
+        journal.close()
+        journal = None
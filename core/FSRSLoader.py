@@ -0,0 +1,304 @@
+"""
+.. module: FSRSLoader
+   :platform: Windows
+.. moduleauthor:: Daniel R. Dietze <daniel.dietze@berkeley.edu>
+
+FSRSLoader assembles the individual ASCII files written by the FSRS-modules into a single labeled data array.
+
+A measurement consists of many files named according to the historical Mathies lab convention (see `FSRSutils.formatFSRSFilename`),
+plus an optional `basename_timepoints.txt` containing the exact stage positions. The loader finds all files belonging to a basename,
+reads them in parallel using a process pool and returns an `FSRSData` object holding a (set, delay, state, pixel, column) array.
+The columns are the three columns (A, B, C) of the original files. Missing combinations, e.g. ground state spectra at delays other than zero, are filled with NaN.
+
+Parsed results are cached in a binary sidecar container next to the data (`basename_cache.npy` and `basename_cache.json`), so that
+subsequent loads only have to check the file signatures. The container format is a plain numpy array file plus a JSON header
+describing the axes and is also used by other parts of pyFSRS.
+
+Example usage::
+
+    import core.FSRSLoader as loader
+
+    if __name__ == '__main__':      # required on Windows when using the process pool
+        d = loader.loadFSRS("C:/data/sample1")
+        print d.data.shape, d.delays
+        avg = d.mean()               # average over all sets
+
+..
+   This file is part of the pyFSRS app.
+
+   This program is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+   Copyright 2014-2016 Daniel Dietze <daniel.dietze@berkeley.edu>.
+"""
+import numpy as np
+import os
+import glob
+import json
+import re
+import multiprocessing
+
+import FSRSutils as cutils
+
+
+# ##########################################################################################################################
+# labeled data container
+class FSRSData():
+    """Labeled FSRS / TA data set as returned by `loadFSRS`.
+
+    :param array data: Data array with shape (set, delay, state, pixel, column).
+    :param list sets: Set numbers along the first axis.
+    :param list delays: Stage positions along the second axis.
+    :param list states: Shutter states along the third axis (0 = ground state, 1 = excited state).
+    :param str basename: Basename of the data set.
+    :param int type: Type of spectra (0 = FSRS, 1 = TA).
+    """
+    def __init__(self, data, sets, delays, states, basename="", type=0):
+        self.data = data
+        self.sets = np.array(sets, dtype=int)
+        self.delays = np.array(delays, dtype=float)
+        self.states = np.array(states, dtype=int)
+        self.basename = basename
+        self.type = type
+
+    def getDelayIndex(self, delay):
+        """Returns the index of the delay closest to `delay`.
+        """
+        return int(np.argmin(np.absolute(self.delays - delay)))
+
+    def getStateIndex(self, state):
+        """Returns the index of the given shutter state or raises a ValueError if the state is not present.
+        """
+        ind = np.where(self.states == state)[0]
+        if len(ind) == 0:
+            raise ValueError("State %d is not present in data set." % state)
+        return int(ind[0])
+
+    def mean(self):
+        """Returns the average over all sets as (delay, state, pixel, column) array. Missing spectra are ignored.
+        """
+        return np.nanmean(self.data, axis=0)
+
+    def getSpectrum(self, delay, state=1, set=None, column=0):
+        """Returns a single spectrum.
+
+        :param float delay: Stage position; the closest available delay is used.
+        :param int state: Shutter state (default = 1, excited state).
+        :param int set: Number of the set or None to average over all sets (default).
+        :param int column: Column of the original file (0 = A, 1 = B, 2 = C).
+        :returns: 1d-array with one value per pixel.
+        """
+        i = self.getDelayIndex(delay)
+        j = self.getStateIndex(state)
+        if set is None:
+            return np.nanmean(self.data[:, i, j, :, column], axis=0)
+        k = int(np.where(self.sets == set)[0][0])
+        return self.data[k, i, j, :, column]
+
+
+# ##########################################################################################################################
+# binary container format
+# a container consists of a numpy array file (filename.npy), which can be memory mapped, and a JSON header (filename.json)
+def saveContainer(filename, data, **header):
+    """Save a numpy array together with a JSON header describing it.
+
+    The array is written to `filename.npy` and the header to `filename.json`. Both files are first written to temporary files and then renamed,
+    so that an interrupted write never leaves a corrupted container behind.
+
+    :param str filename: Filename of the container without extension.
+    :param array data: Numpy array to save.
+    :param mixed header: Additional keyword arguments are stored in the header. Values have to be JSON serializable.
+    """
+    header["shape"] = list(data.shape)
+    header["dtype"] = str(data.dtype)
+
+    with open(filename + ".npy.tmp", "wb") as f:    # pass a file object, otherwise np.save appends .npy
+        np.save(f, data)
+    with open(filename + ".json.tmp", "w") as f:
+        json.dump(header, f, indent=1)
+
+    cutils.replaceFile(filename + ".npy.tmp", filename + ".npy")
+    cutils.replaceFile(filename + ".json.tmp", filename + ".json")
+
+
+def loadContainer(filename, mmap=False):
+    """Load a container written by `saveContainer`.
+
+    :param str filename: Filename of the container without extension.
+    :param bool mmap: If True, the array is memory mapped read-only instead of being loaded into memory (default = False).
+    :returns: Tuple (data, header).
+    """
+    with open(filename + ".json", "r") as f:
+        header = json.load(f)
+    data = np.load(filename + ".npy", mmap_mode="r" if mmap else None)
+    return data, header
+
+
+def isContainer(filename):
+    """Returns True if a container with the given filename (without extension) exists.
+    """
+    return os.path.isfile(filename + ".npy") and os.path.isfile(filename + ".json")
+
+
+# ##########################################################################################################################
+# file discovery
+def escapeGlob(pathname):
+    """Escape the wildcard characters in `pathname` for use with `glob`.
+    """
+    drive, pathname = os.path.splitdrive(pathname)
+    return drive + re.sub(r"([*?[])", r"[\1]", pathname)
+
+
+def findFSRSFiles(basename):
+    """Find all data files belonging to the given basename.
+
+    :param str basename: Basename of the data set including the path.
+    :returns: List of tuples (filename, type, step, set, shutter), sorted by filename.
+    """
+    files = []
+    for f in sorted(glob.glob(escapeGlob(basename) + "_*")):
+        p = cutils.parseFSRSFilename(f)
+        if p is not None and p[1] == basename:
+            files.append((f, p[0], p[2], p[3], p[4]))
+    return files
+
+
+def findFSRSBasenames(directory):
+    """Returns a sorted list of all basenames (including the path) of FSRS / TA data sets found in the given directory.
+    """
+    basenames = set()
+    for f in os.listdir(directory):
+        p = cutils.parseFSRSFilename(os.path.join(directory, f))
+        if p is not None:
+            basenames.add(p[1])
+    return sorted(basenames)
+
+
+def getFileSignature(files):
+    """Returns a list of (name, size, mtime) tuples for the given filenames, used to validate cached data.
+    """
+    sig = []
+    for f in files:
+        st = os.stat(f)
+        sig.append([os.path.split(f)[-1], st.st_size, int(st.st_mtime)])
+    return sig
+
+
+def getScanSignature(basename, files):
+    """Returns the file signature of a scan, i.e. of all data files plus the timepoints file, as stored in the sidecar cache.
+
+    :param str basename: Basename of the data set.
+    :param list files: List of files as returned by `findFSRSFiles`.
+    """
+    sources = [f[0] for f in files]
+    for extra in ["_timepoints.txt"]:
+        if os.path.isfile(basename + extra):
+            sources.append(basename + extra)
+    return getFileSignature(sources)
+
+
+def getExactDelays(basename, files):
+    """Map the integer stage positions encoded in the filenames back onto the exact positions stored in `basename_timepoints.txt`.
+
+    :param str basename: Basename of the data set.
+    :param list files: List of files as returned by `findFSRSFiles`.
+    :returns: Dictionary mapping filename to stage position. If there is no timepoints file, the encoded integer positions are used.
+    """
+    delays = dict((f[0], float(f[2])) for f in files)
+
+    if not os.path.isfile(basename + "_timepoints.txt"):
+        return delays
+
+    points = np.atleast_1d(np.loadtxt(basename + "_timepoints.txt"))
+    if points.ndim > 1:    # got several columns
+        points = points[:, 0]
+
+    # the filename is the only reliable key, so regenerate it (without the set number) once for every stage position and state
+    exact = {}
+    for type, shutter in set((f[1], f[4]) for f in files):
+        for t in points:
+            exact.setdefault(cutils.formatFSRSFilename(type, basename, t, 0, shutter)[:-1], float(t))
+
+    for f, type, step, n, shutter in files:
+        if f.endswith(str(n)) and f[:-len(str(n))] in exact:
+            delays[f] = exact[f[:-len(str(n))]]
+    return delays
+
+
+# ##########################################################################################################################
+# loading
+def _loadFile(filename):
+    """Worker function for the process pool; has to be on module level to be picklable.
+    """
+    return np.loadtxt(filename, ndmin=2)
+
+
+def loadFSRS(basename, processes=None, cache=True):
+    """Load all data files belonging to `basename` into a labeled array.
+
+    .. note:: On Windows, the process pool requires that the calling script protects its entry point with `if __name__ == '__main__'`.
+
+    :param str basename: Basename of the data set including the path.
+    :param int processes: Number of worker processes. None uses one process per CPU, 1 loads the files serially in the calling process.
+    :param bool cache: If True (default), use and update the binary sidecar cache `basename_cache`.
+    :returns: FSRSData instance.
+    """
+    files = findFSRSFiles(basename)
+    if len(files) == 0:
+        raise ValueError("No data files found for basename %s." % basename)
+
+    signature = getScanSignature(basename, files)
+
+    # check whether cached data is still valid
+    cachename = basename + "_cache"
+    if cache and isContainer(cachename):
+        try:
+            data, header = loadContainer(cachename)
+            if header.get("signature") == signature:
+                return FSRSData(data, header["sets"], header["delays"], header["states"], basename, header["type"])
+        except (IOError, ValueError, KeyError):
+            pass    # corrupted cache, just reload
+
+    # read files, either in parallel or serially
+    filenames = [f[0] for f in files]
+    if processes == 1:
+        spectra = map(_loadFile, filenames)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            spectra = pool.map(_loadFile, filenames, chunksize=max(1, len(filenames) // (4 * multiprocessing.cpu_count())))
+        finally:
+            pool.close()
+            pool.join()
+
+    # build axes
+    delays_map = getExactDelays(basename, files)
+    sets = sorted(set(f[3] for f in files))
+    delays = sorted(set(delays_map.values()))
+    states = sorted(set(f[4] for f in files))
+    type = files[0][1]
+
+    Npx, Ncol = spectra[0].shape
+    data = np.ones((len(sets), len(delays), len(states), Npx, Ncol)) * np.nan
+    for f, d in zip(files, spectra):
+        if d.shape != (Npx, Ncol):
+            raise ValueError("File %s has shape %s, expected %s." % (f[0], str(d.shape), str((Npx, Ncol))))
+        data[sets.index(f[3]), delays.index(delays_map[f[0]]), states.index(f[4])] = d
+
+    if cache:
+        try:
+            saveContainer(cachename, data, sets=sets, delays=delays, states=states, type=type, signature=signature)
+        except (IOError, OSError):
+            print "WARNING: could not write cache for", basename
+
+    return FSRSData(data, sets, delays, states, basename, type)
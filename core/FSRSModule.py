@@ -29,7 +29,9 @@ import wx
 import imp
 import os
 import threading
+import numpy as np
 import FilePickerCtrl
+import FSRSJournal
 
 
 # ##########################################################################################################################
@@ -662,6 +664,15 @@ class Camera(FSRSModule):
         """
         return [[0] * N, [0] * N, [0] * N]
 
+    def acquisitionTime(self, N):
+        """Returns the estimated time in s needed by `readNframes` to read N frames. Used to estimate the duration of scans.
+
+        Overwrite this function if the camera is not running at 1kHz or has additional overhead, e.g. due to discarded frames.
+
+        :param int N: Number of frames to read.
+        """
+        return N * 1e-3
+
 
 # ##########################################################################################################################
 # base class for any output device
@@ -671,6 +682,7 @@ class Output(FSRSModule):
     def __init__(self):
         FSRSModule.__init__(self)
         self.type = "output"
+        self.switchTime = 0.0       #: time in s needed for a write to take effect, e.g. for a mechanical shutter to open or close
 
     # this is the only additional function an output device has to have
     # write some value to the output
@@ -686,35 +698,243 @@ class Output(FSRSModule):
 # base class for any axis / stage device
 class Axis(FSRSModule):
     """Base class for any axis or stage device.
+
+    The attributes `velocity`, `acceleration` and `settleTime` describe the motion of the axis and are used by `travelTime` to
+    estimate how long a move takes, e.g., when comparing different orderings of the scan points. Derived classes should adjust them
+    to the actual hardware settings.
+
+    Derived classes implement the device specific functions `devicePos`, `deviceGoto` and `deviceIsMoving`, which are called by `pos`,
+    `goto` and `is_moving`. Once `restoreFromJournal` has been called, the latter record commanded and confirmed positions (`is_moving` returns
+    False after a move) in the position journal (see `FSRSJournal`). Moves that do not go through `goto`, e.g. homing when connecting, should
+    be recorded with `recordPosition`. Modules having a `ready` attribute record positions only while it is True.
+    Devices that lose their position when pyFSRS is restarted should overwrite `restorePosition`; devices with several motors should
+    overwrite `getJournalKey` and `getJournalKeys`.
+
+    Positions passed to `goto` and returned by `pos` are relative to a reference offset, e.g. the position of time zero, which is kept
+    per journal key and stored in the position journal. Modules may offer a button with event `onSetOffset` to set the offset to the
+    current position and a label 't0 Offset' to show it. The device specific functions and the journal use absolute positions.
+
+    Scans that visit a known sequence of positions upload it once with `load_trajectory` and advance with `next_point`. Controllers that
+    support queued moves can overwrite these functions to avoid the per-step command overhead or to advance on their own; the
+    default implementation simply calls `goto` for each point.
     """
     def __init__(self):
         FSRSModule.__init__(self)
         self.type = "axis"
 
+        self.velocity = 5e4         #: maximum velocity in axis units / s (fs / s for delay stages)
+        self.acceleration = 5e5     #: acceleration in axis units / s^2
+        self.settleTime = 0.1       #: additional time in s the axis needs to settle after each move
+
+        self.offsets = {}           #: reference offsets in axis units by journal key, e.g. the position of time zero; see `setOffset`
+        self.journal = None         #: position journal; None until `restoreFromJournal` is called
+        self.moveConfirmed = True
+
+        self.trajectoryTriggers = ["software"]     #: trigger modes supported by `load_trajectory`
+        self.trajectory = None
+        self.trajectoryIndex = -1
+        self.trajectoryDwell = 0.0
+        self.trajectoryTrigger = "software"
+
     # return current position
     def pos(self):
-        """Return current position.
+        """Return current position relative to the reference offset.
+        """
+        return self.devicePos() - self.getOffset()
+
+    # goto new position
+    def goto(self, pos):
+        """Go to specified position relative to the reference offset. The command is recorded in the position journal before the axis starts
+        moving, so that an interrupted move is recognized at the next start.
+        """
+        pos = pos + self.getOffset()
+        self.recordPosition(pos, False)
+        self.deviceGoto(pos)
+
+    # should return True if stage is still moving
+    def is_moving(self):
+        """Return True if stage is moving, otherwise False. The first time the axis is found at rest after a move, its position is
+        recorded in the position journal.
+        """
+        moving = self.deviceIsMoving()
+        if not moving and not self.moveConfirmed:
+            self.moveConfirmed = True
+            if self.journal is not None and getattr(self, "ready", True):
+                self.recordPosition(self.devicePos(), True)
+        return moving
+
+    def devicePos(self):
+        """Return current absolute position.
 
         .. important:: This function has to be overwritten by any derived motor class to implement the device specific code.
         """
         return 0
 
-    # goto new position
-    def goto(self, pos):
-        """Go to specified position.
+    def deviceGoto(self, pos):
+        """Go to specified absolute position.
 
         .. important:: This function has to be overwritten by any derived motor class to implement the device specific code.
         """
         pass
 
-    # should return True if stage is still moving
-    def is_moving(self):
+    def deviceIsMoving(self):
         """Return True if stage is moving, otherwise False.
 
         .. important:: This function has to be overwritten by any derived motor class to implement the device specific code.
         """
         return False
 
+    # estimated time for a move
+    def travelTime(self, fr, to):
+        """Return the estimated time in s needed to move from `fr` to `to`, using a trapezoidal velocity profile plus settling time.
+
+        Short moves never reach the maximum velocity and follow a triangular profile instead. A move of zero length takes no time.
+        Works on scalars as well as on arrays of start and end positions.
+
+        :param float fr: Start position(s).
+        :param float to: End position(s).
+        :returns: Travel time(s) in s.
+        """
+        d = np.absolute(np.asarray(to, dtype=float) - np.asarray(fr, dtype=float))
+        v = float(self.velocity)
+        a = float(self.acceleration)
+        t = np.where(d < v**2 / a, 2.0 * np.sqrt(d / a), d / v + v / a)
+        return np.where(d > 0, t + self.settleTime, 0.0)
+
+    # ----------------------------------------------------------------------------------------------------------------------
+    # position journal
+    def getJournalKey(self):
+        """Return the name under which the current position is stored in the position journal (default = module name).
+        """
+        return self.name
+
+    def getJournalKeys(self):
+        """Return the names of all motors of this module in the position journal (default = [`getJournalKey()`]).
+        """
+        return [self.getJournalKey()]
+
+    def restorePosition(self, pos, key):
+        """Set the position of the device to `pos` without moving it; called by `restoreFromJournal` for each journal key.
+
+        The default implementation does nothing, which is fine for devices that keep their position, e.g., absolute encoders.
+
+        :param float pos: Last known absolute position in axis units.
+        :param str key: Journal key as returned by `getJournalKeys`.
+        """
+        pass
+
+    def restoreFromJournal(self, journal=None):
+        """Attach the position journal and restore the reference offsets and the last known positions.
+
+        The pyFSRS app calls this function for all axis modules after they have been initialized. Devices that need the position earlier,
+        e.g., when connecting to the hardware, may call it themselves. Only the first call has an effect.
+
+        :param PositionJournal journal: Journal to use (default = the shared journal, see `FSRSJournal.getJournal`).
+        """
+        if self.journal is not None:
+            return
+        self.journal = journal if journal is not None else FSRSJournal.getJournal()
+
+        for key in self.getJournalKeys():
+            offset = self.journal.getOffset(key)
+            if offset is not None:
+                self.offsets[key] = offset
+
+            last = self.journal.getLastPosition(key)
+            if last is None:
+                continue
+            if not last[1]:
+                print "WARNING: last move of %s to %g was not confirmed; the position may be wrong." % (key, last[0])
+            self.restorePosition(last[0], key)
+        self.updateOffset()
+
+    def recordPosition(self, pos, confirmed=True, key=None):
+        """Record a position in the position journal, if attached. After a commanded position, the next call to `is_moving` that returns
+        False records the position that was actually reached.
+
+        :param float pos: Absolute position in axis units.
+        :param bool confirmed: True if the axis has reached this position, False for commanded positions.
+        :param str key: Journal key (default = `getJournalKey()`).
+        """
+        if not confirmed:
+            self.moveConfirmed = False
+        if self.journal is not None and getattr(self, "ready", True):
+            self.journal.record(key if key is not None else self.getJournalKey(), "pos" if confirmed else "cmd", pos)
+
+    # ----------------------------------------------------------------------------------------------------------------------
+    # reference offset
+    def getOffset(self, key=None):
+        """Return the reference offset in axis units (default = 0).
+
+        :param str key: Journal key (default = `getJournalKey()`).
+        """
+        return self.offsets.get(key if key is not None else self.getJournalKey(), 0.0)
+
+    def setOffset(self, offset, key=None):
+        """Set the reference offset, e.g. the position of time zero, and record it in the position journal.
+
+        :param float offset: Absolute position in axis units that becomes the zero position.
+        :param str key: Journal key (default = `getJournalKey()`).
+        """
+        key = key if key is not None else self.getJournalKey()
+        self.offsets[key] = offset
+        if self.journal is not None:
+            self.journal.record(key, "offset", offset)
+        self.updateOffset()
+
+    def updateOffset(self, event=None):
+        """Show the reference offset of the current motor in the 't0 Offset' label, if the module has one.
+        """
+        try:
+            self.getPropertyByLabel("t0 offset").setValue("%.f" % self.getOffset())
+        except ValueError:
+            pass
+
+    def onSetOffset(self, event):
+        """Set the reference offset to the current position, which becomes the new zero position.
+        """
+        self.setOffset(self.devicePos())
+
+    # ----------------------------------------------------------------------------------------------------------------------
+    # trajectories
+    def load_trajectory(self, points, dwell=0.0, trigger="software"):
+        """Upload a sequence of positions, e.g. all delays of a scan in the order they are measured. The axis does not move yet.
+
+        With `trigger` = 'software', the axis moves to the next point whenever `next_point` is called. Controllers that support queued moves
+        may also advance on their own, either `dwell` seconds after arriving at a point ('timer', started by the first call to `next_point`)
+        or on a hardware trigger ('external'). The trigger modes supported by a device are listed in `trajectoryTriggers`.
+        Use `is_moving` to wait for the axis as usual and `trajectory_index` to get the index of the current point. In mode 'timer',
+        `is_moving` returns False while the axis dwells at a point.
+
+        .. note:: The default implementation supports 'software' only and calls `goto` for each point.
+
+        :param array points: Positions in axis units.
+        :param float dwell: Time in s to stay at each point for trigger mode 'timer'.
+        :param str trigger: Trigger mode ('software', 'timer' or 'external').
+        """
+        if trigger not in self.trajectoryTriggers:
+            raise ValueError("Trigger mode %s is not supported by %s." % (trigger, self.name))
+        self.trajectory = np.atleast_1d(np.array(points, dtype=float))
+        self.trajectoryIndex = -1
+        self.trajectoryDwell = dwell
+        self.trajectoryTrigger = trigger
+
+    def next_point(self):
+        """Move to the next point of the trajectory.
+
+        :returns: Index of the new point or -1 if there is no trajectory or the trajectory is finished.
+        """
+        if self.trajectory is None or self.trajectoryIndex + 1 >= len(self.trajectory):
+            return -1
+        self.trajectoryIndex += 1
+        self.goto(self.trajectory[self.trajectoryIndex])
+        return self.trajectoryIndex
+
+    def trajectory_index(self):
+        """Return the index of the trajectory point the axis is at or moving to (-1 before the first point).
+        """
+        return self.trajectoryIndex
+
 
 # ##########################################################################################################################
 # base class for any valve / stage device
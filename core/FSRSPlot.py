@@ -12,6 +12,12 @@ Further features include lin / log scale for x, y, and z axes (individually) as
 reading data coordinates with mouse cursor, two independent data cursors for exploring line/scatter
 data values and displaying the difference value.
 
+The data layer (coordinate transforms, decimation of lines, rasterization of contour and image plots) is computed by a worker thread
+from a snapshot of the plot state, so that heavy plots do not block the GUI thread; only the finished frame is drawn on the GUI thread.
+
+Plots can be rendered offscreen at any size and saved as PNG files with `saveImage`. This works also for canvases that are never shown,
+e.g. a `PlotFrame` that is created without calling `Show`, so that unattended measurements can write preview images.
+
 Example usage::
 
     import wx
@@ -59,6 +65,315 @@ Example usage::
 import wx
 import numpy as np
 import itertools
+import time
+import threading
+from contextlib import contextmanager
+
+import FSRSutils as cutils
+
+
+# ##########################################################################################################################
+# streaming data for live line / scatter plots
+class LineSeries():
+    """Container for x/y data of a line or scatter plot that grows point by point, see `FSRSPlot.addSeries`.
+
+    The data are stored in fixed size chunks, so appending is O(1) independent of the number of points already stored. The extent of each
+    completed chunk is stored, so that the extent of the whole series is obtained without scanning all points.
+    Optionally, only the most recent points (capacity) or the points within a rolling x-window (window) are kept; older chunks are discarded.
+
+    :param int capacity: Maximum number of points to display or None for unlimited (default).
+    :param float window: Width of a rolling x-window, i.e., only points with x >= last x - window are displayed, or None (default).
+        Requires monotonically increasing x-values, e.g. time stamps or sample numbers.
+    :param str type: 'line' or 'scatter' (default = 'line').
+    :param int chunksize: Number of points per chunk (default = 4096).
+    """
+    def __init__(self, capacity=None, window=None, type='line', chunksize=4096):
+        self.capacity = capacity
+        self.window = window
+        self.type = type
+        self.chunksize = chunksize
+        self.clear()
+
+    def clear(self):
+        """Remove all points.
+        """
+        self.chunks = []        # list of chunksize x 2 arrays
+        self.extents = []       # extent (xmin, xmax, ymin, ymax) of each completed chunk
+        self.fill = 0           # number of points in the last chunk
+        self.length = 0         # total number of stored points
+
+    def __len__(self):
+        return self.getRange()[1] - self.getRange()[0]
+
+    def append(self, x, y):
+        """Append one or more points.
+
+        :param mixed x: Single x-value or array.
+        :param mixed y: Single y-value or array with same shape as x.
+        """
+        p = np.transpose([np.atleast_1d(np.array(x, dtype=float)), np.atleast_1d(np.array(y, dtype=float))])
+        while len(p) > 0:
+            if len(self.chunks) == 0 or self.fill == self.chunksize:
+                if len(self.chunks) > 0:
+                    self.extents.append(self.getChunkExtent(self.chunks[-1]))
+                self.chunks.append(np.zeros((self.chunksize, 2)))
+                self.fill = 0
+            n = min(len(p), self.chunksize - self.fill)
+            self.chunks[-1][self.fill:self.fill + n] = p[:n]
+            self.fill += n
+            self.length += n
+            p = p[n:]
+
+        # discard chunks that are no longer visible
+        while len(self.extents) > 0:
+            if self.capacity is not None and self.length - self.chunksize >= self.capacity:
+                pass
+            elif self.window is not None and self.extents[0][1] < self.chunks[-1][self.fill - 1, 0] - self.window:
+                pass
+            else:
+                break
+            self.chunks.pop(0)
+            self.extents.pop(0)
+            self.length -= self.chunksize
+
+    def getChunkExtent(self, chunk):
+        """Used internally to get the extent (xmin, xmax, ymin, ymax) of a chunk, ignoring NaN.
+        """
+        with np.errstate(invalid="ignore"):
+            return (np.nanmin(chunk[:, 0]), np.nanmax(chunk[:, 0]), np.nanmin(chunk[:, 1]), np.nanmax(chunk[:, 1]))
+
+    def getRange(self):
+        """Used internally to get the index range [start, stop) of the visible points within the stored points.
+        """
+        start = 0
+        if self.capacity is not None:
+            start = max(start, self.length - self.capacity)
+        if self.window is not None and self.length > 0:
+            first = self.chunks[0][:self.chunksize if len(self.chunks) > 1 else self.fill, 0]
+            start = max(start, np.searchsorted(first, self.chunks[-1][self.fill - 1, 0] - self.window))
+        return start, self.length
+
+    def getData(self):
+        """Returns the visible points as Nx2 array.
+        """
+        if self.length == 0:
+            return np.zeros((0, 2))
+        start, stop = self.getRange()
+        data = np.concatenate(self.chunks[:-1] + [self.chunks[-1][:self.fill]]) if len(self.chunks) > 1 else self.chunks[0][:self.fill]
+        return data[start:stop]
+
+    def getExtent(self):
+        """Returns the extent (xmin, xmax, ymin, ymax) of the visible points or None if there are none.
+        Only the first (partially visible) and the last (incomplete) chunk are scanned.
+        """
+        start, stop = self.getRange()
+        if stop - start == 0:
+            return None
+        if len(self.chunks) == 1:
+            ext = [self.getChunkExtent(self.chunks[0][start:self.fill])]
+        else:
+            ext = [self.getChunkExtent(self.chunks[0][start:])] + self.extents[1:] + [self.getChunkExtent(self.chunks[-1][:self.fill])]
+        ext = np.array(ext)
+        if np.all(np.isnan(ext)):
+            return None
+        return (np.nanmin(ext[:, 0]), np.nanmax(ext[:, 1]), np.nanmin(ext[:, 2]), np.nanmax(ext[:, 3]))
+
+
+# ##########################################################################################################################
+# rendering of the data layer
+class RenderState():
+    """Snapshot of the layout and data of a `FSRSPlot` as taken by `FSRSPlot.getRenderState`.
+
+    The snapshot only holds numbers and numpy arrays, so `render` can run on a worker thread while the canvas continues to receive new data.
+    It computes the screen coordinates of all line / scatter plots and rasterizes contour and image plots into a single RGBA frame;
+    the result is drawn by `FSRSPlot.drawScene` on the GUI thread.
+    """
+    def __init__(self):
+        self.version = 0
+        self.axesKey = None
+        self.size = (0, 0)
+        self.dcleft, self.dctop, self.dcright, self.dcbottom = 0, 0, 0, 0
+        self.map_ax, self.map_bx, self.map_ay, self.map_by = 1, 0, 1, 0
+        self.logx, self.logy = False, False
+        self.bgcolor = (255, 255, 255)
+        self.contours = []      # list of (x, y, colors) as returned by FSRSPlot.prepareContour
+        self.images = []        # list of (xmin, xmax, ymin, ymax, index) with index into palette
+        self.palette = None     # palette of the image plots
+        self.lines = []         # list of (data, type)
+
+        # results
+        self.raster = None      # RGBA array covering the plot area or None if there are no contour and image plots
+        self.points = []        # list of (x, y, type) screen coordinates of the line / scatter plots
+        self.error = None
+
+    def render(self):
+        """Compute the data layer. Returns the state itself.
+        """
+        if len(self.contours) > 0 or len(self.images) > 0:
+            self.raster = np.zeros((self.dcbottom - self.dctop + 1, self.dcright - self.dcleft + 1, 4), dtype=np.uint8)
+            if len(self.contours) > 0:
+                self.rasterizeContours(self.raster)
+            self.rasterizeImages(self.raster)
+        self.points = [self.getScreenPoints(data, type) + (type, ) for data, type in self.lines]
+        return self
+
+    def data2screen(self, x, y):
+        """Convert data coordinates (arrays) to screen coordinates, see `FSRSPlot.data2screen`.
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.logx:
+                x = np.nan_to_num(np.log10(x))
+            if self.logy:
+                y = np.nan_to_num(np.log10(y))
+        return (self.map_ax * x + self.map_bx).astype(int), (self.map_ay * y + self.map_by).astype(int)
+
+    def getScreenPoints(self, data, type='line'):
+        """Convert line/scatter data to screen coordinates and reduce them to what is visible at the current resolution.
+
+        Invalid (NaN, inf) points are skipped. When the x-values of a line are sorted and there are more points than pixel columns, only the points within
+        the visible x-range are kept and decimated to first, min, max and last value per pixel column. This preserves the envelope of the trace, including narrow spikes.
+        Scatter plots are reduced to one marker per pixel.
+
+        :param array data: Nx2 array of data points.
+        :param str type: 'line' or 'scatter'.
+        :returns: x, y screen coordinates as integer arrays.
+        """
+        data = np.array(data, dtype=float)
+        data = data[np.all(np.isfinite(data), axis=1)]
+        if len(data) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        x, y = self.data2screen(data[:, 0], data[:, 1])
+
+        width = self.dcright - self.dcleft + 1
+        if type == 'scatter':
+            if len(x) > width:
+                _, ind = np.unique((x.astype(np.int64) << 32) + (y - np.amin(y)), return_index=True)
+                ind = np.sort(ind)
+                x, y = x[ind], y[ind]
+            return x, y
+
+        if len(x) <= 2 * width:
+            return x, y
+
+        # decimation requires monotonic x; reverse descending data
+        dx = np.diff(x)
+        if np.all(dx <= 0):
+            x, y = x[::-1], y[::-1]
+        elif not np.all(dx >= 0):
+            return x, y
+
+        # keep one point outside the plot area on each side so that the line continues to the border
+        i0 = max(np.searchsorted(x, self.dcleft, side="left") - 1, 0)
+        i1 = min(np.searchsorted(x, self.dcright, side="right") + 1, len(x))
+        x, y = x[i0:i1], y[i0:i1]
+        if len(x) <= 2 * width:
+            return x, y
+
+        # reduce each pixel column to first, min, max and last point
+        starts = np.flatnonzero(np.concatenate(([True], x[1:] != x[:-1])))
+        ends = np.concatenate((starts[1:], [len(x)])) - 1
+        ydec = np.transpose([y[starts], np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts), y[ends]]).flatten()
+        xdec = np.repeat(x[starts], 4)
+        return xdec, ydec
+
+    def getPixelCells(self, axis, pixels, screen2data):
+        """Find the contour cell under each pixel along one axis.
+
+        :param array axis: Sorted data axis of the contour plot.
+        :param array pixels: Pixel coordinates along this axis.
+        :param func screen2data: Mapping of pixel coordinates onto (log10 of) data coordinates.
+        :returns: Tuple (index of pixels inside the contour plot, cell index of these pixels).
+        """
+        d = screen2data(pixels.astype(float))
+        cell = np.searchsorted(axis, d, side="right") - 1
+        cell[d == axis[-1]] = len(axis) - 2    # include the last edge
+        inside = np.flatnonzero((cell >= 0) & (cell < len(axis) - 1))
+        return inside, cell[inside]
+
+    def rasterizeContours(self, buf):
+        """Render all contour plots into the RGBA buffer covering the plot area.
+        Instead of drawing every cell, the cell under each pixel is looked up, so the cost depends on the number of pixels and not on the number of cells.
+        The whole plot area is filled with the background color first.
+        """
+        buf[:] = self.bgcolor + (255, )
+
+        px = np.arange(buf.shape[1]) + self.dcleft
+        py = np.arange(buf.shape[0]) + self.dctop
+        for x, y, cols in self.contours:
+            if len(x) < 2 or len(y) < 2:
+                continue
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if self.logx:
+                    x = np.log10(x)
+                if self.logy:
+                    y = np.log10(y)
+            ox, cx = self.getPixelCells(x, px, lambda i: (i - self.map_bx) / self.map_ax)
+            oy, cy = self.getPixelCells(y, py, lambda j: (j - self.map_by) / self.map_ay)
+            buf[oy[:, np.newaxis], ox[np.newaxis, :], :3] = cols[np.ix_(cy, cx)]
+
+    def rasterizeImages(self, buf):
+        """Render all image plots into the RGBA buffer covering the plot area.
+        The pixels of each image are stretched onto the screen by looking up the source pixel of each screen pixel and colored through the palette,
+        so the cost depends only on the number of screen pixels covered.
+        """
+        px = np.arange(buf.shape[1]) + self.dcleft
+        py = np.arange(buf.shape[0]) + self.dctop
+        for x0, x1, y0, y1, index in self.images:
+            if index.shape[0] == 0:
+                continue
+            (i0, i1), (j0, j1) = self.data2screen([x0, x1], [y0, y1])
+            if i0 == i1 or j0 == j1:
+                continue
+            col = np.floor((px - i0) / float(i1 - i0) * index.shape[1]).astype(int)
+            row = np.floor((py - j0) / float(j1 - j0) * index.shape[0]).astype(int)
+            ox = np.flatnonzero((col >= 0) & (col < index.shape[1]))
+            oy = np.flatnonzero((row >= 0) & (row < index.shape[0]))
+            buf[oy[:, np.newaxis], ox[np.newaxis, :], :3] = self.palette[index[np.ix_(row[oy], col[ox])]]
+            buf[oy[:, np.newaxis], ox[np.newaxis, :], 3] = 255
+
+
+class RenderWorker(threading.Thread):
+    """Background thread rendering `RenderState` snapshots. The rendered state is passed to `callback` on the GUI thread.
+    Only the most recent snapshot is kept; submitting a new snapshot replaces one that has not been started yet.
+    """
+    def __init__(self, callback):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.callback = callback
+        self.lock = threading.Condition()
+        self.job = None
+        self.canQuit = False
+
+    def submit(self, state):
+        """Queue a snapshot for rendering.
+        """
+        with self.lock:
+            self.job = state
+            self.lock.notify()
+
+    def stop(self):
+        """Stop the thread after the current snapshot.
+        """
+        with self.lock:
+            self.canQuit = True
+            self.lock.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while self.job is None and not self.canQuit:
+                    self.lock.wait()
+                if self.canQuit:
+                    return
+                state, self.job = self.job, None
+            try:
+                state.render()
+            except Exception as e:
+                state.error = e
+                print "ERROR: could not render plot:", e
+            wx.CallAfter(self.callback, state)
 
 
 # plot panel main class
@@ -67,7 +382,8 @@ class FSRSPlot(wx.Panel):
     for wxPython that not only supports line/scatter plots but also image and contour plots.
 
     I have kept the number of functions to control the layout to a minimum. Rather, the user is
-    encouraged to directly mess with the class member variables. A list of variables and their default values are given in the following::
+    encouraged to directly mess with the class member variables. As axes and data are drawn from cached bitmaps, call `invalidateData(axes=True)`
+    after changing any of them on a visible plot. A list of variables and their default values are given in the following::
 
         # display the cross cursor when mouse is present in plot area
         self.showCross = True
@@ -75,6 +391,9 @@ class FSRSPlot(wx.Panel):
         # display a grid
         self.showGrid = True
 
+        # maximum number of repaints per second (0 = no limit); updates arriving faster are combined
+        self.maxFPS = 25
+
         # linewidth, markerstyle and colors for scatter / line plot
         self.markersize = 2
         self.linewidth = 2
@@ -112,6 +431,10 @@ class FSRSPlot(wx.Panel):
         self.SetWindowStyle(self.GetWindowStyle() | wx.WANTS_CHARS)
         self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
 
+        # timer for delayed redraws when the frame rate is limited
+        self.redrawTimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnRedrawTimer, self.redrawTimer)
+
         # setup widget
         self.initVariables()
 
@@ -131,6 +454,9 @@ class FSRSPlot(wx.Panel):
         # keyboard events
         self.Bind(wx.EVT_KEY_DOWN, self.OnKeyDown)
 
+        # stop render worker
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.OnDestroy)
+
     def initVariables(self):
         """Init internally used variables and parameters.
         """
@@ -139,18 +465,21 @@ class FSRSPlot(wx.Panel):
         # data = [ [[x1, y1], [x2, y2], ...[xN, yN]], [..] ] for line/scatter,
         # data = [ [[x1, x2, ...xN], [y1, y2, ..., yM], [[z11, z12, ...z1N], [z21, ..], ..]] ] for contour and
         # data = [ [[x0, xN], [y0, yN], index] ] for image; x0, xN are min/max values
-        # and type one of "line", "scatter", "contour", and "image"
+        # data = LineSeries instance for streaming data
+        # and type one of "line", "scatter", "contour", "image", and "series"
         self.data = []               # plot data
         self.data_types = []         # type of data stored in self.data
         self.data_extent = []        # list of data ranges [xmin, xmax, ymin, ymax]
-        self.images = []             # list of wx.Bitmap objects
+        self.imageBuffers = []       # list of dictionaries holding z-data and quantized indices of each image, see initImageBuffer
+        self.imageHysteresis = 0.1   # when rows outside the color range are appended, the range is extended by this fraction
 
         # -------------------------
         # internally used variables
 
-        # memory dc for storing contour plots, which are time intensive to replot
-        self.contourDC = wx.MemoryDC()            # this stores the created image
-        self.contourDCValid = False                # False -> redraw the contour plot, True -> copy from memoryDC
+        # cache for contour plots
+        # the colors of the contour cells are kept until the data change (contourDCValid = False)
+        self.contourDCValid = False                # False -> recalculate the cell colors
+        self.contourCells = []                     # list of (x, y, colors) for each contour plot, sorted by x and y
 
         # data min/max and ticks for axis
         self.plotXMin = 0
@@ -176,6 +505,33 @@ class FSRSPlot(wx.Panel):
         self.dcright = 0
         self.dcbottom = 0
 
+        # render cache
+        # the plot is drawn in three layers: the axes layer (background, grid, labels and ticks), which is kept until the axis ranges,
+        # labels or size change; the data layer (axes layer plus all plots), which is kept until the data change; and the overlay layer
+        # (cursors, crosshair and mouse coordinates), which is drawn on every paint
+        self.dataValid = False          # False -> recalculate layout and redraw data layer
+        self.axesKey = None             # layout of the cached axes layer
+        self.axesBitmap = None
+        self.sceneSize = None           # size of the cached data layer
+        self.sceneBitmap = None
+
+        # render worker
+        # the data layer is rasterized from a RenderState snapshot on a worker thread; only one snapshot is rendered at a time
+        self.renderThreaded = True      # False -> render on the GUI thread
+        self.renderVersion = 0          # number of the last snapshot
+        self.renderPending = None       # number of the snapshot being rendered, None if idle
+        self.renderWorker = None        # started with the first paint
+
+        # redraw scheduler
+        # redraw requests are coalesced and the plot is repainted at most maxFPS times per second
+        self.maxFPS = 25                # maximum frame rate; 0 = no limit
+        self.batchDepth = 0             # > 0 while inside batchUpdate
+        self.batchPending = False       # a redraw was requested during batchUpdate
+        self.redrawPending = 0          # time a Refresh was issued that has not been painted yet, 0 if none
+        self.lastPaint = 0              # time of the last paint
+        self.redrawStats = {}
+        self.resetRedrawStats()
+
         # mouse control variables
         self.mousePos = wx.Point()
         self.mouseIn = False
@@ -230,8 +586,19 @@ class FSRSPlot(wx.Panel):
         # each entry consists of a value between 0 (min) and 1 (max) and a color
         # the actual color is generated by linear interpolation between neighboring entries
         # make sure that you sort the entries ascending!
+        # z-values are mapped onto colors using a lookup table that is generated from the colormap by `setColormap`
         self.colormap = []
+        self.lutsize = 4096         # number of entries in the lookup table
+        self.colorLUT = []          # lookup table, lutsize x 3 array of r, g, b values
+        self.nancolor = [255, 255, 255]    # color for NaN and, on logscale, non-positive z values
         self.imgcolormap = []    # version for images with reduced color depth (256)
+
+        # image plots are stored as indices into a palette of imageLevels colors (plus one for NaN), which is built from the colormap
+        # and the display settings; changing the colormap, contrast or gamma only requires a new palette, not a new quantization
+        self.imageLevels = 4096             # number of quantization levels of image plots; at most 65535
+        self.imageContrast = (0.0, 1.0)     # fractions of the color range mapped onto the ends of the colormap
+        self.imageGamma = 1.0               # gamma applied after contrast stretching
+        self.imagePalette = []              # (imageLevels + 1) x 3 array of r, g, b values
         self.setColormap("rgb")  # initialize colormaps
 
         # logscale
@@ -262,6 +629,18 @@ class FSRSPlot(wx.Panel):
         dc = wx.BufferedPaintDC(self)
         self.Draw(dc)
 
+        self.redrawPending = 0
+        self.lastPaint = time.time()
+        self.redrawStats["paints"] += 1
+
+    def OnDestroy(self, event):
+        """Event handler for window destruction. Stops the render worker.
+        """
+        event.Skip()
+        if event.GetEventObject() is self and self.renderWorker is not None:
+            self.renderWorker.stop()
+            self.renderWorker = None
+
     def OnResize(self, event):
         """Event handler for resize event.
         """
@@ -283,7 +662,7 @@ class FSRSPlot(wx.Panel):
             self.mouseX1, _ = self.screen2data(x, y)
 
             # find next line in this direction if the selected trace is not a line
-            if self.data_types[self.mouseN] not in ["line", "scatter"]:
+            if self.data_types[self.mouseN] not in ["line", "scatter", "series"]:
                 mouseN0 = self.mouseN
                 while(1):
                     self.mouseN += 1
@@ -293,7 +672,7 @@ class FSRSPlot(wx.Panel):
                     if self.mouseN >= len(self.data):
                         self.mouseN -= len(self.data)
 
-                    if self.data_types[self.mouseN] in ["line", "scatter"] or self.mouseN == mouseN0:
+                    if self.data_types[self.mouseN] in ["line", "scatter", "series"] or self.mouseN == mouseN0:
                         break
 
     def OnRMouseDown(self, event):
@@ -312,7 +691,7 @@ class FSRSPlot(wx.Panel):
             self.mouseX2, _ = self.screen2data(x, y)
 
             # find next line in this direction if the selected trace is not a line
-            if self.data_types[self.mouseN] not in ["line", "scatter"]:
+            if self.data_types[self.mouseN] not in ["line", "scatter", "series"]:
                 mouseN0 = self.mouseN
                 while(1):
                     self.mouseN += 1
@@ -322,7 +701,7 @@ class FSRSPlot(wx.Panel):
                     if self.mouseN >= len(self.data):
                         self.mouseN -= len(self.data)
 
-                    if self.data_types[self.mouseN] in ["line", "scatter"] or self.mouseN == mouseN0:
+                    if self.data_types[self.mouseN] in ["line", "scatter", "series"] or self.mouseN == mouseN0:
                         break
 
     def OnMouseMove(self, event):
@@ -336,11 +715,11 @@ class FSRSPlot(wx.Panel):
         # if mouse is in data area, refresh the screen to display the new coordinates
         if x > self.dcleft and x < self.dcright and y > self.dctop and y < self.dcbottom:
             self.mouseIn = True
-            self.Refresh()
+            self.requestRedraw()
         else:
             if self.mouseIn:
                 self.mouseIn = False
-                self.Refresh()
+                self.requestRedraw()
 
     def OnMouseWheel(self, event):
         """Event handler for mouse wheel event. This event is used to switch the active line / scatter plot for the cursors.
@@ -364,11 +743,11 @@ class FSRSPlot(wx.Panel):
             if self.mouseN >= len(self.data):
                 self.mouseN -= len(self.data)
 
-            if self.data_types[self.mouseN] in ["line", "scatter"] or self.mouseN == mouseN0:
+            if self.data_types[self.mouseN] in ["line", "scatter", "series"] or self.mouseN == mouseN0:
                 break
 
         if self.mouseX1 is not None or self.mouseX2 is not None:
-            self.Refresh()
+            self.requestRedraw()
 
     def OnKeyDown(self, event):
         """Event handler for key-press event. Handles the following key strokes:
@@ -385,25 +764,26 @@ class FSRSPlot(wx.Panel):
         if c == 'C':    # clear cursors
             self.mouseX1 = None
             self.mouseX2 = None
-            self.Refresh()
+            self.requestRedraw()
         elif c == 'X':
             self.logx = not self.logx
             self.contourDCValid = False
-            self.Refresh()
+            self.invalidateData()
         elif c == 'Y':
             self.logy = not self.logy
             self.contourDCValid = False
-            self.Refresh()
+            self.invalidateData()
         elif c == 'Z':
             self.logz = not self.logz
             self.contourDCValid = False
-            self.Refresh()
+            self.invalidateData()
         elif c == 'M':
             if len(self.data) == 0:
                 return
-            if self.data_types[self.mouseN] in ["line", "scatter"]:
-                self.mouseX1 = self.data[self.mouseN][np.argmax(self.data[self.mouseN][:, 1]), 0]
-                self.Refresh()
+            data = self.getLineData(self.mouseN)
+            if self.data_types[self.mouseN] in ["line", "scatter", "series"] and len(data) > 0:
+                self.mouseX1 = data[np.nanargmax(data[:, 1]), 0]
+                self.requestRedraw()
 
     # DATA HANDLING
     def addImage(self, x, y, z):
@@ -414,23 +794,16 @@ class FSRSPlot(wx.Panel):
         :param array z: Image data, 2d-array.
         :returns: Plot id.
         """
-        # get image width and height
-        h, w = z.shape
-        min, max = np.amin(z), np.amax(z)
-
-        # these are color indices
-        c = (((z.flatten() - min) / (max - min)) * 255).astype(int)
-
-        # append to image list
-        id = len(self.images)
-        self.images.append(wx.BitmapFromBuffer(w, h, self.imgcolormap[c]))
+        # append to image list; the colors are mapped onto the screen when rendering
+        img = len(self.imageBuffers)
+        self.imageBuffers.append(self.initImageBuffer(z))
 
         # append to data list
         id = len(self.data)
-        self.data.append(((np.nanmin(x), np.nanmax(x)), (np.nanmin(y), np.nanmax(y)), id))
+        self.data.append(((np.nanmin(x), np.nanmax(x)), (np.nanmin(y), np.nanmax(y)), img))
         self.data_types.append('image')
         self.data_extent.append((np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y)))
-        self.Refresh()
+        self.invalidateData()
         return id
 
     def addContour(self, x, y, z):
@@ -451,7 +824,7 @@ class FSRSPlot(wx.Panel):
         self.data_types.append('contour')
         self.data_extent.append((np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y)))
         self.contourDCValid = False
-        self.Refresh()
+        self.invalidateData()
         return id
 
     def addLine(self, x, y):
@@ -472,7 +845,7 @@ class FSRSPlot(wx.Panel):
         self.data.append(nd)
         self.data_types.append('line')
         self.data_extent.append((np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y)))
-        self.Refresh()
+        self.invalidateData()
         return id
 
     def addScatter(self, x, y):
@@ -486,6 +859,52 @@ class FSRSPlot(wx.Panel):
         self.data_types[id] = 'scatter'
         return id
 
+    def addSeries(self, capacity=None, window=None, type='line'):
+        """Add an empty line or scatter plot for streaming data. Add points with `appendPoints`.
+
+        In contrast to `setLine`, which replaces all data, new points are appended in O(1), so that live displays have the same cost
+        per new point independent of the number of points already shown.
+
+        :param int capacity: Maximum number of points to display or None for unlimited (default).
+        :param float window: Only display points within a rolling x-window of this width or None (default); requires increasing x-values.
+        :param str type: 'line' or 'scatter' (default = 'line').
+        :returns: Plot id.
+        """
+        id = len(self.data)
+        self.data.append(LineSeries(capacity, window, type))
+        self.data_types.append('series')
+        self.data_extent.append(None)
+        self.invalidateData()
+        return id
+
+    def appendPoints(self, id, x, y):
+        """Append one or more points to a streaming plot created by `addSeries`.
+
+        :param int id: Id or index of series plot.
+        :param mixed x: Single x-value or array.
+        :param mixed y: Single y-value or array with same shape as x.
+        """
+        self.getSeries(id).append(x, y)
+        self.invalidateData()
+
+    def getSeries(self, id):
+        """Returns the `LineSeries` object of a streaming plot, e.g. to clear it or change capacity and window.
+        Call `invalidateData` after changing it directly.
+        """
+        id = abs(int(id))
+        if(id >= len(self.data)):
+            raise ValueError("ID of plot element out of range!")
+        if(self.data_types[id] != "series"):
+            raise ValueError("Element with given ID is not a series plot!")
+        return self.data[id]
+
+    def getLineData(self, id):
+        """Used internally to get the data of a line, scatter or series plot as Nx2 array.
+        """
+        if self.data_types[id] == "series":
+            return self.data[id].getData()
+        return self.data[id]
+
     def setImage(self, id, x, y, z):
         """Overwrite an existing image plot.
 
@@ -494,24 +913,182 @@ class FSRSPlot(wx.Panel):
         :param array y: y-axis. Only the min/max values are used and the axis is linearly interpolated.
         :param array z: Image data, 2d-array.
         """
+        id = self.checkImageID(id)
+
+        # overwrite image
+        img = self.data[id][2]
+        self.imageBuffers[img] = self.initImageBuffer(z)
+        self.data[id] = ((np.nanmin(x), np.nanmax(x)), (np.nanmin(y), np.nanmax(y)), img)
+        self.data_extent[id] = (np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y))
+        self.invalidateData()
+
+    def appendImageRow(self, id, row, y=None):
+        """Append a single row to an existing image plot. Only the new row is quantized.
+
+        The color range is only extended when the new data exceed it, and then by an additional margin (`imageHysteresis`),
+        so that the whole image has to be quantized again only occasionally. Use this instead of `setImage` when an image grows row by row, e.g. during a scan.
+
+        :param int id: Id or index of image plot. The plot at the given id must already be an image plot.
+        :param array row: New row; has to have the same length as the existing rows.
+        :param float y: y-value of the new row. The y-axis is extended to include it. If None, the row number is used.
+        """
+        buf = self.imageBuffers[self.data[self.checkImageID(id)][2]]
+        self.updateImageRows(id, [row], buf["rows"], None if y is None else [y])
+
+    def updateImageRows(self, id, rows, start, y=None):
+        """Overwrite rows of an existing image plot, starting at row `start`. Rows beyond the current end of the image are appended.
+        Only the given rows are quantized; see `appendImageRow` for the handling of the color range.
+
+        :param int id: Id or index of image plot. The plot at the given id must already be an image plot.
+        :param array rows: 2d-array of new rows.
+        :param int start: Index of first row to overwrite.
+        :param array y: y-values of the new rows. The y-axis is extended to include them. If None, the row numbers are used.
+        """
+        id = self.checkImageID(id)
+        img = self.data[id][2]
+        buf = self.imageBuffers[img]
+
+        rows = np.atleast_2d(np.array(rows, dtype=float))
+        start = int(start)
+        stop = start + rows.shape[0]
+        if rows.shape[1] != buf["z"].shape[1]:
+            raise ValueError("Length of rows does not match width of image!")
+        if start < 0 or start > buf["rows"]:
+            raise ValueError("Start row out of range!")
+
+        # grow buffers by doubling their capacity
+        if stop > buf["z"].shape[0]:
+            cap = max(stop, 2 * buf["z"].shape[0])
+            for k in ["z", "index"]:
+                tmp = np.zeros((cap, ) + buf[k].shape[1:], dtype=buf[k].dtype)
+                tmp[:buf["rows"]] = buf[k][:buf["rows"]]
+                buf[k] = tmp
+
+        buf["z"][start:stop] = rows
+        buf["rows"] = max(buf["rows"], stop)
+
+        # extend color range with hysteresis if necessary, otherwise quantize only the new rows
+        # a locked color range is never changed, values outside are clipped
+        valid = np.isfinite(rows)
+        zmin, zmax = (np.amin(rows[valid]), np.amax(rows[valid])) if np.any(valid) else (buf["zmin"], buf["zmax"])
+        if not buf["locked"] and (zmin < buf["zmin"] or zmax > buf["zmax"]):
+            zmin, zmax = min(zmin, buf["zmin"]), max(zmax, buf["zmax"])
+            if zmin == zmax:    # constant data, e.g. the first row of a placeholder image; same as in initImageBuffer
+                zmin, zmax = zmin - 1, zmax + 1
+            margin = self.imageHysteresis * (zmax - zmin)
+            buf["zmin"] = zmin - margin if zmin < buf["zmin"] else buf["zmin"]
+            buf["zmax"] = zmax + margin if zmax > buf["zmax"] else buf["zmax"]
+            buf["requantize"] = True
+        elif not buf["requantize"]:
+            buf["index"][start:stop] = self.quantizeImage(rows, buf["zmin"], buf["zmax"])
+
+        # update y-axis
+        (x0, x1), (y0, y1), _ = self.data[id]
+        if y is None:
+            y = [start, stop - 1]
+        if buf["rows"] == rows.shape[0]:    # image consists only of the new rows
+            y0, y1 = np.nanmin(y), np.nanmax(y)
+        else:
+            y0, y1 = min(y0, np.nanmin(y)), max(y1, np.nanmax(y))
+        self.data[id] = ((x0, x1), (y0, y1), img)
+        self.data_extent[id] = (x0, x1, y0, y1)
+        self.invalidateData()
+
+    def setImageRange(self, id, zmin=None, zmax=None):
+        """Lock the color range of an image plot to [zmin, zmax] or unlock it when zmin or zmax is None.
+
+        While the range is locked, `appendImageRow` and `updateImageRows` never change it, which keeps the colors of a growing image comparable.
+        When unlocked, the range is reset to the extent of the current data.
+
+        :param int id: Id or index of image plot.
+        :param float zmin: z-value mapped onto the lower end of the colormap.
+        :param float zmax: z-value mapped onto the upper end of the colormap.
+        """
+        buf = self.imageBuffers[self.data[self.checkImageID(id)][2]]
+        if zmin is None or zmax is None:
+            z = buf["z"][:buf["rows"]]
+            valid = np.isfinite(z)
+            buf["zmin"], buf["zmax"] = (np.amin(z[valid]), np.amax(z[valid])) if np.any(valid) else (np.inf, -np.inf)
+            if buf["zmin"] == buf["zmax"]:
+                buf["zmin"], buf["zmax"] = buf["zmin"] - 1, buf["zmax"] + 1
+            buf["locked"] = False
+        else:
+            buf["zmin"], buf["zmax"] = float(zmin), float(zmax)
+            buf["locked"] = True
+        buf["requantize"] = True
+        self.invalidateData()
+
+    def getImageRange(self, id):
+        """Returns a tuple (zmin, zmax, locked) with the current color range of an image plot and whether it is locked.
+        """
+        buf = self.imageBuffers[self.data[self.checkImageID(id)][2]]
+        return buf["zmin"], buf["zmax"], buf["locked"]
+
+    def checkImageID(self, id):
+        """Used internally to check that `id` refers to an image plot.
+
+        :returns: Id as positive integer.
+        """
         id = abs(int(id))
         if(id >= len(self.data)):
             raise ValueError("ID of plot element out of range!")
         if(self.data_types[id] != "image"):
             raise ValueError("Element with given ID is not an image plot!")
+        return id
+
+    def initImageBuffer(self, z):
+        """Used internally to create the persistent buffers of an image plot from the 2d-array z.
 
-        # get image width and height
-        h, w = z.shape
-        min, max = np.amin(z), np.amax(z)
+        :returns: Dictionary with z-data ('z') and palette indices ('index'), both with a capacity that can exceed the number of valid rows ('rows'),
+            the color range ('zmin', 'zmax'), a flag whether all rows have to be quantized again ('requantize') and whether the range is locked ('locked').
+            If z contains no finite values, e.g. a placeholder that is filled row by row, the range is empty (zmin = inf, zmax = -inf).
+        """
+        z = np.array(z, dtype=float)
+        valid = np.isfinite(z)
+        if np.any(valid):
+            min, max = np.amin(z[valid]), np.amax(z[valid])
+            if min == max:
+                min, max = min - 1, max + 1
+        else:
+            min, max = np.inf, -np.inf
+        return {"z": z, "index": self.quantizeImage(z, min, max), "rows": z.shape[0], "zmin": min, "zmax": max, "requantize": False, "locked": False}
 
-        # these are color indices
-        c = (((z.flatten() - min) / (max - min)) * 255).astype(int)
+    def quantizeImage(self, z, min, max):
+        """Used internally to map z-values onto the palette indices of image plots, see `imageLevels`.
 
-        # overwrite image
-        self.images[self.data[id][2]] = wx.BitmapFromBuffer(w, h, self.imgcolormap[c])
-        self.data[id] = ((np.nanmin(x), np.nanmax(x)), (np.nanmin(y), np.nanmax(y)), id)
-        self.data_extent[id] = (np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y))
-        self.Refresh()
+        :param array z: z-values.
+        :param float min: z-value mapped onto index 0.
+        :param float max: z-value mapped onto index imageLevels - 1.
+        :returns: Array of type uint16 with same shape as z; NaN is mapped onto index imageLevels.
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            a = np.clip((np.asarray(z, dtype=float) - min) / float(max - min), 0, 1)
+        valid = np.isfinite(a)
+        return np.where(valid, np.around(np.where(valid, a, 0) * (self.imageLevels - 1)), self.imageLevels).astype(np.uint16)
+
+    def setImageContrast(self, low=0.0, high=1.0, gamma=1.0):
+        """Set contrast and gamma of all image plots. Only the palette is recalculated, so this is fast also for large images.
+
+        The color range of each image is stretched such that the fraction `low` of the range is mapped onto the lower and the fraction `high` onto the upper end
+        of the colormap. Then, the normalized values are raised to the power of `gamma`. The default values show the full range linearly.
+
+        :param float low: Fraction of the color range mapped onto the lower end of the colormap (default = 0).
+        :param float high: Fraction of the color range mapped onto the upper end of the colormap (default = 1).
+        :param float gamma: Gamma exponent (default = 1).
+        """
+        if high <= low or gamma <= 0:
+            raise ValueError("Invalid contrast settings!")
+        self.imageContrast = (float(low), float(high))
+        self.imageGamma = float(gamma)
+        self.updateImagePalette()
+        self.invalidateData()
+
+    def updateImagePalette(self):
+        """Used internally to build the palette of image plots from the color lookup table and the contrast and gamma settings.
+        """
+        low, high = self.imageContrast
+        a = np.clip((np.linspace(0, 1, self.imageLevels) - low) / (high - low), 0, 1) ** self.imageGamma
+        self.imagePalette = np.vstack([self.colorLUT[np.around(a * (self.lutsize - 1)).astype(int)], np.array(self.nancolor, dtype=np.uint8)])
 
     def setContour(self, id, x, y, z):
         """Overwrite an existing contour plot.
@@ -535,7 +1112,7 @@ class FSRSPlot(wx.Panel):
         self.data[id] = nd
         self.data_extent[id] = (np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y))
         self.contourDCValid = False
-        self.Refresh()
+        self.invalidateData()
 
     def setLine(self, id, x, y):
         """Overwrite an existing line / scatter plot.
@@ -560,7 +1137,7 @@ class FSRSPlot(wx.Panel):
 
         self.data[id] = nd
         self.data_extent[id] = (np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y))
-        self.Refresh()
+        self.invalidateData()
 
     def setScatter(self, id, x, y):
         """Same as `setLine`.
@@ -577,8 +1154,9 @@ class FSRSPlot(wx.Panel):
         """
         self.data.pop()
         self.data_extent.pop()
-        self.data_types.pop()
-        self.Refresh()
+        if self.data_types.pop() == "contour":
+            self.contourDCValid = False
+        self.invalidateData()
 
     # returns the colormap with given label
     # a colormap consists of two lists, the first containing the supporting points and the second containing the respective r,g,b values
@@ -617,24 +1195,26 @@ class FSRSPlot(wx.Panel):
             print "ERROR: Wrong datatype in setColormap! Has to be string or tuple."
             return
 
-        # prepare colormap for image
+        # prepare lookup table and colormap for image
+        self.colorLUT = np.around(self.interpolateColor(np.linspace(0, 1, self.lutsize))).astype(np.uint8)
         self.imgcolormap = self.getZColor(np.arange(256), min=0, max=256)
+        self.updateImagePalette()
 
         # replot
         self.contourDCValid = False
-        self.Refresh()
+        self.invalidateData()
 
     def setXLabel(self, label):
         """Set x-axis label.
         """
         self.xlabel = label
-        self.Refresh()
+        self.invalidateData()
 
     def setYLabel(self, label):
         """Set y-axis label.
         """
         self.ylabel = label
-        self.Refresh()
+        self.invalidateData()
 
     # adjust min, max of data to get nice looking axes ticks
     # returns new min, max and a list of tickmark positions in data coordinates (real! data coordinates)
@@ -690,12 +1270,18 @@ class FSRSPlot(wx.Panel):
         self.plotZMin = 0
         self.plotZMax = 1
 
+        # the extent of streaming series changes with every new point, so it is obtained only here
+        for i, t in enumerate(self.data_types):
+            if t == "series":
+                self.data_extent[i] = self.data[i].getExtent()
+        extent = np.array([e for e in self.data_extent if e is not None])
+
         # there is some data, get min / max
-        if self.data:
-            self.plotXMin = np.amin(np.array(self.data_extent)[:, 0])
-            self.plotXMax = np.amax(np.array(self.data_extent)[:, 1])
-            self.plotYMin = np.amin(np.array(self.data_extent)[:, 2])
-            self.plotYMax = np.amax(np.array(self.data_extent)[:, 3])
+        if len(extent) > 0:
+            self.plotXMin = np.amin(extent[:, 0])
+            self.plotXMax = np.amax(extent[:, 1])
+            self.plotYMin = np.amin(extent[:, 2])
+            self.plotYMax = np.amax(extent[:, 3])
             if self.logx:
                 self.plotXMin = np.nan_to_num(np.log10(self.plotXMin))
                 self.plotXMax = np.nan_to_num(np.log10(self.plotXMax))
@@ -780,58 +1366,49 @@ class FSRSPlot(wx.Panel):
         exttxt = self.ext[int(nmax + 8)]
         return "%.1f%s" % (x / np.power(1000, nmax), exttxt)
 
-    # returns an interpolated value for alpha
-    # alpha is a scalar!
+    # returns interpolated values for alpha
+    # used to generate the lookup table; use getZColor for mapping data
     def interpolateColor(self, alpha):
-        """Used internally to calculate the rgb-values for a scalar alpha (0..1) and the currently set colormap.
+        """Used internally to calculate the rgb-values for alpha (0..1) and the currently set colormap.
 
-        :param float alpha: Scalar between 0 and 1.
-        :returns: RGB-tuple.
+        :param mixed alpha: Scalar or array with values between 0 and 1.
+        :returns: RGB-tuple or array of RGB-tuples with shape alpha.shape + (3,).
         """
-        x1 = np.array(self.colormap[0])
-        colors1 = np.array(self.colormap[1], dtype=float)
-
-        if alpha <= x1[0]:
-            return colors1[0]
-        elif alpha >= x1[-1]:
-            return colors1[-1]
-        else:
-            x2 = np.roll(x1, -1, axis=0)
-            colors2 = np.roll(colors1, -1, axis=0)
-
-            A = np.where(alpha >= x1, np.where(alpha <= x2, 1, 0), 0)
-            B = ((alpha - x1) / (x2 - x1) * colors2.T + (x2 - alpha) / (x2 - x1) * colors1.T).T
-            C = (B.T * A).T
-
-            return np.sum(C, axis=0)
+        x = np.array(self.colormap[0], dtype=float)
+        colors = np.array(self.colormap[1], dtype=float)
+        return np.stack([np.interp(alpha, x, colors[:, i]) for i in range(3)], axis=-1)
 
     # get color for z value from colormap; returns r, g, b tuple
     # if min = max, use the data range stored in self.plotZMin / Max
-    def getZColor(self, z, min=-1, max=-1):
+    def getZColor(self, z, min=-1, max=-1, logscale=False):
         """Get RGB-tuples for z-values according to current colormap.
 
-        When `min == max`, the full z-extent of the data is used for mapping.
+        The z-values are mapped onto the lookup table generated by `setColormap`, so this function is fast also for large arrays.
+        When `min == max`, the full z-extent of the data is used for mapping. NaN values are shown in `nancolor`.
 
-        :param mixed z: Single z-value, 1d or 2d-array of z-values.
-        :param float min: Minimum z value that gets mapped onto 0.
-        :param float max: Maximum z value that gets mapped onto 1.
-        :returns: RGB-tuples with same shape as z.
+        :param mixed z: Single z-value or n-dimensional array of z-values.
+        :param float min: Minimum z value that gets mapped onto 0; log10 of the value when logscale is True.
+        :param float max: Maximum z value that gets mapped onto 1; log10 of the value when logscale is True.
+        :param bool logscale: If True, map log10(z) instead of z. Non-positive values are shown in `nancolor`.
+        :returns: Array of RGB-tuples with shape z.shape + (3,).
         """
         if min == max:
             min = self.plotZMin
             max = self.plotZMax
 
-        # get position in colormap
-        a = (z.astype(float) - min) / (max - min)
+        z = np.asarray(z, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if logscale:
+                z = np.where(z > 0, np.log10(z), np.nan)
 
-        if isinstance(a, float):
-            return self.interpolateColor(a).astype(np.uint8)
-        else:
-            col = np.array(map(self.interpolateColor, a.flatten())).astype(np.uint8)
-            try:
-                return col.reshape(a.shape[0], a.shape[1], 3)
-            except:
-                return col.reshape(a.shape[0], 3)
+            # get position in lookup table
+            a = np.clip((z - min) / float(max - min), 0, 1)
+        valid = np.isfinite(a)
+        index = np.where(valid, np.around(np.where(valid, a, 0) * (self.lutsize - 1)), 0).astype(int)
+
+        col = self.colorLUT[index]
+        col[~valid] = self.nancolor
+        return col
 
     # get mapping prefactors from data to dc space and vice versa
     # min/max values are already in log10 when logscale is used
@@ -888,13 +1465,152 @@ class FSRSPlot(wx.Panel):
         return x, y
 
     # DRAWING FUNCTIONS
-    def Draw(self, dc):
+    def invalidateData(self, axes=False):
+        """Mark the data layer as invalid and refresh the plot. Call this after changing the data or layout parameters directly.
+
+        :param bool axes: If True, redraw also the axes layer, e.g. after changing fonts, colors or pens (default = False).
+        """
+        self.dataValid = False
+        if axes:
+            self.axesKey = None
+        self.requestRedraw()
+
+    # OFFSCREEN RENDERING
+    def renderBitmap(self, size=None, overlay=False):
+        """Render the plot into an offscreen bitmap. The result is independent of the size and visibility of the canvas.
+
+        :param tuple size: Size (width, height) of the bitmap in pixels or None to use the current size of the canvas (default).
+        :param bool overlay: If True, cursors and the mouse readout are included (default = False).
+        :returns: wx.Bitmap.
+        """
+        clientsize = tuple(self.GetClientSize())
+        if size is None:
+            size = clientsize
+        size = (int(size[0]), int(size[1]))
+
+        bmp = wx.EmptyBitmap(size[0], size[1])
+        dc = wx.MemoryDC(bmp)
+        dc.SetBackground(wx.Brush(self.bgcolor, wx.SOLID))
+        dc.Clear()
+        self.Draw(dc, size, overlay)
+        dc.SelectObject(wx.NullBitmap)
+
+        # the layout now refers to the offscreen size; restore it with the next paint
+        if size != clientsize:
+            self.requestRedraw()
+        return bmp
+
+    def saveImage(self, filename, size=None, overlay=False, wait=False):
+        """Save the plot as PNG file, see `renderBitmap`.
+
+        Only the rendering is done in the calling thread, which has to be the GUI thread. Compressing and writing the file is done
+        in a background thread, so that saving previews does not delay the processing of new data.
+
+        :param str filename: Filename of the PNG file.
+        :param tuple size: Size (width, height) of the image in pixels or None to use the current size of the canvas (default).
+        :param bool overlay: If True, cursors and the mouse readout are included (default = False).
+        :param bool wait: If True, return only after the file has been written (default = False).
+        :returns: The threading.Thread writing the file.
+        """
+        img = self.renderBitmap(size, overlay).ConvertToImage()
+        writer = threading.Thread(target=writeImageFile, args=(img, filename))
+        writer.daemon = True
+        writer.start()
+        if wait:
+            writer.join()
+        return writer
+
+    # REDRAW SCHEDULER
+    def requestRedraw(self):
+        """Request a repaint of the plot.
+
+        Requests are coalesced: within `batchUpdate` nothing is painted until the outermost batch ends, a request arriving while a paint is
+        already pending is merged into it, and the plot is repainted at most `maxFPS` times per second. Requests arriving faster are
+        delayed by a timer and merged.
+        """
+        self.redrawStats["requests"] += 1
+
+        if self.batchDepth > 0:
+            if self.batchPending:
+                self.redrawStats["coalesced"] += 1
+            self.batchPending = True
+            return
+
+        now = time.time()
+        if self.redrawTimer.IsRunning():
+            self.redrawStats["dropped"] += 1
+            return
+        if self.redrawPending and now - self.redrawPending < 1.0:    # do not wait forever, e.g. when the window was hidden
+            self.redrawStats["coalesced"] += 1
+            return
+
+        wait = 0 if self.maxFPS <= 0 else self.lastPaint + 1.0 / self.maxFPS - now
+        if wait > 0:
+            self.redrawStats["dropped"] += 1
+            self.redrawTimer.Start(max(1, int(wait * 1000)), wx.TIMER_ONE_SHOT)
+        else:
+            self.redrawPending = now
+            self.Refresh()
+
+    def OnRedrawTimer(self, event):
+        """Event handler for the redraw timer, issues the delayed repaint.
+        """
+        self.redrawPending = time.time()
+        self.Refresh()
+
+    @contextmanager
+    def batchUpdate(self):
+        """Context manager to combine several updates into a single repaint. Batches can be nested, e.g.::
+
+            with canvas.batchUpdate():
+                canvas.setLine(0, x, y1)
+                canvas.setLine(1, x, y2)
+        """
+        self.batchDepth += 1
+        try:
+            yield self
+        finally:
+            self.batchDepth -= 1
+            if self.batchDepth == 0 and self.batchPending:
+                self.batchPending = False
+                self.redrawStats["requests"] -= 1    # the combined request is already counted
+                self.requestRedraw()
+
+    def getRedrawStats(self):
+        """Returns statistics of the redraw scheduler since the last reset as dictionary with the following keys:
+
+            - **requests**: number of redraw requests.
+            - **paints**: number of actual paints.
+            - **coalesced**: requests merged into a batch or an already pending paint.
+            - **dropped**: requests delayed and merged due to the frame rate limit.
+            - **fps**: average number of paints per second.
+        """
+        stats = dict(self.redrawStats)
+        elapsed = time.time() - stats.pop("since")
+        stats["fps"] = stats["paints"] / elapsed if elapsed > 0 else 0.0
+        return stats
+
+    def resetRedrawStats(self):
+        """Reset the statistics of the redraw scheduler.
+        """
+        self.redrawStats = {"requests": 0, "paints": 0, "coalesced": 0, "dropped": 0, "since": time.time()}
+
+    def Draw(self, dc, size=None, overlay=True):
         """Internally used to draw the plots to a device context (dc).
         Plotting order is contour plots first, followed by image plots and line / scatter plots and axes, labels and cursors.
+
+        Axes and data are taken from cached bitmaps when possible, so that repaints due to mouse movement only require a blit and the overlay.
+
+        :param tuple size: Size (width, height) of the dc or None to use the client size of the canvas (default).
+        :param bool overlay: If False, cursors and the mouse readout are not drawn (default = True).
         """
         # Get the actual client size of ourselves
-        self.dcwidth, self.dcheight = self.GetClientSize()
-        if not self.dcwidth or not self.dcheight:
+        # offscreen renderings with a given size are always done on the calling thread
+        threaded = self.renderThreaded and size is None
+        if size is None:
+            size = self.GetClientSize()
+        size = tuple(size)
+        if not size[0] or not size[1]:
             return
 
         # set text properties
@@ -902,6 +1618,37 @@ class FSRSPlot(wx.Panel):
         dc.SetTextBackground(self.bgcolor)
         dc.SetTextForeground(self.axiscolor)
 
+        # redraw data layer when data or size have changed
+        # in threaded mode, a new snapshot is taken only when the previous one has been rendered, so that a result is shown even when
+        # the data change faster than they can be rendered; until then, the last data layer is shown
+        if (not self.dataValid or self.sceneSize != size) and not (threaded and self.renderPending is not None):
+            self.dcwidth, self.dcheight = size
+            self.updateLayout(dc)
+            self.drawAxesLayer()
+            state = self.getRenderState()
+            self.dataValid = True
+            if threaded:
+                if self.renderWorker is None:
+                    self.renderWorker = RenderWorker(self.OnRenderDone)
+                    self.renderWorker.start()
+                self.renderPending = state.version
+                self.renderWorker.submit(state)
+            else:
+                self.drawScene(state.render())
+
+        if self.sceneBitmap is not None and self.sceneSize == size:
+            dc.DrawBitmap(self.sceneBitmap, 0, 0)
+        else:
+            dc.SetBackground(wx.Brush(self.bgcolor, wx.SOLID))
+            dc.Clear()
+            if self.axesBitmap is not None:
+                dc.DrawBitmap(self.axesBitmap, 0, 0)
+        if overlay:
+            self.drawOverlay(dc)
+
+    def updateLayout(self, dc):
+        """Internally used to determine axis ranges, ticks, labels, margins and the mapping between data and screen coordinates.
+        """
         # get extent of data and adjust ticks to get nice axes
         self.getDataMinMax()
         if self.tightx:
@@ -943,72 +1690,141 @@ class FSRSPlot(wx.Panel):
         # now prepare mapping prefactors between data and screen
         self.prepareMapping()
 
-        # erase dc by filling with background color
-        dc.SetBackground(wx.Brush(self.bgcolor, wx.SOLID))
-        dc.Clear()
-
-        # plot all contour plots FIRST
-        # this is important as this is the image that gets stored in the memoryDC
+    def drawAxesLayer(self):
+        """Internally used to render the axes layer into `axesBitmap` if the layout has changed.
+        """
+        key = (self.dcwidth, self.dcheight, self.plotXMin, self.plotXMax, self.plotYMin, self.plotYMax, self.logx, self.logy,
+               tuple(self.lblx), tuple(self.lbly), self.xlabel, self.ylabel, self.showGrid)
+        if key != self.axesKey:
+            self.axesBitmap = wx.EmptyBitmap(self.dcwidth, self.dcheight)
+            mdc = wx.MemoryDC(self.axesBitmap)
+            mdc.SetFont(self.font)
+            mdc.SetTextBackground(self.bgcolor)
+            mdc.SetTextForeground(self.axiscolor)
+
+            # erase dc by filling with background color
+            mdc.SetBackground(wx.Brush(self.bgcolor, wx.SOLID))
+            mdc.Clear()
+            self.drawAxes(mdc)
+            mdc.SelectObject(wx.NullBitmap)
+            self.axesKey = key
+
+    def getRenderState(self):
+        """Internally used to take a snapshot of the current layout and data for rendering the data layer, see `RenderState`.
+        Arrays that may be changed in place while the snapshot is rendered are copied.
+        """
+        self.renderVersion += 1
+        state = RenderState()
+        state.version = self.renderVersion
+        state.axesKey = self.axesKey
+        state.size = (self.dcwidth, self.dcheight)
+        state.dcleft, state.dctop, state.dcright, state.dcbottom = self.dcleft, self.dctop, self.dcright, self.dcbottom
+        state.map_ax, state.map_bx, state.map_ay, state.map_by = self.map_ax, self.map_bx, self.map_ay, self.map_by
+        state.logx, state.logy = self.logx, self.logy
+        state.bgcolor = (self.bgcolor.Red(), self.bgcolor.Green(), self.bgcolor.Blue())
+
+        # contour plots; the cell colors are only recalculated when the data have changed
         if 'contour' in self.data_types:
             if not self.contourDCValid:
-                for i, d in enumerate(self.data):
-                    if self.data_types[i] == "contour":
-                        self.drawContour(dc, d)
-
-                # clear old bitmap
-                self.contourDC.SelectObject(wx.NullBitmap)
-                # create new bitmap
-                bmp = wx.EmptyBitmap(self.dcright - self.dcleft + 1, self.dcbottom - self.dctop + 1)
-                self.contourDC.SelectObject(bmp)
-                # copy dc data
-                self.contourDC.Blit(0, 0, self.dcright - self.dcleft + 1, self.dcbottom - self.dctop + 1, dc, self.dcleft, self.dctop)
-
+                self.contourCells = [self.prepareContour(d) for i, d in enumerate(self.data) if self.data_types[i] == "contour"]
                 self.contourDCValid = True
+            state.contours = self.contourCells
+
+        # image plots; the palette indices are quantized again only when the color range has changed
+        state.palette = self.imagePalette
+        for i, d in enumerate(self.data):
+            if self.data_types[i] == "image":
+                buf = self.imageBuffers[d[2]]
+                if buf["requantize"]:
+                    buf["index"][:buf["rows"]] = self.quantizeImage(buf["z"][:buf["rows"]], buf["zmin"], buf["zmax"])
+                    buf["requantize"] = False
+                state.images.append((d[0][0], d[0][1], d[1][0], d[1][1], buf["index"][:buf["rows"]].copy()))
+
+        # line plots; data of line and scatter plots are replaced but never changed in place
+        for i, d in enumerate(self.data):
+            if self.data_types[i] == "line" or self.data_types[i] == "scatter":
+                state.lines.append((d, self.data_types[i]))
+            elif self.data_types[i] == "series":
+                state.lines.append((np.array(d.getData()), d.type))
+        return state
+
+    def OnRenderDone(self, state):
+        """Called on the GUI thread by the render worker when a snapshot has been rendered.
+        """
+        if not self or state.version != self.renderPending:    # canvas destroyed or variables reset
+            return
+        self.renderPending = None
+
+        # layout or size have changed in the meantime, e.g. by an offscreen rendering; take a new snapshot
+        if state.error is None:
+            if state.axesKey == self.axesKey and state.size == tuple(self.GetClientSize()):
+                self.drawScene(state)
             else:
-                wsrc, hsrc = self.contourDC.GetSize()
-                dc.StretchBlit(self.dcleft, self.dctop, self.dcright - self.dcleft + 1, self.dcbottom - self.dctop + 1, self.contourDC, 0, 0, wsrc, hsrc)
+                self.dataValid = False
+        self.requestRedraw()
+
+    def drawScene(self, state):
+        """Internally used to compose the data layer from the axes layer and a rendered `RenderState` into `sceneBitmap`.
+        """
+        w, h = state.size
+        self.sceneBitmap = wx.EmptyBitmap(w, h)
+        dc = wx.MemoryDC(self.sceneBitmap)
+        dc.DrawBitmap(self.axesBitmap, 0, 0)
 
-        # now plot all images
-        if 'image' in self.data_types:
-            for i, d in enumerate(self.data):
-                if self.data_types[i] == "image":
-                    self.drawImage(dc, d)
+        # contour and image plots have been rasterized into a single bitmap covering the plot area
+        if state.raster is not None:
+            dc.DrawBitmap(wx.BitmapFromBufferRGBA(state.raster.shape[1], state.raster.shape[0], state.raster), state.dcleft, state.dctop)
 
         # now plot all line plots
-        if 'line' in self.data_types or 'scatter' in self.data_types:
-            self.lineColorIter = itertools.cycle(self.linescolor)    # reset the iterator
-            for i, d in enumerate(self.data):
-                if self.data_types[i] == "line" or self.data_types[i] == "scatter":
-                    self.drawLine(dc, d, self.data_types[i], (self.mouseN == i))
+        self.lineColorIter = itertools.cycle(self.linescolor)    # reset the iterator
+        for x, y, type in state.points:
+            self.drawLine(dc, x, y, type)
 
-        # finally plot the axes
-        self.drawAxes(dc)
+        # finally redraw the frame, which may be covered by the data
+        dc.DestroyClippingRegion()
+        self.drawFrame(dc)
 
-    def drawImage(self, dc, img):
-        """Internally used to draw an image (img) to a device context (dc).
+        dc.SelectObject(wx.NullBitmap)
+        self.sceneSize = (w, h)
+
+    def drawAxes(self, dc):
+        """Internally used to draw the axes layer: grid, tick labels, axis labels, tickmarks and frame.
         """
-        # set up a dcclipper to constrain the lineart to the plot area
-        wx.DCClipper(dc, self.dcleft, self.dctop, self.dcright - self.dcleft + 1, self.dcbottom - self.dctop + 1)
+        x, y = self.getTickPositions()
 
-        # create a memory DC from the stored bitmap
-        memdc = wx.MemoryDC()
-        memdc.SelectObject(self.images[img[2]])
-        wsrc, hsrc = memdc.GetSize()
+        # draw grid
+        if self.showGrid:
+            dc.SetPen(self.gridPen)
+            for i in range(len(x)):
+                if x[i] >= self.dcleft and x[i] <= self.dcright:
+                    dc.DrawLine(x[i], self.dctop, x[i], self.dcbottom)
+            for i in range(len(y)):
+                if y[i] >= self.dctop and y[i] <= self.dcbottom:
+                    dc.DrawLine(self.dcleft, y[i], self.dcright, y[i])
 
-        # get destination coordinates on screen
-        x0, y0 = self.data2screen(img[0][0], img[1][0])
-        x1, y1 = self.data2screen(img[0][1], img[1][1])
+        # tick labels
+        for i in range(len(x)):
+            if x[i] >= self.dcleft and x[i] <= self.dcright:
+                txtW, txtH = dc.GetTextExtent(self.lblx[i])
+                dc.DrawText(self.lblx[i], x[i] - txtW / 2, self.dcbottom + txtH / 2)
+        for i in range(len(y)):
+            if y[i] >= self.dctop and y[i] <= self.dcbottom:
+                txtW, txtH = dc.GetTextExtent(self.lbly[i])
+                dc.DrawText(self.lbly[i], self.dcleft - txtW - txtH / 2, y[i] - txtH / 2)
 
-        # copy
-        dc.StretchBlit(x0, y0, x1 - x0, y1 - y0, memdc, 0, 0, wsrc, hsrc)
+        # write axis labels
+        if self.xlabel != "":
+            txtW, txtH = dc.GetTextExtent(self.xlabel)
+            dc.DrawText(self.xlabel, (self.dcleft + self.dcright) / 2 - txtW / 2, self.dcheight - 3 * txtH / 2)
+        if self.ylabel != "":
+            txtW, txtH = dc.GetTextExtent(self.ylabel)
+            dc.DrawRotatedText(self.ylabel, txtH / 2, (self.dctop + self.dcbottom) / 2 + txtW / 2, 90)
 
-        # destroy memoryDC
-        memdc.SelectObject(wx.NullBitmap)
+        self.drawFrame(dc)
 
-    def drawAxes(self, dc):
-        """Internally used to draw the axes plus labels. Takes also care of crosshair, mouse coordinates and delta.
+    def getTickPositions(self):
+        """Internally used to get the screen positions of the x and y ticks.
         """
-        # make ticks along x axes
         x = []
         for t in self.XTicks:
             xs, _ = self.data2screen(t, 1)
@@ -1017,16 +1833,12 @@ class FSRSPlot(wx.Panel):
         for t in self.YTicks:
             _, ys = self.data2screen(1, t)
             y.append(ys)
+        return x, y
 
-        # draw grid
-        if self.showGrid:
-            dc.SetPen(self.gridPen)
-            for i in range(len(x)):
-                if x[i] >= self.dcleft and x[i] <= self.dcright:
-                    dc.DrawLine(x[i], self.dctop, x[i], self.dcbottom)
-            for i in range(len(y)):
-                if y[i] >= self.dctop and y[i] <= self.dcbottom:
-                    dc.DrawLine(self.dcleft, y[i], self.dcright, y[i])
+    def drawFrame(self, dc):
+        """Internally used to draw tickmarks and the box around the plot area.
+        """
+        x, y = self.getTickPositions()
 
         # finish tickmarks
         dc.SetPen(self.axisPen)
@@ -1034,14 +1846,10 @@ class FSRSPlot(wx.Panel):
             if x[i] >= self.dcleft and x[i] <= self.dcright:
                 dc.DrawLine(x[i], self.dcbottom, x[i], self.dcbottom - self.ticklength)
                 dc.DrawLine(x[i], self.dctop, x[i], self.dctop + self.ticklength)
-                txtW, txtH = dc.GetTextExtent(self.lblx[i])
-                dc.DrawText(self.lblx[i], x[i] - txtW / 2, self.dcbottom + txtH / 2)
         for i in range(len(y)):
             if y[i] >= self.dctop and y[i] <= self.dcbottom:
                 dc.DrawLine(self.dcleft, y[i], self.dcleft + self.ticklength, y[i])
                 dc.DrawLine(self.dcright, y[i], self.dcright - self.ticklength, y[i])
-                txtW, txtH = dc.GetTextExtent(self.lbly[i])
-                dc.DrawText(self.lbly[i], self.dcleft - txtW - txtH / 2, y[i] - txtH / 2)
 
         # make a nice box around
         dc.DrawLine(self.dcleft, self.dctop, self.dcleft, self.dcbottom)
@@ -1049,13 +1857,18 @@ class FSRSPlot(wx.Panel):
         dc.DrawLine(self.dcright, self.dcbottom, self.dcright, self.dctop)
         dc.DrawLine(self.dcright, self.dctop, self.dcleft, self.dctop)
 
-        # write axis labels
-        if self.xlabel != "":
-            txtW, txtH = dc.GetTextExtent(self.xlabel)
-            dc.DrawText(self.xlabel, (self.dcleft + self.dcright) / 2 - txtW / 2, self.dcheight - 3 * txtH / 2)
-        if self.ylabel != "":
-            txtW, txtH = dc.GetTextExtent(self.ylabel)
-            dc.DrawRotatedText(self.ylabel, txtH / 2, (self.dctop + self.dcbottom) / 2 + txtW / 2, 90)
+    def drawOverlay(self, dc):
+        """Internally used to draw the overlay layer: data cursors, mouse coordinates, crosshair and delta.
+        """
+        # cursors of the active line / scatter plot in the color of the plot
+        if (self.mouseX1 is not None or self.mouseX2 is not None) and self.mouseN < len(self.data) and self.data_types[self.mouseN] in ["line", "scatter", "series"] and len(self.getLineData(self.mouseN)) > 0:
+            n = len([t for t in self.data_types[:self.mouseN] if t in ["line", "scatter", "series"]])
+            color = self.linescolor[n % len(self.linescolor)]
+            dc.SetPen(wx.Pen(color, width=self.linewidth, style=wx.PENSTYLE_SOLID))
+            if self.mouseX1 is not None:
+                self.cursor1 = self.drawCursor(dc, self.getLineData(self.mouseN), self.mouseX1, "A")
+            if self.mouseX2 is not None:
+                self.cursor2 = self.drawCursor(dc, self.getLineData(self.mouseN), self.mouseX2, "B")
 
         # display mouse coordinates
         mx, my = self.mousePos.Get()
@@ -1082,34 +1895,29 @@ class FSRSPlot(wx.Panel):
             txtW, txtH = dc.GetTextExtent(txt)
             dc.DrawText(txt, self.dcright - txtW - 5, self.dctop - txtH - 5)
 
-    def drawLine(self, dc, data, type='line', cursors=False):
-        """Used internally to draw a line/scatter plot (data, type) to a device context (dc).
-        If cursors is True, draw cursors accordingly.
+    def drawLine(self, dc, x, y, type='line'):
+        """Used internally to draw a line/scatter plot to a device context (dc), given by its screen coordinates (x, y), see `RenderState.getScreenPoints`.
+        Cursors are part of the overlay and drawn by `drawOverlay`.
         """
         # create pen
         color = next(self.lineColorIter)
         dc.SetPen(wx.Pen(color, width=self.linewidth, style=wx.PENSTYLE_SOLID))
         dc.SetBrush(wx.Brush(color))
 
-        if cursors:
-            if self.mouseX1 is not None:
-                self.cursor1 = self.drawCursor(dc, data, self.mouseX1, "A")
-            if self.mouseX2 is not None:
-                self.cursor2 = self.drawCursor(dc, data, self.mouseX2, "B")
-
         # set up a dcclipper to constrain the lineart to the plot area
         wx.DCClipper(dc, self.dcleft, self.dctop, self.dcright - self.dcleft, self.dcbottom - self.dctop)
 
-        x, y = self.data2screen(*(np.array(data).T))
         N = len(x)
+        if N == 0:
+            return
 
         # if length = 1 or type is scatter, draw a point
+        # all points / segments are passed in a single call, so the number of wx calls does not depend on the data length
         if type == 'scatter' or N == 1:
-            for i in range(N):
-                dc.DrawCircle(x[i], y[i], self.markersize)
+            d = 2 * self.markersize
+            dc.DrawEllipseList(np.transpose([x - self.markersize, y - self.markersize, np.ones(N, dtype=int) * d, np.ones(N, dtype=int) * d]).tolist())
         else:    # draw line
-            for i in range(N - 1):
-                dc.DrawLine(x[i], y[i], x[i + 1], y[i + 1])
+            dc.DrawLines(np.transpose([x, y]).tolist())
 
     def drawCursor(self, dc, data, x, label):
         """Used internally to draw cursors.
@@ -1146,45 +1954,19 @@ class FSRSPlot(wx.Panel):
 
         return x, y
 
-    def drawContour(self, dc, cont):
-        """Used internally to draw a contour plot (cont) to a device context (dc).
-        `cont` is a tuple consisting of x-axis, y-axis and z-data (2d).
+    def prepareContour(self, cont):
+        """Used internally to calculate the cell colors of a contour plot (cont), which is a tuple consisting of x-axis, y-axis and z-data (2d).
+        Each cell between neighboring x and y values is colored according to the average of its four corners.
+
+        :returns: Tuple (x, y, colors) with x and y sorted ascending and colors as (Ny-1) x (Nx-1) x 3 array.
         """
-        Nx, Ny = len(cont[0]), len(cont[1])
-        x, y, z = cont
-        x, y = self.data2screen(x, y)
+        x, y, z = np.array(cont[0], dtype=float), np.array(cont[1], dtype=float), np.array(cont[2], dtype=float)
+        ix, iy = np.argsort(x), np.argsort(y)
+        x, y, z = x[ix], y[iy], z[iy][:, ix]
 
-        # set up a dcclipper to constrain the plot to the plot area
-        wx.DCClipper(dc, self.dcleft, self.dctop, self.dcright - self.dcleft, self.dcbottom - self.dctop)
+        zavg = 0.25 * (z[:-1, :-1] + z[1:, :-1] + z[:-1, 1:] + z[1:, 1:])
+        return x, y, self.getZColor(zavg, logscale=self.logz)
 
-        zavg = 0.25 * (z + np.roll(z, -1, axis=0) + np.roll(z, -1, axis=1) + np.roll(np.roll(z, -1, axis=0), -1, axis=0))
-        if self.logz:
-            zavg = np.nan_to_num(np.log10(zavg))
-        cols = self.getZColor(zavg)
-
-        for i in range(Nx - 1):
-            for j in range(Ny - 1):
-
-                x0, y0 = x[i], y[j]
-                x1, y1 = x[i + 1], y[j + 1]
-                if x0 > x1:
-                    x0, x1 = x1, x0
-                if y0 > y1:
-                    y0, y1 = y1, y0
-
-                color = wx.Colour(*cols[j, i])
-                dc.SetPen(wx.Pen(color, width=self.linewidth, style=wx.PENSTYLE_SOLID))
-                if x1 - x0 < 2:
-                    if y1 - y0 < 2:
-                        dc.DrawPoint(x0, y0)
-                    else:
-                        dc.DrawLine(x0, y0, x0, y1)
-                else:
-                    if y1 - y0 < 2:
-                        dc.DrawLine(x0, y0, x1, y0)
-                    else:
-                        dc.SetBrush(wx.Brush(color))
-                        dc.DrawRectangle(x0, y0, x1 - x0 + 1, y1 - y0 + 1)
 
 
 # simple plot window with a single plot canvas
@@ -1209,12 +1991,86 @@ class DualPlotFrame(wx.Frame):
         self.lowerPlotCanvas = FSRSPlot(self.splitter)
         self.splitter.SplitHorizontally(self.upperPlotCanvas, self.lowerPlotCanvas, sashPosition=size[1] / 2)
 
+    @contextmanager
+    def batchUpdate(self):
+        """Context manager to combine updates of both canvases into a single repaint each.
+        """
+        with self.upperPlotCanvas.batchUpdate():
+            with self.lowerPlotCanvas.batchUpdate():
+                yield self
+
+
+# write a rendered plot to disk; used by `FSRSPlot.saveImage` in a background thread
+def writeImageFile(img, filename):
+    """Save a wx.Image as PNG file. The image is written to a temporary file first, so that a partially written file is never visible.
+
+    :param wx.Image img: Image to save.
+    :param str filename: Filename of the PNG file.
+    """
+    if not img.SaveFile(filename + ".tmp", wx.BITMAP_TYPE_PNG):
+        print "WARNING: could not write image", filename
+        return
+    cutils.replaceFile(filename + ".tmp", filename)
+
+
+# measure repaint time of line / scatter plots as function of the number of points
+def benchmarkDrawLine(counts=[100, 1000, 10000, 100000, 1000000], size=(800, 600), repeats=5, type='line'):
+    """Measure the time needed to repaint a single line or scatter plot for different numbers of points.
+
+    The plot is drawn into an offscreen bitmap on the calling thread, so the result does not depend on screen updates. A wx.App has to exist.
+
+    :param list counts: Numbers of data points to test.
+    :param tuple size: Size of the plot frame in pixels.
+    :param int repeats: Number of repaints per point count; the average is reported.
+    :param str type: 'line' or 'scatter'.
+    :returns: List of tuples (number of points, average repaint time in ms).
+    """
+    import time
+
+    frame = PlotFrame(None, title="pyFSRS - Benchmark", size=size)
+    canvas = frame.plotCanvas
+    canvas.renderThreaded = False    # measure the full rendering time on this thread
+    w, h = canvas.GetClientSize()
+    bmp = wx.EmptyBitmap(w, h)
+    dc = wx.MemoryDC(bmp)
+
+    results = []
+    for N in counts:
+        x = np.linspace(0, 1000, N)
+        y = np.sin(x / 50.0) + 0.1 * np.random.randn(N)
+        if canvas.getNumberOfPlots() > 0:
+            canvas.removeLastPlot()
+        if type == 'scatter':
+            canvas.addScatter(x, y)
+        else:
+            canvas.addLine(x, y)
+
+        canvas.Draw(dc)    # first draw sets up the axes
+        t0 = time.time()
+        for i in range(repeats):
+            canvas.dataValid = False    # bypass the render cache
+            canvas.Draw(dc)
+        dt = (time.time() - t0) / float(repeats) * 1000.0
+        results.append((N, dt))
+        print "%-8s %10d points: %8.2f ms" % (type, N, dt)
+
+    dc.SelectObject(wx.NullBitmap)
+    frame.Destroy()
+    return results
+
 # ----------------------------------------------------------------------------------------------------------------------------
 # for development
+# run with argument 'benchmark' to measure the repaint time of line and scatter plots
 if __name__ == '__main__':
     # setup a wxPython app
     app = wx.App()
 
+    import sys
+    if "benchmark" in sys.argv:
+        benchmarkDrawLine(type='line')
+        benchmarkDrawLine(type='scatter')
+        sys.exit(0)
+
     # get an instance of a plot frame
     frame = PlotFrame(None, title="pyFSRS - Test plot panel", size=(640, 480))
     frame.Show()
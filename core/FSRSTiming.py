@@ -0,0 +1,295 @@
+"""
+.. module: FSRSTiming
+   :platform: Windows
+.. moduleauthor:: Daniel R. Dietze <daniel.dietze@berkeley.edu>
+
+FSRSTiming estimates the duration of a scan before it is started and provides timing-accurate simulated devices for dry runs.
+
+The estimate combines the acquisition time of the camera (`acquisitionTime`, e.g. based on the readout time calculated by picam),
+the travel time model of the axis (`Axis.travelTime`), the switching time of the shutter (`switchTime`) and a per-step overhead
+covering file I/O and GUI updates. The overhead is measured at the end of every scan (`ScanClock`) and used for subsequent estimates.
+
+For a dry run, the devices are wrapped in `SimCamera`, `SimAxis`, `SimOutput` and `SimInput`, which do not access the hardware but
+take as long as the real devices are expected to take. Running the scan thread against these gives the actual duration including all overheads.
+
+Example usage::
+
+    import core.FSRSTiming as timing
+
+    est = timing.estimateScanDuration(ccd, axis, shutter, points, frames=8000, sets=4, ground=True)
+    print timing.formatDuration(est["total"])
+
+..
+   This file is part of the pyFSRS app.
+
+   This program is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+   Copyright 2014-2016 Daniel Dietze <daniel.dietze@berkeley.edu>.
+"""
+import time
+import numpy as np
+
+import FSRSutils as cutils
+
+
+defaultOverhead = 0.05      #: per-step overhead in s used until a scan has been timed
+measuredOverheads = {}      #: measured per-step overheads in s, keyed by experiment name
+
+
+# ##########################################################################################################################
+# device timing
+def getAcquisitionTime(ccd, N):
+    """Returns the time in s needed by `ccd.readNframes(N)`. Cameras without an `acquisitionTime` function are assumed to run at 1kHz.
+    """
+    if hasattr(ccd, "acquisitionTime"):
+        return float(ccd.acquisitionTime(N))
+    return N * 1e-3
+
+
+def getSwitchTime(output):
+    """Returns the time in s needed by a write to the output device, e.g. for opening or closing a shutter.
+    """
+    return float(getattr(output, "switchTime", 0.0))
+
+
+def getOverhead(key):
+    """Returns the measured per-step overhead in s for the given experiment or `defaultOverhead` if it has not been measured yet.
+    """
+    return measuredOverheads.get(key, defaultOverhead)
+
+
+def recordOverhead(key, overhead):
+    """Update the measured per-step overhead of the given experiment. Successive measurements are averaged with equal weight for the latest value.
+    """
+    if key in measuredOverheads:
+        overhead = 0.5 * (measuredOverheads[key] + overhead)
+    measuredOverheads[key] = max(0.0, overhead)
+
+
+# ##########################################################################################################################
+# estimate
+def estimateScanDuration(ccd, axis, shutter, points, frames, sets=1, order=0, ground=False, poll=0.1, overhead=None):
+    """Estimate the duration of a scan as performed by the scan thread of `FSRSScan`.
+
+    Per set, the stage moves through the points in the given order and waits for the stage before reading `frames` frames at every point.
+    Waiting for the stage is rounded up to the polling interval of the scan thread. When ground state spectra are recorded, the
+    shutter is closed at the beginning of each set and the ground state spectrum is recorded while the stage moves to the first point.
+    The initial approach of the first point is not included.
+
+    :param Camera ccd: Camera used for the scan.
+    :param Axis axis: Axis used for the scan.
+    :param Output shutter: Shutter used for the scan.
+    :param array points: Stage positions as returned by `FSRSutils.prepareScanPoints`.
+    :param int frames: Number of frames per step.
+    :param int sets: Number of sets (default = 1).
+    :param int order: Index of the order in `FSRSutils.scanOrders` (default = 0).
+    :param bool ground: If True, a ground state spectrum is recorded at the beginning of each set (default = False).
+    :param float poll: Polling interval in s for the stage (default = 0.1).
+    :param float overhead: Per-step overhead in s (default = `defaultOverhead`).
+    :returns: Dictionary with the times in s spent for 'acquisition', 'motion', 'shutter' and 'overhead', the 'total' time and the number of 'steps'.
+    """
+    points = np.asarray(points, dtype=float)
+    N = len(points)
+    tacq = getAcquisitionTime(ccd, frames)
+    tsw = getSwitchTime(shutter)
+    if overhead is None:
+        overhead = defaultOverhead
+
+    motion = 0.0
+    for s in range(sets):
+        path = points[cutils.getSetOrder(N, s, order)]
+        tmove = np.atleast_1d(axis.travelTime(path[:-1], path[1:]))
+        motion += np.sum(np.ceil(tmove / poll) * poll)
+
+        # move to the first point of the next set; partly hidden behind the ground state spectrum
+        if s + 1 < sets:
+            tnext = float(axis.travelTime(path[-1], points[cutils.getSetOrder(N, s + 1, order)[0]]))
+            if ground:
+                tnext = max(0.0, tnext - tacq - 2 * tsw)
+            motion += np.ceil(tnext / poll) * poll
+
+    steps = N * sets + (sets if ground else 0)
+    est = {"acquisition": steps * tacq,
+           "motion": float(motion),
+           "shutter": tsw * (2 * sets + 1 if ground else 2),
+           "overhead": steps * overhead,
+           "steps": steps}
+    est["total"] = est["acquisition"] + est["motion"] + est["shutter"] + est["overhead"]
+    return est
+
+
+def formatDuration(t):
+    """Returns a duration in s as short string, e.g. '2h 05m', '4m 10s' or '12s'.
+    """
+    t = int(round(max(0, t)))
+    if t >= 3600:
+        return "%dh %02dm" % (t // 3600, (t % 3600) // 60)
+    if t >= 60:
+        return "%dm %02ds" % (t // 60, t % 60)
+    return "%ds" % t
+
+
+# ##########################################################################################################################
+# progress tracking
+class ScanClock():
+    """Keeps track of the progress of a running scan and predicts the remaining time.
+
+    The remaining time is a blend of the estimate and the time per step measured so far, where the measurement gets more
+    weight as the scan progresses.
+
+    :param dict estimate: Estimate as returned by `estimateScanDuration`.
+    """
+    def __init__(self, estimate):
+        self.estimate = estimate
+        self.duration = estimate["total"]
+        self.steps = max(1, estimate["steps"])
+        self.done = 0
+        self.started = time.time()
+
+    def step(self, n=1):
+        """Register `n` completed steps.
+        """
+        self.done += n
+
+    def getElapsed(self):
+        return time.time() - self.started
+
+    def getRemaining(self):
+        """Returns the predicted remaining time in s.
+        """
+        w = min(1.0, float(self.done) / self.steps)
+        predicted = self.duration * (1.0 - w)
+        if self.done == 0:
+            return max(0.0, self.duration - self.getElapsed())
+        measured = self.getElapsed() / self.done * (self.steps - self.done)
+        return (1.0 - w) * predicted + w * measured
+
+    def getETA(self):
+        """Returns the predicted time of completion in seconds since the epoch.
+        """
+        return time.time() + self.getRemaining()
+
+    def getOverhead(self):
+        """Returns the measured per-step overhead in s, i.e., the time per completed step not accounted for by the device timing.
+        """
+        if self.done == 0:
+            return 0.0
+        devices = self.duration - self.estimate["overhead"]
+        return (self.getElapsed() - devices * float(self.done) / self.steps) / self.done
+
+
+# ##########################################################################################################################
+# simulated devices for dry runs
+def _wait(t, canQuit=None):
+    if canQuit is not None:
+        canQuit.wait(t)
+    else:
+        time.sleep(t)
+
+
+class SimCamera():
+    """Simulated camera that takes as long as the given camera to read frames and returns random data.
+
+    :param Camera ccd: Camera to simulate.
+    :param int pixels: Number of pixels of the simulated data (default = 1024).
+    """
+    def __init__(self, ccd, pixels=1024):
+        self.ccd = ccd
+        self.name = ccd.name
+        self.pixels = pixels
+
+    def acquisitionTime(self, N):
+        return getAcquisitionTime(self.ccd, N)
+
+    def read(self):
+        return self.readNframes(80)[0].mean()
+
+    def readNframes(self, N, canQuit=None):
+        _wait(self.acquisitionTime(N), canQuit)
+        A = 1.0 + 0.01 * np.random.rand(self.pixels)
+        B = 1.0 + 0.01 * np.random.rand(self.pixels)
+        return np.array([A / B, A, B])
+
+
+class SimAxis():
+    """Simulated axis that moves according to the travel time model of the given axis. The first move is instantaneous.
+
+    :param Axis axis: Axis to simulate.
+    """
+    def __init__(self, axis):
+        self.axis = axis
+        self.name = axis.name
+        self.position = None
+        self.arrival = 0.0
+        self.trajectory = np.array([])
+        self.trajectoryIndex = -1
+
+    def travelTime(self, fr, to):
+        return self.axis.travelTime(fr, to)
+
+    def pos(self):
+        return self.position if self.position is not None else 0.0
+
+    def goto(self, pos):
+        if self.position is not None:
+            self.arrival = time.time() + float(self.travelTime(self.position, pos))
+        self.position = pos
+
+    def is_moving(self):
+        return time.time() < self.arrival
+
+    # trajectories are always run point by point, like the software fallback of `Axis.load_trajectory`
+    def load_trajectory(self, points, dwell=0.0, trigger="software"):
+        self.trajectory = np.atleast_1d(np.array(points, dtype=float))
+        self.trajectoryIndex = -1
+
+    def next_point(self):
+        if self.trajectoryIndex + 1 >= len(self.trajectory):
+            return -1
+        self.trajectoryIndex += 1
+        self.goto(self.trajectory[self.trajectoryIndex])
+        return self.trajectoryIndex
+
+    def trajectory_index(self):
+        return self.trajectoryIndex
+
+
+class SimOutput():
+    """Simulated output device, e.g. a shutter, that takes as long as the given device to switch.
+
+    :param Output output: Output device to simulate.
+    """
+    def __init__(self, output):
+        self.output = output
+        self.name = output.name
+        self.switchTime = getSwitchTime(output)
+
+    def write(self, value):
+        time.sleep(self.switchTime)
+
+
+class SimInput():
+    """Simulated input device returning zero.
+
+    :param Input input: Input device to simulate.
+    """
+    def __init__(self, input):
+        self.input = input
+        self.name = input.name
+
+    def read(self):
+        return 0.0
+
+    def hasProperty(self, label):
+        return False
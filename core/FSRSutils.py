@@ -24,6 +24,14 @@ This module provides some utility functions that are used internally in pyFSRS.
    Copyright 2014-2016 Daniel Dietze <daniel.dietze@berkeley.edu>.
 """
 import numpy as np
+import os
+import re
+import sys
+import ctypes
+
+
+# orders in which the scan points can be approached; the index corresponds to the value of the 'Order' property
+scanOrders = ["sequential", "random", "interleaved", "serpentine", "bounded random"]
 
 
 # append stage parameters to a property dictionary
@@ -36,8 +44,13 @@ def appendStageParameters(prop, fr=-500, to=2500, st=20):
         - **From (fs)** (textbox): Set the starting position. When value changes, `onAxisRangeChange` is called (has to be implemented by user).
         - **Till (fs)** (textbox): Set the ending position. When value changes, `onAxisRangeChange` is called (has to be implemented by user).
         - **Step Size (fs)** / **# of Steps** (textbox): Set the desired step size (linear stepping) or number of steps (logarithmic stepping). When value changes, `onAxisRangeChange` is called (has to be implemented by user).
-        - **Mode** (choice): Set type of stepping ('linear', 'logarithmic', 'from file'). When value changes, `onAxisRangeChange` is called (has to be implemented by user).
-        - **Random** (checkbox): If True, the target positions are approached in random order, otherwise sequential. Works for all modes.
+        - **Mode** (choice): Set type of stepping ('linear', 'logarithmic', 'from file', 'hybrid'). When value changes, `onAxisRangeChange` is called (has to be implemented by user).
+        - **Lin. Window (fs)** (textbox): End of the linearly sampled window in hybrid mode, see `hybridScanPoints`.
+        - **Point Budget** (textbox): Total number of positions in hybrid mode.
+        - **Delays** (label): Summary of the resulting positions, updated by `onAxisRangeChange`.
+        - **Preview** (button): Plot the resulting positions. Calls `onPreviewScanPoints` (has to be implemented by user).
+        - **Order** (choice): Order in which the target positions are approached (see `scanOrders` and `orderScanPoints`). Works for all modes.
+        - **Max Jump (fs)** (textbox): Largest allowed step between consecutive positions for the 'bounded random' order (0 = unlimited).
         - **Use File** (fie picker): Select a text file containing the desired stage positions. If there are several columns in the file, only the first one is used.
 
     :param dict prop: Property dictionary to which the controls are appended.
@@ -49,8 +62,13 @@ def appendStageParameters(prop, fr=-500, to=2500, st=20):
     prop.append({"label": "From (fs)", "type": "input", "value": str(fr), "info": "float", "event": "onAxisRangeChange"})
     prop.append({"label": "Till (fs)", "type": "input", "value": str(to), "info": "float", "event": "onAxisRangeChange"})
     prop.append({"label": "Step Size (fs)", "type": "input", "value": str(st), "info": "float", "event": "onAxisRangeChange"})
-    prop.append({"label": "Mode", "type": "choice", "choices": ["linear", "logarithmic", "from file"], "value": 0, "event": "onAxisRangeChange"})
-    prop.append({"label": "Random", "type": "checkbox", "value": 0, "info": "randomize steps"})
+    prop.append({"label": "Mode", "type": "choice", "choices": ["linear", "logarithmic", "from file", "hybrid"], "value": 0, "event": "onAxisRangeChange"})
+    prop.append({"label": "Lin. Window (fs)", "type": "input", "value": str(min(to, 1000)), "info": "float", "event": "onAxisRangeChange"})
+    prop.append({"label": "Point Budget", "type": "input", "value": "100", "info": "int", "event": "onAxisRangeChange"})
+    prop.append({"label": "Delays", "type": "label", "value": ""})
+    prop.append({"label": "Preview", "type": "button", "value": "Preview Delays", "event": "onPreviewScanPoints"})
+    prop.append({"label": "Order", "type": "choice", "choices": scanOrders, "value": 0})
+    prop.append({"label": "Max Jump (fs)", "type": "input", "value": "0", "info": "float"})
     prop.append({"label": "Use File", "type": "file", "value": "", "info": "open"})
     return prop
 
@@ -82,14 +100,110 @@ def onAxisRangeChange(self, event):
         N = max(2, int(abs(stop - start) / abs(steps) + 1))
         stop = (N - 1) * steps + start    # adjust end point to match step size; step size can be negative
 
+    elif mode == 3:    # hybrid - step size of the linear window
+        self.getPropertyByLabel("step").setLabel("Step Size (fs)")
+
     self.getPropertyByLabel("from").setValue(str(start))
     self.getPropertyByLabel("till").setValue(str(stop))
     self.getPropertyByLabel("step").setValue(str(steps))
 
+    # show a summary of the resulting positions; files are only read when the scan starts
+    summary = ""
+    if mode != 2:
+        try:
+            points = getScanPoints(self)
+            if len(points) > 0:
+                summary = "%d points, %g to %g fs" % (len(points), np.amin(points), np.amax(points))
+        except ValueError:    # incomplete input
+            pass
+    self.getPropertyByLabel("delays").setValue(summary)
+
+
+# call this event handler within the experiment class employing the stage parameters
+def onPreviewScanPoints(self, event=None):
+    """Plots the stage positions resulting from the current settings in a new window.
+
+    Call this event handler from within an event handler of the same name in the module using the stage.
+    """
+    import FSRSPlot    # FSRSPlot depends on this module
+
+    points = np.sort(getScanPoints(self))
+    if len(points) == 0:
+        return
+
+    frame = FSRSPlot.PlotFrame(None, title="Delays (%d points)" % len(points), size=(480, 360))
+    frame.plotCanvas.setXLabel("Point")
+    frame.plotCanvas.setYLabel("Delay (fs)")
+    frame.plotCanvas.addScatter(np.arange(len(points)), points)
+    frame.Show()
+
+
+# geometrically growing steps
+def geometricSteps(d0, length, N):
+    """Returns up to N positions in (0, `length`] whose spacing starts at `d0` and grows by a constant factor, so that the last position is `length`.
+
+    If N steps of size `d0` already cover the whole length, fewer, linearly spaced positions with a spacing of at least `d0` are returned.
+    """
+    if N < 1 or length <= 0:
+        return np.array([])
+    if N * d0 >= length:
+        N = max(1, int(length / d0))
+        return np.linspace(length / N, length, N)
+
+    # find the growth factor r by bisection: d0 * (r^N - 1) / (r - 1) = length
+    lo, hi = 1.0, 2.0
+    while d0 * (hi**N - 1) / (hi - 1) < length:
+        hi *= 2.0
+    for i in range(100):
+        r = 0.5 * (lo + hi)
+        if d0 * (r**N - 1) / (r - 1) < length:
+            lo = r
+        else:
+            hi = r
+
+    x = np.cumsum(d0 * (0.5 * (lo + hi))**np.arange(N))
+    return x * length / x[-1]
+
+
+# hybrid sampling
+def hybridScanPoints(start, window, stop, step, budget):
+    """Returns ascending stage positions sampled linearly from `start` to `window` and with logarithmically growing steps from `window` to `stop`.
+
+    The linear window may include negative delays and zero. The steps in the tail start with the step size of the linear window and grow by a
+    constant factor so that the tail uses the remaining points of the budget. If the linear window alone would exceed the budget, its step size
+    is increased such that at least a quarter of the budget is left for the tail. The tail always keeps at least one point, so that `stop` is
+    included; a budget too small for `start`, `window` and `stop` is increased accordingly.
+
+    :param float start: First position.
+    :param float window: End of the linear window.
+    :param float stop: Last position.
+    :param float step: Step size within the linear window.
+    :param int budget: Total number of positions.
+    :returns: Array of positions.
+    """
+    start, stop = min(start, stop), max(start, stop)
+    window = min(max(window, start), stop)
+    step = abs(step)
+    budget = max(2, int(budget))
+    tail = stop > window
+    if tail:
+        budget = max(budget, 3 if window > start else 2)
+
+    N = int(round((window - start) / step)) + 1 if step > 0 else 2
+    if tail:
+        N = min(N, budget - max(1, budget // 4))
+    N = max(2 if window > start else 1, min(N, budget))
+    points = np.linspace(start, window, N)
+
+    if tail:
+        d0 = (window - start) / (N - 1) if N > 1 else (step if step > 0 else (stop - window) / budget)
+        points = np.concatenate([points, window + geometricSteps(d0, stop - window, budget - N)])
+    return points
+
 
 # returns a list of time points using the given parameters
-def prepareScanPoints(self):
-    """Returns a list of stage positions according to the current stage settings.
+def getScanPoints(self):
+    """Returns the stage positions according to the current stage settings in their natural order, i.e., without applying the order setting.
 
     Call from within the module using the stage as this function directly reads the stage settings from the module properties.
     """
@@ -107,6 +221,11 @@ def prepareScanPoints(self):
         N = max(2, int(abs(stop - start) / abs(steps) + 1))
         points = np.linspace(start, stop, N)
 
+    elif mode == 3:    # hybrid
+        window = float(self.getPropertyByLabel("window").getValue())
+        budget = int(float(self.getPropertyByLabel("budget").getValue()))
+        points = hybridScanPoints(start, window, stop, steps, budget)
+
     else:
         print "load", self.getPropertyByLabel("use file").getValue()
         if self.getPropertyByLabel("use file").getValue() != "":    # load from file
@@ -114,12 +233,232 @@ def prepareScanPoints(self):
             if len(points.shape) > 1:    # got several columns
                 points = points[0]
 
-    if self.getPropertyByLabel("random").getValue():
+    return points
+
+
+# returns a list of time points using the given parameters
+def prepareScanPoints(self, axis=None, sets=1):
+    """Returns a list of stage positions according to the current stage settings, arranged in the selected order.
+
+    Call from within the module using the stage as this function directly reads the stage settings from the module properties.
+    If an axis is given, the estimated motion time of all available orders is printed for comparison.
+
+    :param Axis axis: Axis used for the scan (optional).
+    :param int sets: Number of sets, used for the motion time estimate (default = 1).
+    """
+    points = getScanPoints(self)
+
+    order = self.getPropertyByLabel("order").getValue()
+    maxjump = abs(float(self.getPropertyByLabel("max jump").getValue()))
+    ordered = orderScanPoints(points, order, maxjump)
+
+    if axis is not None and len(points) > 0:
+        print "estimated motion time for %d points x %d sets:" % (len(points), sets)
+        for i, (name, t) in enumerate(reportMotionTimes(axis, points, sets, maxjump)):
+            if i == order:    # report the actual realization of the selected order
+                t = estimateMotionTime(axis, ordered, sets, order)
+            print "  %s %-15s %8.1f s" % ("*" if i == order else " ", name, t)
+
+    return ordered
+
+
+# arrange scan points according to the given order
+def orderScanPoints(points, order=0, maxjump=0):
+    """Returns a copy of the stage positions arranged in the given order.
+
+    - **sequential** and **serpentine**: Positions are kept as given. For serpentine, every other set is scanned backwards (see `getSetOrder`).
+    - **random**: Positions are shuffled.
+    - **interleaved**: Coarse-to-fine ordering; the sorted positions are approached in bit-reversed index order, so that every
+      partial scan covers the full delay range.
+    - **bounded random**: Random walk starting at the first position, where each step goes to a randomly chosen, not yet visited position
+      no farther than `maxjump` away. If there is none, the closest one is used. With `maxjump` <= 0, this is identical to random.
+
+    :param array points: Stage positions.
+    :param int order: Index of the order in `scanOrders`.
+    :param float maxjump: Largest allowed step for bounded random order.
+    :returns: Array of stage positions.
+    """
+    points = np.array(points, dtype=float)
+    N = len(points)
+
+    if order == 1 or (order == 4 and maxjump <= 0):    # random
         np.random.shuffle(points)
 
+    elif order == 2 and N > 2:    # interleaved
+        bits = int(np.ceil(np.log2(N)))
+        ind = np.arange(2**bits)
+        rev = np.zeros_like(ind)
+        for b in range(bits):
+            rev |= ((ind >> b) & 1) << (bits - 1 - b)
+        points = np.sort(points)[rev[rev < N]]
+
+    elif order == 4 and N > 1:    # bounded random
+        remaining = range(1, N)
+        path = [0]
+        while len(remaining) > 0:
+            d = np.absolute(points[remaining] - points[path[-1]])
+            candidates = np.where(d <= maxjump)[0]
+            i = np.random.choice(candidates) if len(candidates) > 0 else np.argmin(d)
+            path.append(remaining.pop(i))
+        points = points[path]
+
     return points
 
 
+# returns the order of the scan points for a given set
+def getSetOrder(N, set, order=0):
+    """Returns the indices of the scan points in the order they are approached during the given set.
+
+    For serpentine order, odd sets are scanned backwards so that the stage does not have to return to the start between sets.
+    For all other orders, the points are used as returned by `orderScanPoints`.
+
+    :param int N: Number of scan points.
+    :param int set: Number of the set, starting with 0.
+    :param int order: Index of the order in `scanOrders`.
+    :returns: Index array.
+    """
+    if order == 3 and set % 2 == 1:
+        return np.arange(N)[::-1]
+    return np.arange(N)
+
+
+# estimate the motion time of a scan
+def estimateMotionTime(axis, points, sets=1, order=0):
+    """Returns the estimated total time in s the axis spends moving during a scan, including the return to the first position.
+
+    :param Axis axis: Axis used for the scan; provides the travel time model.
+    :param array points: Stage positions as returned by `orderScanPoints`.
+    :param int sets: Number of sets.
+    :param int order: Index of the order in `scanOrders`.
+    """
+    points = np.asarray(points, dtype=float)
+    path = np.concatenate([points[getSetOrder(len(points), s, order)] for s in range(sets)] + [points[:1]])
+    return float(np.sum(axis.travelTime(path[:-1], path[1:])))
+
+
+def reportMotionTimes(axis, points, sets=1, maxjump=0):
+    """Returns a list of tuples (name, estimated motion time in s), one for each entry in `scanOrders`.
+
+    The random orders are evaluated for a single realization.
+
+    :param Axis axis: Axis used for the scan.
+    :param array points: Stage positions.
+    :param int sets: Number of sets.
+    :param float maxjump: Largest allowed step for bounded random order.
+    """
+    return [(name, estimateMotionTime(axis, orderScanPoints(points, i, maxjump), sets, i)) for i, name in enumerate(scanOrders)]
+
+
+# adaptive sampling
+def estimateNoise(y):
+    """Returns a robust estimate of the noise level of a sequence of values that vary smoothly, based on the median absolute second difference.
+    """
+    y = np.asarray(y, dtype=float)
+    if len(y) < 3:
+        return 0.0
+    return np.median(np.absolute(y[:-2] - 2 * y[1:-1] + y[2:])) / (0.6745 * np.sqrt(6.0))
+
+
+def getDelaySignal(mean, stderr, band=None, svd=False):
+    """Reduce a (delay x pixel) map to a single signal value per delay, together with its standard error.
+
+    :param array mean: Averaged (delay x pixel) map.
+    :param array stderr: Standard error of the mean with the same shape.
+    :param slice band: Spectral window to use (default = all pixels).
+    :param bool svd: If False (default), return the band integral (mean over the band), otherwise the amplitude of the first SVD component,
+        i.e., the projection onto the spectrum that changes most with delay.
+    :returns: Tuple (signal, stderr) of 1d-arrays with one value per delay.
+    """
+    mean = np.nan_to_num(np.asarray(mean, dtype=float))
+    stderr = np.nan_to_num(np.asarray(stderr, dtype=float))
+    if band is not None:
+        mean = mean[:, band]
+        stderr = stderr[:, band]
+
+    if svd and mean.shape[0] > 1:
+        U, S, Vt = np.linalg.svd(mean - np.mean(mean, axis=0), full_matrices=False)
+        return np.dot(mean, Vt[0]), np.sqrt(np.dot(stderr**2, Vt[0]**2))
+
+    return np.mean(mean, axis=1), np.sqrt(np.sum(stderr**2, axis=1)) / mean.shape[1]
+
+
+def refineScanPoints(points, signal, noise=None, N=1, minstep=0):
+    """Returns up to N new stage positions where the measured signal changes fastest relative to its noise.
+
+    Each interval between neighboring positions is scored by the change of the signal across the interval in units of its standard error.
+    The new positions are the centers of the N highest scoring intervals. Intervals shorter than 2 * `minstep` are not split.
+
+    :param array points: Measured positions in any order.
+    :param array signal: Signal value per position.
+    :param array noise: Standard error per position. If None or all zero, a common noise level is estimated from the data (see `estimateNoise`).
+    :param int N: Maximum number of new positions (default = 1).
+    :param float minstep: Minimum spacing between positions (default = 0).
+    :returns: Sorted array of new positions.
+    """
+    points = np.asarray(points, dtype=float)
+    ind = np.argsort(points)
+    x = points[ind]
+    y = np.asarray(signal, dtype=float)[ind]
+    if len(x) < 2:
+        return np.array([])
+
+    if noise is None or not np.any(np.asarray(noise) > 0):
+        s = np.ones(len(x)) * estimateNoise(y)
+    else:
+        s = np.asarray(noise, dtype=float)[ind]
+
+    sigma = np.sqrt(s[:-1]**2 + s[1:]**2)
+    score = np.absolute(np.diff(y)) / np.where(sigma > 0, sigma, np.amax(np.append(sigma, 1e-12)))
+    score[np.diff(x) < 2 * max(minstep, 0)] = -1
+
+    best = np.argsort(score)[::-1][:max(0, int(N))]
+    best = best[score[best] >= 0]
+    return np.sort(0.5 * (x[best] + x[best + 1]))
+
+
+# noise targets
+def convertSpectrum(val, type=0):
+    """Returns a copy of the 3xN array (A, B, C) returned by the cameras, where column A is converted according to the type of measurement,
+    i.e., -ln(A) for FSRS (type 0), -log10(A) for TA (type 1) or unchanged for T/T0 (type 2).
+    """
+    A, B, C = np.array(val, dtype=float)
+    if type == 0:
+        A = -np.log(A)
+    elif type == 1:
+        A = -np.log10(A)
+    return np.array([A, B, C])
+
+
+def parsePixelWindows(text):
+    """Parse a comma separated list of pixel windows, e.g. '100:300, 500:700', into a list of slices. Returns None if the text is empty.
+
+    Raises a ValueError if the text is not understood.
+    """
+    windows = []
+    for w in text.split(","):
+        if w.strip() == "":
+            continue
+        a, b = w.split(":")
+        windows.append(slice(int(a), int(b)))
+    return windows if len(windows) > 0 else None
+
+
+def getNoiseLevel(stats, windows=None, column=0):
+    """Returns the noise level of an averaged spectrum, i.e., the RMS of the per-pixel standard error of the mean within the given pixel windows.
+
+    :param RunningStats stats: Running statistics of the spectra (3xN arrays).
+    :param list windows: List of slices selecting the pixels (default = all pixels).
+    :param int column: Column of the spectra (0 = A (default), 1 = B, 2 = C).
+    :returns: Noise level or inf if there are less than two spectra.
+    """
+    if stats is None or stats.N < 2:
+        return np.inf
+    err = stats.getStdError()[column]
+    if windows is not None:
+        err = np.concatenate([err[w] for w in windows])
+    return np.sqrt(np.mean(err**2))
+
+
 # shortcut to save multicolumn data
 def saveFSRS(filename, data):
     """Shortcut to save N-column data using numpy's `savetxt`.
@@ -130,6 +469,22 @@ def saveFSRS(filename, data):
     np.savetxt(filename, np.transpose(data), delimiter="\t")
 
 
+# rename a file, replacing the destination
+def replaceFile(src, dst):
+    """Rename `src` to `dst`, atomically replacing `dst` if it exists.
+
+    Use this to save files atomically by writing to a temporary file first: readers see either the old or the new file and a crash
+    leaves at least one of them on disk. On Windows, `os.rename` fails when the destination exists, so `MoveFileEx` is used instead.
+    """
+    if os.name == "nt":
+        src, dst = [f if isinstance(f, unicode) else f.decode(sys.getfilesystemencoding()) for f in (src, dst)]
+        # MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH
+        if not ctypes.windll.kernel32.MoveFileExW(src, dst, 0x1 | 0x8):
+            raise ctypes.WinError()
+    else:
+        os.rename(src, dst)
+
+
 # save cross correlation data
 # the first column is the time delay in fs
 # the other columns correspond to the wavelengths of the spectrograph
@@ -179,3 +534,128 @@ def formatFSRSFilename(type, basename, step, set=0, shutter=0):
 
     name += str(set)
     return name
+
+
+# regular expression matching the historical Mathies lab file names; the basename may contain underscores itself
+FSRSFilenamePattern = re.compile(r"^(?P<basename>.+)_(?P<sign>[pm]?)(?P<step>\d+)(?P<state>gr|exc|_)(?P<set>\d+)$")
+
+
+# reverse of formatFSRSFilename
+def parseFSRSFilename(filename):
+    """Parse a filename that was generated by `formatFSRSFilename`.
+
+    Only the last path component is parsed, the directory is returned as part of the basename.
+    As `formatFSRSFilename` truncates the stage position to an integer, the returned step is only exact for integer positions.
+    TA and dT/T files do not carry a shutter state. They are assigned to state 1 (open), as these modes keep the actinic shutter open.
+
+    :param str filename: Filename of a FSRS or TA data file.
+    :returns: Tuple (type, basename, step, set, shutter) with the same meaning as the arguments of `formatFSRSFilename` or None if the filename does not follow the convention.
+    """
+    path, name = os.path.split(filename)
+    m = FSRSFilenamePattern.match(name)
+    if m is None:
+        return None
+
+    step = int(m.group("step"))
+    if m.group("sign") == "m":
+        step = -step
+
+    if m.group("state") == "_":    # TA and dT/T
+        type, shutter = 1, 1
+    else:
+        type, shutter = 0, int(m.group("state") == "exc")
+
+    return type, os.path.join(path, m.group("basename")), step, int(m.group("set")), shutter
+
+
+# ##########################################################################################################################
+# running statistics
+class RunningStats():
+    """Running mean and variance of a sequence of equally shaped arrays using Welford's algorithm.
+
+    This is numerically stable and requires only a single pass, so it is well suited for averaging spectra while they are acquired.
+    """
+    def __init__(self):
+        self.N = 0
+        self.mean = None
+        self.M2 = None
+
+    def add(self, x):
+        """Add a new data array.
+        """
+        x = np.array(x, dtype=float)
+        self.N += 1
+        if self.N == 1:
+            self.mean = x.copy()
+            self.M2 = np.zeros(x.shape)
+        else:
+            delta = x - self.mean
+            self.mean += delta / float(self.N)
+            self.M2 += delta * (x - self.mean)
+
+    def getVariance(self):
+        """Returns the sample variance (zero if there are less than two samples).
+        """
+        if self.N < 2:
+            return np.zeros(self.M2.shape)
+        return self.M2 / float(self.N - 1)
+
+    def getStdError(self):
+        """Returns the standard error of the mean.
+        """
+        return np.sqrt(self.getVariance() / float(max(1, self.N)))
+
+
+class RunningDelayMap():
+    """Running per-delay, per-state average over all sets of a scan.
+
+    Spectra are passed as 3xN arrays (A, B, C) like the ones returned by the cameras. Delays do not have to be known in advance.
+    """
+    def __init__(self):
+        self.stats = {}    # (delay, state) -> RunningStats
+
+    def add(self, delay, state, val):
+        """Add a spectrum recorded at the given delay and shutter state (0 = ground state, 1 = excited state).
+        """
+        key = (float(delay), int(state))
+        if key not in self.stats:
+            self.stats[key] = RunningStats()
+        self.stats[key].add(val)
+
+    def getStats(self, delay, state):
+        """Returns the RunningStats instance for the given delay and state or None.
+        """
+        return self.stats.get((float(delay), int(state)), None)
+
+    def getStates(self):
+        """Returns a sorted list of recorded shutter states.
+        """
+        return sorted(set(k[1] for k in self.stats))
+
+    def getMap(self, state=1, column=0):
+        """Returns the averaged (delay x pixel) map for the given state and column.
+
+        :param int state: Shutter state (default = 1).
+        :param int column: Column of the spectra (0 = A (default), 1 = B, 2 = C).
+        :returns: Tuple (delays, mean, variance, N) with delays sorted ascending, mean and variance as 2d-arrays and N the number of averaged spectra per delay.
+        """
+        delays = sorted(k[0] for k in self.stats if k[1] == state)
+        mean = np.array([self.stats[(t, state)].mean[column] for t in delays])
+        var = np.array([self.stats[(t, state)].getVariance()[column] for t in delays])
+        N = np.array([self.stats[(t, state)].N for t in delays])
+        return np.array(delays), mean, var, N
+
+    def save(self, basename, column=0):
+        """Save the averaged maps for all recorded states.
+
+        For each state, the mean and variance are written as `basename_avg_<state>.txt` and `basename_var_<state>.txt`, where state is 'gr' or 'exc'.
+        The file format is the same as for `saveXC`, i.e. the first column contains the delays and the other columns the pixels.
+        Files are replaced atomically, so that an up-to-date and complete average is available at any time during the scan.
+        """
+        for state in self.getStates():
+            delays, mean, var, _ = self.getMap(state, column)
+            name = "exc" if state else "gr"
+            for prefix, d in [("avg", mean), ("var", var)]:
+                filename = "%s_%s_%s.txt" % (basename, prefix, name)
+                saveXC(filename + ".tmp", delays, d)
+                replaceFile(filename + ".tmp", filename)
@@ -235,7 +235,11 @@ class OptPlot(wx.Panel):
         # each entry consists of a value between 0 (min) and 1 (max) and a color
         # the actual color is generated by linear interpolation between neighboring entries
         # make sure that you sort the entries ascending!
+        # z-values are mapped onto colors using a lookup table that is generated from the colormap by `setColormap`
         self.colormap = []
+        self.lutsize = 4096         # number of entries in the lookup table
+        self.colorLUT = []          # lookup table, lutsize x 3 array of r, g, b values
+        self.nancolor = [255, 255, 255]    # color for NaN and, on logscale, non-positive z values
         self.imgcolormap = []    # version for images with reduced color depth (256)
         self.setColormap("rgb")  # initialize colormaps
 
@@ -421,14 +425,16 @@ class OptPlot(wx.Panel):
         """
         # get image width and height
         h, w = z.shape
-        min, max = np.amin(z), np.amax(z)
+        min, max = np.nanmin(z), np.nanmax(z)
+        if min == max:
+            min, max = min - 1, max + 1
 
-        # these are color indices
-        c = (((z.flatten() - min) / (max - min)) * 255).astype(int)
+        # map onto colormap
+        c = self.getZColor(z, min, max)
 
         # append to image list
         id = len(self.images)
-        self.images.append(wx.BitmapFromBuffer(w, h, self.imgcolormap[c]))
+        self.images.append(wx.BitmapFromBuffer(w, h, c))
 
         # append to data list
         id = len(self.data)
@@ -508,13 +514,15 @@ class OptPlot(wx.Panel):
 
         # get image width and height
         h, w = z.shape
-        min, max = np.amin(z), np.amax(z)
+        min, max = np.nanmin(z), np.nanmax(z)
+        if min == max:
+            min, max = min - 1, max + 1
 
-        # these are color indices
-        c = (((z.flatten() - min) / (max - min)) * 255).astype(int)
+        # map onto colormap
+        c = self.getZColor(z, min, max)
 
         # overwrite image
-        self.images[self.data[id][2]] = wx.BitmapFromBuffer(w, h, self.imgcolormap[c])
+        self.images[self.data[id][2]] = wx.BitmapFromBuffer(w, h, c)
         self.data[id] = ((np.nanmin(x), np.nanmax(x)), (np.nanmin(y), np.nanmax(y)), id)
         self.data_extent[id] = (np.nanmin(x), np.nanmax(x), np.nanmin(y), np.nanmax(y))
         self.Refresh()
@@ -622,7 +630,8 @@ class OptPlot(wx.Panel):
             print "ERROR: Wrong datatype in setColormap! Has to be string or tuple."
             return
 
-        # prepare colormap for image
+        # prepare lookup table and colormap for image
+        self.colorLUT = np.around(self.interpolateColor(np.linspace(0, 1, self.lutsize))).astype(np.uint8)
         self.imgcolormap = self.getZColor(np.arange(256), min=0, max=256)
 
         # replot
@@ -785,58 +794,49 @@ class OptPlot(wx.Panel):
         exttxt = self.ext[int(nmax + 8)]
         return "%.1f%s" % (x / np.power(1000, nmax), exttxt)
 
-    # returns an interpolated value for alpha
-    # alpha is a scalar!
+    # returns interpolated values for alpha
+    # used to generate the lookup table; use getZColor for mapping data
     def interpolateColor(self, alpha):
-        """Used internally to calculate the rgb-values for a scalar alpha (0..1) and the currently set colormap.
+        """Used internally to calculate the rgb-values for alpha (0..1) and the currently set colormap.
 
-        :param float alpha: Scalar between 0 and 1.
-        :returns: RGB-tuple.
+        :param mixed alpha: Scalar or array with values between 0 and 1.
+        :returns: RGB-tuple or array of RGB-tuples with shape alpha.shape + (3,).
         """
-        x1 = np.array(self.colormap[0])
-        colors1 = np.array(self.colormap[1], dtype=float)
-
-        if alpha <= x1[0]:
-            return colors1[0]
-        elif alpha >= x1[-1]:
-            return colors1[-1]
-        else:
-            x2 = np.roll(x1, -1, axis=0)
-            colors2 = np.roll(colors1, -1, axis=0)
-
-            A = np.where(alpha >= x1, np.where(alpha <= x2, 1, 0), 0)
-            B = ((alpha - x1) / (x2 - x1) * colors2.T + (x2 - alpha) / (x2 - x1) * colors1.T).T
-            C = (B.T * A).T
-
-            return np.sum(C, axis=0)
+        x = np.array(self.colormap[0], dtype=float)
+        colors = np.array(self.colormap[1], dtype=float)
+        return np.stack([np.interp(alpha, x, colors[:, i]) for i in range(3)], axis=-1)
 
     # get color for z value from colormap; returns r, g, b tuple
     # if min = max, use the data range stored in self.plotZMin / Max
-    def getZColor(self, z, min=-1, max=-1):
+    def getZColor(self, z, min=-1, max=-1, logscale=False):
         """Get RGB-tuples for z-values according to current colormap.
 
-        When `min == max`, the full z-extent of the data is used for mapping.
+        The z-values are mapped onto the lookup table generated by `setColormap`, so this function is fast also for large arrays.
+        When `min == max`, the full z-extent of the data is used for mapping. NaN values are shown in `nancolor`.
 
-        :param mixed z: Single z-value, 1d or 2d-array of z-values.
-        :param float min: Minimum z value that gets mapped onto 0.
-        :param float max: Maximum z value that gets mapped onto 1.
-        :returns: RGB-tuples with same shape as z.
+        :param mixed z: Single z-value or n-dimensional array of z-values.
+        :param float min: Minimum z value that gets mapped onto 0; log10 of the value when logscale is True.
+        :param float max: Maximum z value that gets mapped onto 1; log10 of the value when logscale is True.
+        :param bool logscale: If True, map log10(z) instead of z. Non-positive values are shown in `nancolor`.
+        :returns: Array of RGB-tuples with shape z.shape + (3,).
         """
         if min == max:
             min = self.plotZMin
             max = self.plotZMax
 
-        # get position in colormap
-        a = (z.astype(float) - min) / (max - min)
+        z = np.asarray(z, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if logscale:
+                z = np.where(z > 0, np.log10(z), np.nan)
 
-        if isinstance(a, float):
-            return self.interpolateColor(a).astype(np.uint8)
-        else:
-            col = np.array(map(self.interpolateColor, a.flatten())).astype(np.uint8)
-            try:
-                return col.reshape(a.shape[0], a.shape[1], 3)
-            except:
-                return col.reshape(a.shape[0], 3)
+            # get position in lookup table
+            a = np.clip((z - min) / float(max - min), 0, 1)
+        valid = np.isfinite(a)
+        index = np.where(valid, np.around(np.where(valid, a, 0) * (self.lutsize - 1)), 0).astype(int)
+
+        col = self.colorLUT[index]
+        col[~valid] = self.nancolor
+        return col
 
     # get mapping prefactors from data to dc space and vice versa
     # min/max values are already in log10 when logscale is used
@@ -1163,9 +1163,7 @@ class OptPlot(wx.Panel):
         wx.DCClipper(dc, self.dcleft, self.dctop, self.dcright - self.dcleft, self.dcbottom - self.dctop)
 
         zavg = 0.25 * (z + np.roll(z, -1, axis=0) + np.roll(z, -1, axis=1) + np.roll(np.roll(z, -1, axis=0), -1, axis=0))
-        if self.logz:
-            zavg = np.nan_to_num(np.log10(zavg))
-        cols = self.getZColor(zavg)
+        cols = self.getZColor(zavg, logscale=self.logz)
 
         for i in range(Nx - 1):
             for j in range(Ny - 1):
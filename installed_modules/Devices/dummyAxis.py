@@ -39,11 +39,14 @@ class dummyAxis(module.Axis):
         module.Axis.__init__(self)
 
         self.name = "Dummy Axis"
+        self.position = 0.0
 
         prop = []
         prop.append({"label": "Axis", "type": "label", "value": ""})
         prop.append({"label": "Position", "type": "input", "value": "0.0", "event": "onMove"})
         prop.append({"label": "Speed", "type": "choice", "value": 0, "choices": ["fast", "slow"], "event": None})
+        prop.append({"label": "t0 Offset", "type": "label", "value": "0"})
+        prop.append({"label": "Time Zero", "type": "button", "value": "Set t0", "event": "onSetOffset"})
 
         # convert dictionary to properties object
         self.parsePropertiesDict(prop)
@@ -53,18 +56,27 @@ class dummyAxis(module.Axis):
         self.getPropertyByLabel("axis").setValue("#" + str(count + 1))
 
     # return current position
-    def pos(self):
+    def devicePos(self):
         return self.position
 
     # goto new position
-    def goto(self, pos):
+    def deviceGoto(self, pos):
         self.position = pos
         print "moved to", pos
 
     # should return True if stage is still moving
-    def is_moving(self):
+    def deviceIsMoving(self):
         return False
 
+    # set the position from the position journal
+    def restorePosition(self, pos, key):
+        self.position = pos
+        self.getPropertyByLabel("position").setValue(str(self.pos()))
+
+    def onSetOffset(self, event):
+        module.Axis.onSetOffset(self, event)
+        self.getPropertyByLabel("position").setValue(str(self.pos()))
+
     def onMove(self, event):
         pos = float(self.getPropertyByLabel("position").getValue())
         self.goto(pos)
@@ -178,7 +178,7 @@ class DAQMonitor(module.Experiment):
         wx.MessageBox(txt, "DAQ Monitor", style=wx.OK)
 
     def onUpdate(self, val):
-        self.data = np.append(self.data, val)
+        self.data.append(val)
         duration=int(self.getPropertyByLabel("Average Duration").getValue())
         #check the stability once in a while
 
@@ -207,12 +207,11 @@ class DAQMonitor(module.Experiment):
         # update progress bar
         self.getPropertyByLabel("progress").setValue(next(self.progress_iterator))
 
-        # update plot
+        # update plot; only the new point is passed to the plot
         if isinstance(self.plotWnd, wx.Frame):
             if self.plotID == -1:
-                self.plotID = self.plotWnd.plotCanvas.addLine(np.arange(len(self.data)), self.data)
-            else:
-                self.plotWnd.plotCanvas.setLine(self.plotID, np.arange(len(self.data)), self.data)
+                self.plotID = self.plotWnd.plotCanvas.addSeries()
+            self.plotWnd.plotCanvas.appendPoints(self.plotID, len(self.data) - 1, val)
         else:
             # user closed the plotWindow -> stop thread
             self.onStart()
@@ -129,15 +129,17 @@ class FSRSFocus(module.Experiment):
         A, B, C = self.data
         x = np.arange(len(A))
         if isinstance(self.plotWnd, wx.Frame):
-            if self.plotInit:
-                self.plotWnd.upperPlotCanvas.setLine(0, x, A)
-                self.plotWnd.lowerPlotCanvas.setLine(0, x, B)
-                self.plotWnd.lowerPlotCanvas.setLine(1, x, C)
-            else:
-                self.plotInit = True
-                self.plotWnd.upperPlotCanvas.addLine(x, A)
-                self.plotWnd.lowerPlotCanvas.addLine(x, B)
-                self.plotWnd.lowerPlotCanvas.addLine(x, C)
+            # update all traces with a single repaint per canvas
+            with self.plotWnd.batchUpdate():
+                if self.plotInit:
+                    self.plotWnd.upperPlotCanvas.setLine(0, x, A)
+                    self.plotWnd.lowerPlotCanvas.setLine(0, x, B)
+                    self.plotWnd.lowerPlotCanvas.setLine(1, x, C)
+                else:
+                    self.plotInit = True
+                    self.plotWnd.upperPlotCanvas.addLine(x, A)
+                    self.plotWnd.lowerPlotCanvas.addLine(x, B)
+                    self.plotWnd.lowerPlotCanvas.addLine(x, C)
 
             wx.GetApp().Yield()
             self.updTimer.Start(0.2, wx.TIMER_ONE_SHOT)
@@ -37,6 +37,7 @@ import itertools
 import core.FSRSModule as module
 import core.FSRSPlot as FSRSplot
 import core.FSRSutils as cutils
+import core.FSRSCatalog as catalog
 
 
 # ##########################################################################################################################
@@ -63,6 +64,9 @@ class XCScan(module.Experiment):
         self.plotID = 0
         self.running = False
 
+        # id of the catalog entry of the last scan
+        self.catalogID = None
+
         # when creating the properties, you should create a start/stop button with the label "Start"
         prop = []
         prop.append({"label": "Camera", "type": "choice", "choices": [], "value": 0})
@@ -79,7 +83,7 @@ class XCScan(module.Experiment):
         prop.append({"label": "Start", "type": "button", "value": "Scan", "event": "onStart"})
         prop.append({"label": "Fit", "type": "button", "value": "Fit", "event": "onFit"})
         self.parsePropertiesDict(prop)
-        self.data = np.array([])
+        self.data = []
 
     def initialize(self, others=[]):
         module.Experiment.initialize(self, others)
@@ -117,7 +121,7 @@ class XCScan(module.Experiment):
         self.getPropertyByLabel("progress").setValue(0)
 
         x = self.points
-        dtmp = self.data.T
+        dtmp = np.array(self.data).T
 
         pos = []
         width = []
@@ -174,13 +178,17 @@ class XCScan(module.Experiment):
             if not os.path.isdir(filename):
                 os.chdir(directory[0])
 
-            cutils.saveXC(filename, self.points, self.data)
+            cutils.saveXC(filename, self.points, np.array(self.data))
+            catalog.catalogScanSaved(self.catalogID, filename)
 
         dlg.Destroy()
 
     def onAxisRangeChange(self, event):
         cutils.onAxisRangeChange(self, event)
 
+    def onPreviewScanPoints(self, event):
+        cutils.onPreviewScanPoints(self, event)
+
     def onStart(self, event=None):
         if self.running:
             module.Experiment.stop(self)
@@ -206,7 +214,7 @@ class XCScan(module.Experiment):
             s_shutter = self.shutters[self.getPropertyByLabel("shutter").getValue()]
             s_frames = int(self.getPropertyByLabel("frames").getValue())
 
-            self.points = cutils.prepareScanPoints(self)
+            self.points = cutils.prepareScanPoints(self, s_axis)
 
             self.s_points_iterator = itertools.cycle(self.points)
             self.progress_iterator = itertools.cycle(np.arange(len(self.points) * 1 + 1) * 100 / (len(self.points) * 1))
@@ -214,9 +222,16 @@ class XCScan(module.Experiment):
 
             self.running = True
 
+            # register scan in data catalog; the filename is added when the data are saved
+            self.catalogID = catalog.catalogScanStart(self, "", [s_ccd, s_axis, s_shutter], frames=s_frames, sets=1, points=len(self.points))
+
             module.Experiment.start(self, ScanThread, type=s_type, ccd=s_ccd, axis=s_axis, shutter=s_shutter, frames=s_frames, points=self.points, sets=1)
 
     def onFinished(self):
+        # complete catalog entry
+        status = "stopped" if self.scanThread is not None and self.scanThread.canQuit.isSet() else "finished"
+        catalog.catalogScanFinished(self.catalogID, status, {"delays": len(self.data), "pixels": len(self.data[0]) if len(self.data) > 0 else 0})
+
         # wait for thread to exit cleanly
         module.Experiment.onFinished(self)
         self.plotWnd = None
@@ -237,10 +252,8 @@ class XCScan(module.Experiment):
             if mode == 3:
                 A = 0.5 * (B + C) - self.bg
 
-            if len(self.data) == 0:
-                self.data = np.array([A])
-            else:
-                self.data = np.vstack([self.data, A])
+            # keep rows in a list to avoid copying the whole matrix for every point
+            self.data.append(A)
 
             # update progress bar
             self.getPropertyByLabel("progress").setValue(next(self.progress_iterator))
@@ -248,10 +261,10 @@ class XCScan(module.Experiment):
             # plot in window
             if isinstance(self.plotWnd, wx.Frame):
                 if self.plotInit:
-                    self.plotWnd.plotCanvas.setImage(self.plotID, np.arange(len(A)), self.points[0: len(self.data)], self.data)
+                    self.plotWnd.plotCanvas.appendImageRow(self.plotID, A, self.points[len(self.data) - 1])
                 else:
                     self.plotInit = True
-                    self.plotID = self.plotWnd.plotCanvas.addImage(np.arange(len(A)), self.points[0: len(self.data)], self.data)
+                    self.plotID = self.plotWnd.plotCanvas.addImage(np.arange(len(A)), self.points[0: len(self.data)], np.array(self.data))
             else:
                 # user closed the plotWindow -> stop thread
                 self.onStart()
@@ -303,8 +316,9 @@ class ScanThread(module.ExperimentThread):
 
             cpoint = 0
 
-            # move to first point
-            self.axis.goto(self.points[cpoint])
+            # upload the points and move to the first one
+            self.axis.load_trajectory(self.points)
+            self.axis.next_point()
 
             while(cpoint < len(self.points) and self.canQuit.isSet() == 0):
 
@@ -320,8 +334,11 @@ class ScanThread(module.ExperimentThread):
                     wx.CallAfter(self.parent.onUpdate, val)
                     cpoint += 1
 
-                # move to next point
-                self.axis.goto(self.points[cpoint % len(self.points)])
+                # move to next point; after the last point, go back to the first one for the next set
+                if cpoint < len(self.points):
+                    self.axis.next_point()
+                else:
+                    self.axis.goto(self.points[0])
 
             cset += 1
 
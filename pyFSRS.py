@@ -35,6 +35,7 @@ import os
 
 # import my pyFSRS modules
 import core.FSRSModule
+import core.FSRSJournal as FSRSJournal
 import core.ModulePanel as FSM
 
 
@@ -154,6 +155,11 @@ class pyFSRS(wx.Frame):
         for m in self.modules:
             m.initialize(self.modules)
 
+        # restore the last known positions of all axes and start recording new ones
+        for m in self.modules:
+            if m.type == "axis":
+                m.restoreFromJournal()
+
     # -------------------------------------------------------------------------------------------------------------------
     # main events
     def onQuit(self, event):
@@ -175,12 +181,18 @@ class pyFSRS(wx.Frame):
     def onExitApp(self, event):
         """This function really quits the app.
 
-        Calls the `shutdown` function of each module to ensure a proper exit.
+        Calls the `shutdown` function of each module to ensure a proper exit. A module that fails to shut down does not keep the
+        other modules from shutting down or the app from closing.
         """
-        if len(self.modules) > 0:
+        try:
             for m in self.modules:
-                m.shutdown
-        self.Destroy()
+                try:
+                    m.shutdown()
+                except Exception as e:
+                    print "WARNING: shutdown of %s failed:" % m.name, e
+        finally:
+            FSRSJournal.closeJournal()
+            self.Destroy()
 
 if __name__ == '__main__':
     app = wx.App()